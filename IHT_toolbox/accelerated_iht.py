@@ -4,13 +4,22 @@ Bayesian Coresets: Revisiting the Nonconvex Optimization Perspective (https://ar
 Jacky Y. Zhang, Rajiv Khanna, Anastasios Kyrillidis, and Oluwasanmi Koyejo. (AISTATS 2021)
 
 Both numpy version and pytorch version are offered, where the torch version can be run on GPU for acceleration.
-6 functions are included:
+12 functions are included:
 iht_obj(y, A, w):                                                   calculate the objective value
 l2_projection_numpy(w, K, L=None, already_K_sparse=False, K_sparse_supp=None)       l2 projection implemented by numpy
 l2_projection_torch(w, K, L=None, already_K_sparse=False, K_sparse_supp=None)       l2 projection implemented by torch
-a_iht_i(y, A, K, tol=1e-5, max_iter_num=300, verbose=True, L=None):         A-IHT I implemented by numpy
-a_iht_ii(y, A, K, tol=1e-5, max_iter_num=300, verbose=True, L=None):        A-IHT II implemented by numpy
+screened_gradient_numpy(A, res, K, Y_i, screen_state, screen_period=10):   gradient on columns surviving safe screening
+a_iht_i(y, A, K, tol=1e-5, max_iter_num=300, verbose=True, L=None, screening=False):     A-IHT I implemented by numpy
+a_iht_ii(y, A, K, tol=1e-5, max_iter_num=300, verbose=True, L=None, screening=False, w_init=None, callback=None):
+                                                                    A-IHT II implemented by numpy
+iht_init_numpy(y, A, K, init='zero', L=None, seed=None):            starting point for A-IHT II
+a_iht_ii_multistart(y, A, K, n_starts=4, n_workers=None, inits=None, ...):
+                                                                    A-IHT II from several starting points in parallel
 a_iht_ii_torch(y, A, K, tol=1e-5, max_iter_num=300, verbose=True, L=None):  A-IHT II implemented by torch
+streamed_gradient_select_numpy(A, res, K, Y_i, block_size=65536):  gradient blocks reduced to the selectable candidates
+a_iht_streaming(y, A, K, debias=True, block_size=65536, ...):       A-IHT I/II with sparse iterates and streamed gradient
+bc_iht(y, A, K, n_blocks=10, block_order='cyclic', tol=1e-5, max_iter_num=3000, verbose=True, L=None):
+                                                                    block-coordinate IHT implemented by numpy
 
 The optimization objective is
     argmin_w ||y - Aw||^2    s.t.    ||w||_0 <= K    and    w >= 0    (optional: and sum(w) = L)
@@ -21,6 +30,10 @@ The optimization objective is
                 L is a positive number.
 """
 
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
 import numpy as np
 import torch
 
@@ -152,7 +165,57 @@ def l2_projection_torch(w, K, L=None, already_K_sparse=False, K_sparse_supp=None
         return w_projected, K_sparse_supp
 
 
-def a_iht_i(y, A, K, tol=1e-5, max_iter_num=300, verbose=True, L=None):
+def screened_gradient_numpy(A, res, K, Y_i, screen_state, screen_period=10):
+    """
+    Gradient A^T res computed only on the columns that survive safe screening.
+    With g0 = A^T r0 from the last full-gradient checkpoint, |g_j - g0_j| <= ||A[:, j]|| ||res - r0|| for every column j.
+    A column outside Y_i whose upper bounds of |g_j| and g_j are below the K-th largest lower bounds of |g| and g over
+    the columns outside Y_i can enter neither the active subspace nor the top-K projection, and is screened.
+    A full gradient is recomputed every screen_period calls, or when more than half of the columns survive.
+    The columns are gathered from a column-major copy of A (made once, unless A is already column-major), since
+    gathering columns of a row-major A reads as much memory as the full product.
+    :param A: numpy.ndarray of shape (M, N)
+    :param res: numpy.ndarray of shape (M, 1)
+    :param K: int (sparsity constraint)
+    :param Y_i: list of integer indexes (the current support, never screened)
+    :param screen_state: dict holding the column norms and the last checkpoint; pass an empty dict at the first
+                         iteration, it is updated in place
+    :param screen_period: int (number of calls between full-gradient checkpoints)
+    :return: der: numpy.ndarray of shape (N, 1), zero on the screened columns
+             screened: numpy.ndarray of bool of shape (N,) (True on the screened columns), or None if der is exact
+    """
+    N = A.shape[1]
+    if 'cols' not in screen_state:
+        screen_state['cols'] = A.T if A.flags['F_CONTIGUOUS'] else np.ascontiguousarray(A.T)
+        screen_state['norms'] = np.sqrt(np.einsum('ij,ij->i', screen_state['cols'], screen_state['cols']))
+    cols = screen_state['cols']
+    if 'g0' not in screen_state or screen_state['age'] >= screen_period:
+        screen_state['g0'] = cols.dot(res)
+        screen_state['r0'] = res
+        screen_state['age'] = 0
+        return screen_state['g0'].copy(), None
+    screen_state['age'] += 1
+    g0 = screen_state['g0'][:, 0]
+    nb = screen_state['norms'] * np.linalg.norm(res - screen_state['r0'])
+    cand = np.ones(N, dtype=bool)
+    cand[Y_i] = False
+    screened = np.zeros(N, dtype=bool)
+    if cand.sum() > K:
+        lo_abs = (np.absolute(g0) - nb)[cand]
+        lo = (g0 - nb)[cand]
+        tau_abs = np.partition(lo_abs, lo_abs.shape[0] - K)[lo_abs.shape[0] - K]
+        tau = np.partition(lo, lo.shape[0] - K)[lo.shape[0] - K]
+        screened = cand & (np.absolute(g0) + nb < tau_abs) & (g0 + nb < tau)
+    surv = np.nonzero(~screened)[0]
+    if surv.shape[0] > N / 2:
+        screen_state['age'] = screen_period
+        return screened_gradient_numpy(A, res, K, Y_i, screen_state, screen_period)
+    der = np.zeros([N, 1])
+    der[surv] = cols[surv].dot(res)
+    return der, screened
+
+
+def a_iht_i(y, A, K, tol=1e-5, max_iter_num=300, verbose=True, L=None, screening=False, screen_period=10):
     """
     A-IHT I implemented by numpy
     :param y: numpy.ndarray of shape (M, 1)
@@ -161,6 +224,9 @@ def a_iht_i(y, A, K, tol=1e-5, max_iter_num=300, verbose=True, L=None):
     :param tol: float (tolerance of the ending criterion)
     :param max_iter_num: int (maximum iteration number)
     :param verbose: boolean (controls intermediate text output)
+    :param screening: boolean (if True, the gradient is only computed on the columns surviving safe screening,
+                      see screened_gradient_numpy)
+    :param screen_period: int (iterations between full-gradient re-checks when screening)
     :return: w: numpy.ndarray of shape (N, 1)
              supp: list of integer indexes (the support of the w)
     """
@@ -179,6 +245,7 @@ def a_iht_i(y, A, K, tol=1e-5, max_iter_num=300, verbose=True, L=None):
 
     A_w_cur = np.zeros([M, 1])
     Y_i = []
+    screen_state = {}
 
     # auxiliary variables
     complementary_Yi = np.ones([N, 1])
@@ -188,9 +255,12 @@ def a_iht_i(y, A, K, tol=1e-5, max_iter_num=300, verbose=True, L=None):
         w_prev = w_cur
         if i == 1:
             res = y
-            der = A_t.dot(res)  # compute gradient
         else:
             res = y - A_w_cur - tau * A_diff
+        screened = None
+        if screening:
+            der, screened = screened_gradient_numpy(A, res, K, Y_i, screen_state, screen_period)
+        else:
             der = A_t.dot(res)  # compute gradient
         A_w_prev = A_w_cur
         complementary_Yi[Y_i] = 0
@@ -201,6 +271,8 @@ def a_iht_i(y, A, K, tol=1e-5, max_iter_num=300, verbose=True, L=None):
         Pder = A[:, S_i].dot(ider)
         mu_bar = ider.T.dot(ider) / Pder.T.dot(Pder) / 2  # step size selection
         b = y_cur + mu_bar * der  # gradient descent
+        if screened is not None:
+            b[screened] = -np.inf  # screened columns cannot enter the support
         w_cur, X_i = l2_projection_numpy(b, K, L=L)
 
         A_w_cur = A[:, X_i].dot(w_cur[X_i])
@@ -237,7 +309,8 @@ def a_iht_i(y, A, K, tol=1e-5, max_iter_num=300, verbose=True, L=None):
     return w, supp
 
 
-def a_iht_ii(y, A, K, tol=1e-5, max_iter_num=300, verbose=True, L=None):
+def a_iht_ii(y, A, K, tol=1e-5, max_iter_num=300, verbose=True, L=None, screening=False, screen_period=10,
+             w_init=None, callback=None):
     """
     A-IHT II implemented by numpy
     :param y: numpy.ndarray of shape (M, 1)
@@ -246,6 +319,13 @@ def a_iht_ii(y, A, K, tol=1e-5, max_iter_num=300, verbose=True, L=None):
     :param tol: float (tolerance of the ending criterion)
     :param max_iter_num: int (maximum iteration number)
     :param verbose: boolean (controls intermediate text output)
+    :param screening: boolean (if True, the gradient is only computed on the columns surviving safe screening,
+                      see screened_gradient_numpy)
+    :param screen_period: int (iterations between full-gradient re-checks when screening)
+    :param w_init: numpy.ndarray of shape (N, 1) (optional starting point, projected onto the constraints;
+                   zero by default, see iht_init_numpy)
+    :param callback: callable (optional; called as callback(i, objective value) after every iteration, the
+                     iterations stop if it returns True)
     :return: w: numpy.ndarray of shape (N, 1)
              supp: list of integer indexes (the support of the w)
     """
@@ -255,14 +335,19 @@ def a_iht_ii(y, A, K, tol=1e-5, max_iter_num=300, verbose=True, L=None):
     # Initialize transpose of measurement matrix
     A_t = A.T
 
-    # Initialize to zero vector
-    w_cur = np.zeros([N, 1])
-    y_cur = np.zeros([N, 1])
-    # w_cur = np.random.random([N, 1])
-    # y_cur = np.random.random([N, 1])
+    # Initialize to zero vector, or to the projection of w_init
+    if w_init is None:
+        w_cur = np.zeros([N, 1])
+        Y_i = []
+    else:
+        w_cur, _ = l2_projection_numpy(w_init, K, L=L)
+        Y_i = np.nonzero(w_cur)[0].tolist()
+    y_cur = w_cur.copy()
 
-    A_w_cur = np.zeros([M, 1])
-    Y_i = []
+    A_w_cur = A[:, Y_i].dot(w_cur[Y_i])
+    A_diff = np.zeros([M, 1])
+    tau = 0.
+    screen_state = {}
 
     # auxiliary variables
     complementary_Yi = np.ones([N, 1])
@@ -270,11 +355,11 @@ def a_iht_ii(y, A, K, tol=1e-5, max_iter_num=300, verbose=True, L=None):
 
     while i <= max_iter_num:
         w_prev = w_cur
-        if i == 1:
-            res = y
-            der = A_t.dot(res)  # compute gradient
+        res = y - A_w_cur - tau * A_diff
+        screened = None
+        if screening:
+            der, screened = screened_gradient_numpy(A, res, K, Y_i, screen_state, screen_period)
         else:
-            res = y - A_w_cur - tau * A_diff
             der = A_t.dot(res)  # compute gradient
 
         A_w_prev = A_w_cur
@@ -286,12 +371,13 @@ def a_iht_ii(y, A, K, tol=1e-5, max_iter_num=300, verbose=True, L=None):
         Pder = A[:, S_i].dot(ider)
         mu_bar = ider.T.dot(ider) / Pder.T.dot(Pder) / 2  # step size selection
         b = y_cur + mu_bar * der  # gradient descent
+        if screened is not None:
+            b[screened] = -np.inf  # screened columns cannot enter the support
         w_cur, X_i = l2_projection_numpy(b, K, L=L)
 
         A_w_cur = A[:, X_i].dot(w_cur[X_i])
         res = y - A_w_cur
-        der = A_t.dot(res)  # compute gradient
-        ider = der[X_i]
+        ider = A[:, X_i].T.dot(res)  # compute gradient on the support
         Pder = A[:, X_i].dot(ider)
         mu_bar = ider.T.dot(ider) / Pder.T.dot(Pder) / 2  # step size selection
         w_cur[X_i] = w_cur[X_i] + mu_bar * ider  # debias
@@ -300,10 +386,7 @@ def a_iht_ii(y, A, K, tol=1e-5, max_iter_num=300, verbose=True, L=None):
         A_w_cur = A[:, X_i].dot(w_cur[X_i])
         res = y - A_w_cur
 
-        if i == 1:
-            A_diff = A_w_cur
-        else:
-            A_diff = A_w_cur - A_w_prev
+        A_diff = A_w_cur - A_w_prev
 
         temp = A_diff.T.dot(A_diff)
         if temp > 0:
@@ -321,6 +404,388 @@ def a_iht_ii(y, A, K, tol=1e-5, max_iter_num=300, verbose=True, L=None):
         # stop criterion
         if (i > 1) and (np.linalg.norm(w_cur - w_prev) < tol * np.linalg.norm(w_cur)):
             break
+        if callback is not None and callback(i, np.linalg.norm(res)):
+            break
+        i = i + 1
+
+    # finished
+    w = w_cur
+    supp = np.nonzero(w_cur)[0].tolist()  # support of the output solution
+    print('Stopped at iteration {}. {} items are selected. The objective value is: {}'.format(i, len(supp),
+                                                                                              iht_obj(y, A, w_cur)))
+    return w, supp
+
+
+def iht_init_numpy(y, A, K, init='zero', L=None, seed=None):
+    """
+    Starting point for A-IHT II (see a_iht_ii and a_iht_ii_multistart)
+    'zero': the zero vector;
+    'random': K random columns with random weights;
+    'greedy': the K columns most correlated with y (by A^T y / ||A_j||), weighted by A_j^T y / ||A_j||^2.
+    The random and greedy points are rescaled to the best fit of y along their direction.
+    :param y: numpy.ndarray of shape (M, 1)
+    :param A: numpy.ndarray of shape (M, N)
+    :param K: int (sparsity constraint)
+    :param init: 'zero', 'random' or 'greedy'
+    :param L: float, positive (optional constraint sum(w) = L)
+    :param seed: int (seed of the random starting point)
+    :return: w: numpy.ndarray of shape (N, 1)
+    """
+    (M, N) = A.shape
+    w = np.zeros([N, 1])
+    if init == 'zero':
+        return w
+    elif init == 'random':
+        rng = np.random.RandomState(seed)
+        supp = rng.permutation(N)[:K]
+        w[supp] = rng.rand(K, 1)
+    elif init == 'greedy':
+        norms = np.sqrt((A ** 2).sum(axis=0))[:, np.newaxis]
+        norms[norms == 0] = 1.
+        corr = A.T.dot(y) / norms
+        supp = np.argpartition(-corr[:, 0], K - 1)[:K] if N > K else np.arange(N)
+        supp = supp[corr[supp, 0] > 0]
+        w[supp] = corr[supp] / norms[supp]
+    else:
+        raise ValueError('init should be \'zero\', \'random\' or \'greedy\'')
+    A_w = A[:, supp].dot(w[supp])
+    temp = A_w.T.dot(A_w)
+    if temp > 0:
+        w = w * max(A_w.T.dot(y).item() / temp.item(), 0.)  # best fit along w
+    w, _ = l2_projection_numpy(w, K, L=L)
+    return w
+
+
+_multistart_A = None
+_multistart_best = None
+
+
+def _multistart_worker_init(shm_name, shape, dtype, best):
+    # attach the shared measurement matrix once per worker process
+    global _multistart_A, _multistart_best, _multistart_shm
+    _multistart_shm = shared_memory.SharedMemory(name=shm_name)
+    _multistart_A = np.ndarray(shape, dtype=dtype, buffer=_multistart_shm.buf)
+    _multistart_best = best
+
+
+def _multistart_worker(y, K, init, seed, tol, max_iter_num, L, cancel_margin):
+    A = _multistart_A
+    best = _multistart_best
+    cancelled = [False]
+    obj_prev = [np.inf]
+
+    def callback(i, obj):
+        # stop a start that is far above the best finished one and, at its progress over the last 10 iterations,
+        # would not reach it within the remaining iterations
+        if i % 10 == 0:
+            if obj > (1. + cancel_margin) * best.value and \
+                    obj - (obj_prev[0] - obj) * (max_iter_num - i) / 10. > best.value:
+                cancelled[0] = True
+            obj_prev[0] = obj
+        return cancelled[0]
+
+    w_init = None if init == 'zero' else iht_init_numpy(y, A, K, init=init, L=L, seed=seed)
+    w, supp = a_iht_ii(y, A, K, tol=tol, max_iter_num=max_iter_num, verbose=False, L=L, w_init=w_init,
+                       callback=callback)
+    obj = iht_obj(y, A, w)
+    if not cancelled[0]:
+        with best.get_lock():
+            best.value = min(best.value, obj)
+    return w, obj, cancelled[0]
+
+
+def a_iht_ii_multistart(y, A, K, n_starts=4, n_workers=None, inits=None, cancel_margin=0.5, seed=None, tol=1e-5,
+                        max_iter_num=300, verbose=True, L=None):
+    """
+    A-IHT II from several starting points, run in parallel processes; returns the solution with the lowest objective
+    The objective is nonconvex, so the solution depends on the starting point. A is copied once into shared memory
+    and read in place by the worker processes. The best objective of the finished starts is shared, and a start whose
+    objective is more than (1 + cancel_margin) times that, and would not reach it at its recent rate of progress, is
+    stopped early.
+    :param y: numpy.ndarray of shape (M, 1)
+    :param A: numpy.ndarray of shape (M, N)
+    :param K: int (sparsity constraint)
+    :param n_starts: int (number of starting points)
+    :param n_workers: int (number of worker processes, default: number of CPUs)
+    :param inits: list of 'zero', 'random' or 'greedy' of length n_starts (see iht_init_numpy), default: one zero,
+                  one greedy and random for the rest
+    :param cancel_margin: float (relative objective gap above which a running start may be stopped; None: never)
+    :param seed: int (seed of the random starting points)
+    :param tol: float (tolerance of the ending criterion)
+    :param max_iter_num: int (maximum iteration number)
+    :param verbose: boolean (controls intermediate text output)
+    :param L: float, positive (optional constraint sum(w) = L)
+    :return: w: numpy.ndarray of shape (N, 1)
+             supp: list of integer indexes (the support of the w)
+    """
+    if len(y.shape) != 2:
+        raise ValueError('y should have shape (M, 1)')
+    if inits is None:
+        inits = (['zero', 'greedy'] + ['random'] * n_starts)[:n_starts]
+    if len(inits) != n_starts:
+        raise ValueError('inits should have length n_starts')
+    seeds = np.random.RandomState(seed).randint(2 ** 31 - 1, size=n_starts)
+    cancel_margin = np.inf if cancel_margin is None else cancel_margin
+
+    ctx = multiprocessing.get_context()
+    best = ctx.Value('d', np.inf)
+    shm = shared_memory.SharedMemory(create=True, size=max(A.nbytes, 1))
+    try:
+        A_shared = np.ndarray(A.shape, dtype=A.dtype, buffer=shm.buf)
+        A_shared[:] = A
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=ctx, initializer=_multistart_worker_init,
+                                 initargs=(shm.name, A.shape, A.dtype, best)) as pool:
+            futures = [pool.submit(_multistart_worker, y, K, inits[j], seeds[j], tol, max_iter_num, L, cancel_margin)
+                       for j in range(n_starts)]
+            results = [f.result() for f in futures]
+        del A_shared
+    finally:
+        shm.close()
+        shm.unlink()
+
+    j_best = int(np.argmin([obj for (_, obj, _) in results]))
+    if verbose:
+        for j, (_, obj, cancelled) in enumerate(results):
+            print('start {} ({}): objective value {}{}'.format(j, inits[j], obj, ' (stopped early)' if cancelled else ''))
+    w = results[j_best][0]
+    supp = np.nonzero(w)[0].tolist()  # support of the output solution
+    print('Best of {} starts: {} ({}). {} items are selected. The objective value is: {}'.format(
+        n_starts, j_best, inits[j_best], len(supp), results[j_best][1]))
+    return w, supp
+
+
+def _merge_top_numpy(idx, val, g, excl, offset, K, absolute):
+    # merge the entries of the block g (block indices + offset) with the K largest g (|g|), outside of the block indices
+    # excl, into the running top K given by the index and value arrays idx, val
+    key = np.absolute(g) if absolute else g.copy()
+    key[excl] = -np.inf
+    blk = np.argpartition(key, key.shape[0] - K)[key.shape[0] - K:] if key.shape[0] > K else np.arange(key.shape[0])
+    blk = blk[key[blk] > -np.inf]
+    idx = np.concatenate((idx, blk + offset))
+    val = np.concatenate((val, g[blk]))
+    if idx.shape[0] > K:
+        keep = np.argpartition(np.absolute(val) if absolute else val, idx.shape[0] - K)[idx.shape[0] - K:]
+        idx = idx[keep]
+        val = val[keep]
+    return idx, val
+
+
+def streamed_gradient_select_numpy(A, res, K, Y_i, block_size=65536):
+    """
+    Fused gradient and selection: the gradient A^T res is computed block_size columns at a time and only what the
+    A-IHT support steps can use is kept, so that the working memory is O(K + block_size) instead of O(N).
+    :param A: numpy.ndarray of shape (M, N)
+    :param res: numpy.ndarray of shape (M, 1)
+    :param K: int (sparsity constraint)
+    :param Y_i: numpy.ndarray of sorted integer indexes (the support)
+    :param block_size: int (number of columns per block)
+    :return: g_Y: numpy.ndarray, the gradient on Y_i
+             a_idx, a_val: indexes and gradient values of the K largest |gradient| entries outside of Y_i
+             p_idx, p_val: indexes and gradient values of the K largest gradient entries outside of Y_i
+    """
+    N = A.shape[1]
+    g_Y = np.zeros(Y_i.shape[0])
+    a_idx = p_idx = np.zeros(0, dtype=np.int64)
+    a_val = p_val = np.zeros(0)
+    for s in range(0, N, block_size):
+        e = min(N, s + block_size)
+        g = np.matmul(A[:, s:e].T, res)[:, 0]  # matmul passes the strided view to BLAS without a copy
+        lo, hi = np.searchsorted(Y_i, [s, e])
+        in_Y = Y_i[lo:hi] - s
+        g_Y[lo:hi] = g[in_Y]
+        a_idx, a_val = _merge_top_numpy(a_idx, a_val, g, in_Y, s, K, absolute=True)
+        p_idx, p_val = _merge_top_numpy(p_idx, p_val, g, in_Y, s, K, absolute=False)
+    return g_Y, a_idx, a_val, p_idx, p_val
+
+
+def a_iht_streaming(y, A, K, debias=True, block_size=65536, tol=1e-5, max_iter_num=300, verbose=True, L=None):
+    """
+    A-IHT II (debias=True) or A-IHT I (debias=False) implemented by numpy, without any vector of length N during the
+    iterations: the gradient is streamed by streamed_gradient_select_numpy and the iterates are kept sparse (sorted
+    index and value arrays). Off the support Y_i of the extrapolated point b = mu * gradient, so the active subspace
+    is Y_i and the top-K |gradient| outside of it, and the top-K of b lies in Y_i and the top-K |gradient| and
+    gradient entries, to which the projection is restricted.
+    :param y: numpy.ndarray of shape (M, 1)
+    :param A: numpy.ndarray of shape (M, N)
+    :param K: int (sparsity constraint)
+    :param debias: boolean (A-IHT II if True, A-IHT I if False)
+    :param block_size: int (number of columns per gradient block)
+    :param tol: float (tolerance of the ending criterion)
+    :param max_iter_num: int (maximum iteration number)
+    :param verbose: boolean (controls intermediate text output)
+    :param L: float, positive (optional constraint sum(w) = L)
+    :return: w: numpy.ndarray of shape (N, 1)
+             supp: list of integer indexes (the support of the w)
+    """
+    (M, N) = A.shape
+    if len(y.shape) != 2:
+        raise ValueError('y should have shape (M, 1)')
+
+    # Initialize to zero vector; sparse iterates w_cur and y_cur
+    w_idx = np.zeros(0, dtype=np.int64)
+    w_val = np.zeros(0)
+    y_idx, y_val = w_idx, w_val
+    A_w_cur = np.zeros([M, 1])
+    A_diff = np.zeros([M, 1])
+    tau = 0.
+    i = 1
+
+    while i <= max_iter_num:
+        w_idx_prev, w_val_prev = w_idx, w_val
+        res = y - A_w_cur - tau * A_diff
+        g_Y, a_idx, a_val, p_idx, p_val = streamed_gradient_select_numpy(A, res, K, y_idx, block_size)
+        A_w_prev = A_w_cur
+        S_i = np.concatenate((y_idx, a_idx))  # identify active subspace
+        ider = np.concatenate((g_Y, a_val))[:, np.newaxis]
+        Pder = A[:, S_i].dot(ider)
+        mu_bar = (ider.T.dot(ider) / Pder.T.dot(Pder) / 2).item()  # step size selection
+        U, first = np.unique(np.concatenate((y_idx, a_idx, p_idx)), return_index=True)
+        b = mu_bar * np.concatenate((g_Y, a_val, p_val))[first]  # gradient descent on the candidates
+        b[np.searchsorted(U, y_idx)] += y_val
+        b, X_i = l2_projection_numpy(b[:, np.newaxis], K, L=L)
+        X_i = np.sort(np.asarray(X_i, dtype=np.int64))
+        w_idx = U[X_i]
+        w_val = b[X_i, 0]
+        if debias:
+            res = y - A[:, w_idx].dot(w_val[:, np.newaxis])
+            ider = A[:, w_idx].T.dot(res)  # compute gradient on the support
+            Pder = A[:, w_idx].dot(ider)
+            mu_bar = ider.T.dot(ider) / Pder.T.dot(Pder) / 2  # step size selection
+            w_val, _ = l2_projection_numpy(w_val[:, np.newaxis] + mu_bar * ider, K, L=L)  # debias
+            w_val = w_val[:, 0]
+        w_idx = w_idx[w_val > 0]
+        w_val = w_val[w_val > 0]
+
+        A_w_cur = A[:, w_idx].dot(w_val[:, np.newaxis])
+        res = y - A_w_cur
+        A_diff = A_w_cur - A_w_prev
+
+        temp = A_diff.T.dot(A_diff)
+        if temp > 0:
+            tau = (res.T.dot(A_diff) / temp).item()
+        else:
+            tau = (res.T.dot(A_diff) / 1e-6).item()
+
+        # y_cur = w_cur + tau * (w_cur - w_prev), on the union of the two supports
+        V = np.union1d(w_idx, w_idx_prev)
+        wc = np.zeros(V.shape[0])
+        wc[np.searchsorted(V, w_idx)] = w_val
+        wp = np.zeros(V.shape[0])
+        wp[np.searchsorted(V, w_idx_prev)] = w_val_prev
+        yc = wc + tau * (wc - wp)
+        y_idx = V[yc != 0]
+        y_val = yc[yc != 0]
+
+        # print out objective function value during optimization of IHT
+        if verbose and i % 50 == 1:
+            print('at iteration {}, the objective value is: {}'.format(i, np.linalg.norm(res)))
+
+        # stop criterion
+        if (i > 1) and (np.linalg.norm(wc - wp) < tol * np.linalg.norm(wc)):
+            break
+        i = i + 1
+
+    # finished
+    w = np.zeros([N, 1])
+    w[w_idx, 0] = w_val
+    supp = w_idx.tolist()  # support of the output solution
+    print('Stopped at iteration {}. {} items are selected. The objective value is: {}'.format(i, len(supp),
+                                                                                              iht_obj(y, A, w)))
+    return w, supp
+
+
+def bc_iht(y, A, K, n_blocks=10, block_order='cyclic', tol=1e-5, max_iter_num=3000, verbose=True, L=None):
+    """
+    Block-coordinate IHT implemented by numpy
+    A-IHT I in which the gradient A^T (y - Ay) is kept in memory. After one full gradient at the start, each iteration
+    refreshes it only on one block of columns and on the support of the current iterate, so an iteration costs
+    O(M (N / n_blocks + K)) instead of O(M N); the top-K projection still sees the whole gradient memory. Only the
+    support and the top-K entries of the gradient memory outside of it can enter the projection, so it is done on
+    those 2K candidates. Columns are read from a column-major copy of A (made once, unless A is already column-major),
+    and blocks are contiguous so that refreshing one does not copy columns.
+    :param y: numpy.ndarray of shape (M, 1)
+    :param A: numpy.ndarray of shape (M, N)
+    :param K: int (sparsity constraint)
+    :param n_blocks: int (number of column blocks; one epoch refreshes every block once)
+    :param block_order: 'cyclic' or 'random' (order in which the blocks are refreshed)
+    :param tol: float (tolerance of the ending criterion, checked once per epoch)
+    :param max_iter_num: int (maximum iteration number)
+    :param verbose: boolean (controls intermediate text output)
+    :param L: float, positive (optional constraint sum(w) = L)
+    :return: w: numpy.ndarray of shape (N, 1)
+             supp: list of integer indexes (the support of the w)
+    """
+    (M, N) = A.shape
+    if len(y.shape) != 2:
+        raise ValueError('y should have shape (M, 1)')
+    if block_order not in ('cyclic', 'random'):
+        raise ValueError('block_order should be \'cyclic\' or \'random\'')
+    A_cols = A.T if A.flags['F_CONTIGUOUS'] else np.ascontiguousarray(A.T)
+    bounds = np.linspace(0, N, n_blocks + 1).astype(int)  # contiguous blocks, refreshed through views of A_cols
+
+    # Initialization
+    w_cur = np.zeros([N, 1])
+    y_cur = np.zeros([N, 1])
+    w_epoch = w_cur
+    A_w_cur = np.zeros([M, 1])
+    Y_i = []
+    der = A_cols.dot(y)  # gradient memory, full at the start
+    i = 1
+
+    while i <= max_iter_num:
+        w_prev = w_cur
+        if i > 1:
+            res = y - A_w_cur - tau * A_diff
+            if block_order == 'cyclic':
+                j = (i - 2) % n_blocks
+            else:
+                j = np.random.randint(n_blocks)
+            der[bounds[j]:bounds[j + 1]] = A_cols[bounds[j]:bounds[j + 1]].dot(res)  # refresh the block
+            der[Y_i] = A_cols[Y_i].dot(res)  # and the support
+        A_w_prev = A_w_cur
+
+        # off the support b = mu * der, so the top-K of b lies in Y_i and the top-K of der outside of it
+        score = der[:, 0].copy()
+        score[Y_i] = -np.inf
+        top = np.argpartition(score, N - K)[N - K:] if N > K else np.arange(N)
+        if L is None:
+            top = top[score[top] > 0]  # these would be projected to zero anyway
+        S_i = Y_i + top.tolist()  # identify active subspace
+        ider = der[S_i]
+        Pder = A_cols[S_i].T.dot(ider)
+        mu_bar = ider.T.dot(ider) / Pder.T.dot(Pder) / 2  # step size selection
+        b = y_cur[S_i] + mu_bar * ider  # gradient descent on the active subspace
+        b, X_i = l2_projection_numpy(b, K, L=L)
+        w_cur = np.zeros([N, 1])
+        w_cur[S_i] = b
+        X_i = [S_i[j] for j in X_i]
+
+        A_w_cur = A_cols[X_i].T.dot(w_cur[X_i])
+        res = y - A_w_cur
+
+        if i == 1:
+            A_diff = A_w_cur
+        else:
+            A_diff = A_w_cur - A_w_prev
+
+        temp = A_diff.T.dot(A_diff)
+        if temp > 0:
+            tau = res.T.dot(A_diff) / temp
+        else:
+            tau = res.T.dot(A_diff) / 1e-6
+
+        y_cur = w_cur + tau * (w_cur - w_prev)
+        Y_i = np.nonzero(y_cur)[0].tolist()
+
+        # print out objective function value during optimization of IHT
+        if verbose and i % (50 * n_blocks) == 1:
+            print('at iteration {}, the objective value is: {}'.format(i, np.linalg.norm(res)))
+
+        # stop criterion, once per epoch
+        if i % n_blocks == 0:
+            if np.linalg.norm(w_cur - w_epoch) < tol * np.linalg.norm(w_cur):
+                break
+            w_epoch = w_cur
         i = i + 1
 
     # finished
@@ -0,0 +1,47 @@
+import numpy as np
+
+from accelerated_iht import a_iht_ii, bc_iht, iht_obj
+
+
+def sparse_problem(M, N, K, seed):
+    # y = A w for a nonnegative K-sparse w, as in toolbox_examples.py
+    rng = np.random.RandomState(seed)
+    A = rng.rand(M, N) + 0.5
+    w = np.zeros([N, 1])
+    w[rng.permutation(N)[:K]] = rng.rand(K, 1)
+    return A.dot(w), A, w
+
+
+####################################################
+# verifies that
+# -block-coordinate IHT returns a nonnegative K-sparse w, with sum(w) = L if L is set
+# -its objective is close to that of A-IHT II, for both block orders
+####################################################
+def test_bc_iht():
+    M, N, K = 60, 200, 15
+    for seed in range(3):
+        y, A, w_true = sparse_problem(M, N, K, seed)
+        ynorm = np.linalg.norm(y)
+        for L in [None, w_true.sum()]:
+            w_ref, _ = a_iht_ii(y, A, K, verbose=False, L=L)
+            obj_ref = iht_obj(y, A, w_ref)
+            for block_order in ['cyclic', 'random']:
+                np.random.seed(seed)
+                w, supp = bc_iht(y, A, K, n_blocks=5, block_order=block_order, verbose=False, L=L)
+                assert w.shape == (N, 1), "bc_iht failed: wrong shape"
+                assert np.all(w >= 0), "bc_iht failed: negative weights"
+                assert len(supp) <= K and np.count_nonzero(w) == len(supp), "bc_iht failed: not K-sparse"
+                assert L is None or np.fabs(w.sum() - L) < 1e-8 * L, "bc_iht failed: sum(w) != L"
+                assert iht_obj(y, A, w) <= obj_ref + 0.05 * ynorm, \
+                    "bc_iht failed: objective much worse than A-IHT II with block_order = " + block_order
+
+
+def test_bc_iht_arguments():
+    y, A, _ = sparse_problem(20, 50, 5, 0)
+    for bad in [lambda: bc_iht(y[:, 0], A, 5, verbose=False),
+                lambda: bc_iht(y, A, 5, block_order='shuffled', verbose=False)]:
+        try:
+            bad()
+            assert False, "bc_iht failed: did not catch invalid arguments"
+        except ValueError:
+            pass
@@ -39,6 +39,12 @@ print('using A-IHT II by numpy...')
 w, supp = a_iht_ii(y, A, K, L=L)
 print('A-IHT II (numpy) finds solution with objective value {}; sum(w) is {}\n'.format(iht_obj(y, A, w), w.sum()))
 
+# block-coordinate IHT by numpy
+print('using block-coordinate IHT by numpy...')
+w, supp = bc_iht(y, A, K, n_blocks=10, L=L)
+print('block-coordinate IHT (numpy) finds solution with objective value {}; sum(w) is {}\n'.format(iht_obj(y, A, w),
+                                                                                                     w.sum()))
+
 # A-IHT II by torch
 A = torch.tensor(A)
 y = torch.tensor(y)
@@ -1 +1,2 @@
-from .coreset import HilbertCoreset, SparseVICoreset, UniformSamplingCoreset, BayesianTangentSpaceFactory, IHTCoreset
+from .coreset import HilbertCoreset, SparseVICoreset, UniformSamplingCoreset, BayesianTangentSpaceFactory, IHTCoreset, \
+    GaussianSampler, TangentStream, build_adaptive, clear_shared_tangent_spaces
@@ -1,5 +1,6 @@
+from .adaptive import build_adaptive
 from .hilbert import HilbertCoreset
 from .iht_coreset import IHTCoreset
 from .sampling import UniformSamplingCoreset
 from .sparsevi import SparseVICoreset
-from .tangent import BayesianTangentSpaceFactory
+from .tangent import BayesianTangentSpaceFactory, GaussianSampler, TangentStream, clear_shared_tangent_spaces
@@ -0,0 +1,27 @@
+import numpy as np
+
+
+def build_adaptive(coreset, tangent_space_factory, sz, batch_dim=50, max_dim=1000, rtol=0.05, seed=None,
+                   warm_start=True):
+    """
+    Build coreset (an IHTCoreset or HilbertCoreset) of size sz with the smallest projection dimension that works,
+    instead of a fixed proj_dim: the tangent space grows by batch_dim samples at a time (see
+    BayesianTangentSpaceFactory.progressive), and after each batch the coreset is moved to the new space and
+    re-solved (update_tangent_space, build, optimize), warm from its current weights if warm_start. Stops once the
+    support is unchanged and the relative error ||sum - Phi w|| / ||sum|| of the projection changed by at most rtol
+    relative, or at max_dim samples.
+    :return: list of (projection dimension, relative error, support size), one per batch
+    """
+    trace = []
+    prev_supp = None
+    for vecs in tangent_space_factory.progressive(batch_dim, max_dim, seed=seed):
+        coreset.update_tangent_space(lambda v=vecs: v, warm_start=warm_start)
+        coreset.build(max(0, sz - coreset.size()), sz)
+        coreset.optimize()
+        supp = set(coreset.weights()[1])
+        rel_err = coreset.error() / np.sqrt((vecs.sum(axis=0) ** 2).sum())
+        trace.append((vecs.shape[1], rel_err, len(supp)))
+        if prev_supp is not None and supp == prev_supp and abs(rel_err - trace[-2][1]) <= rtol * trace[-2][1]:
+            break
+        prev_supp = supp
+    return trace
@@ -1,17 +1,63 @@
 import numpy as np
 
 from .coreset import Coreset
+from .tangent import TangentStream
 from ..snnls.giga import GIGA
+from ..snnls.snnls import StreamingSparseNNLS
 
 
 class HilbertCoreset(Coreset):
     def __init__(self, tangent_space_factory, snnls=GIGA, **kw):
-        vecs = tangent_space_factory()
-        self.snnls = snnls(vecs.T, vecs.sum(axis=0))
+        # the tangent space and the snnls solver are set up on first use (see __getattr__); a TangentStream is
+        # passed to the solver as is, which must then read it (a StreamingSparseNNLS such as StreamingGIGA)
+        if isinstance(tangent_space_factory, TangentStream) and not issubclass(snnls, StreamingSparseNNLS):
+            raise ValueError('.__init__(): a TangentStream requires a streaming snnls solver, e.g. StreamingGIGA')
+        self._tsf = tangent_space_factory
+        self._snnls_alg = snnls
         super().__init__(**kw)
 
+    def __getattr__(self, name):
+        # only called for attributes that are not set: the first use of the solver evaluates the tangent space
+        if name == 'snnls' and '_tsf' in self.__dict__:
+            # the factory is dropped only once the solver is set up, so if it raises, the next use tries again
+            self.snnls = self._make_snnls(self._tsf)
+            del self._tsf
+            return self.snnls
+        raise AttributeError(name)
+
+    def _make_snnls(self, tsf):
+        if isinstance(tsf, TangentStream):
+            return self._snnls_alg(tsf)
+        vecs = tsf()
+        return self._snnls_alg(vecs.T, vecs.sum(axis=0))
+
+    def update_tangent_space(self, tangent_space_factory, warm_start=True):
+        """
+        Swap in a new tangent space for the same N data points (e.g. with more projection samples, see
+        build_adaptive). The solver is set up on the new vectors; if warm_start, it starts from the current weights,
+        so a following build only adds points up to the requested size and optimize refits the weights in the new
+        space, otherwise the coreset is reset.
+        """
+        if '_tsf' in self.__dict__:
+            self._tsf = tangent_space_factory
+            return
+        wts, idcs = self.weights()
+        snnls = self._make_snnls(tangent_space_factory)
+        if snnls.w.shape[0] != self.snnls.w.shape[0]:
+            raise ValueError('.update_tangent_space(): the tangent space must have one vector per data point')
+        self.snnls = snnls
+        self.reached_numeric_limit = False  # a limit of the old solver
+        if warm_start:
+            w = np.zeros(snnls.w.shape[0])
+            w[idcs] = wts
+            self.snnls.w = w
+        else:
+            super().reset()
+
     def reset(self):
-        self.snnls.reset()
+        # only a solver that is set up has state to reset; before, it is made fresh on first use
+        if '_tsf' not in self.__dict__:
+            self.snnls.reset()
         super().reset()
 
     def _build(self, itrs, sz):
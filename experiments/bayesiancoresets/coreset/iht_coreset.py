@@ -1,6 +1,18 @@
+import multiprocessing
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
 import numpy as np
+from scipy.linalg import cholesky, solve_triangular, LinAlgError
+from scipy.optimize import nnls
 
 from .coreset import Coreset
+from .tangent import TangentStream
+from ..snnls.giga import GIGA
+from ..util.quantize import quantize_rows, dot_quantized
+from ..util.topk import top_k
 
 """
 This file contains the two approaches, i.e., Automated Accelerated IHT and Automated Accelerated IHT II, 
@@ -10,21 +22,64 @@ The two approaches are presented in IHTCoreset._iht() and IHTCoreset._iht_ii(),
 
 
 class FiniteTangentSpace:
-    def __init__(self, tangent_space_factory, d):
+    """
+    Finite-dimensional tangent space. The tangent vectors are stored as a C-contiguous (N, M) array, i.e., the
+    measurement matrix Phi = vecs.T of shape (M, N) is held column-major. Gathering the columns Phi[:, S] of a support
+    and computing the gradient Phi^T r both read memory sequentially.
+    """
+
+    def __init__(self, tangent_space_factory, d, float32_copy=False, quantize=None):
+        """
+        :param float32_copy: if True, keep an additional float32 copy of the vectors, used for the full gradient
+        scan Phi^T r (half the memory traffic); support-restricted products always use the float64 vectors.
+        :param quantize: if 'int8', keep an additional row-wise int8 copy of the vectors (see util.quantize), for
+        approximate gradient scans with a per-column error bound (rdot_quantized); 1/8 of the memory traffic.
+        """
         vecs = tangent_space_factory()
-        d = vecs.shape[1]  # log: no
         if len(vecs.shape) != 2:
             raise ValueError('._set_vecs(): vecs must be a 2d array, otherwise the expected behaviour is ambiguous')
+        d = vecs.shape[1]  # log: no
         if vecs.shape[1] != d:
             raise ValueError('._set_vecs(): vecs must have the correct dimension')
-        self.vecs = vecs
-        print('ves shape:')
-        print(vecs.shape)
-        self.vsum = vecs.sum(axis=0)
-        self.vsum_norm = np.sqrt((self.vsum ** 2).sum())
-        self.vnorms = np.sqrt((self.vecs ** 2).sum(axis=1))
+        self.vecs = np.ascontiguousarray(vecs, dtype=np.float64)
+        self._private = not np.shares_memory(self.vecs, vecs)  # the store is a copy, not the factory's array
+        self.vecs32 = self.vecs.astype(np.float32) if float32_copy else None
+        if quantize not in (None, 'int8'):
+            raise ValueError('.__init__(): quantize must be None or \'int8\'')
+        self.quantize = quantize
+        self._quantize()
+        self.vsum = self.vecs.sum(axis=0)
+        self.vsum_norm = np.sqrt(self.vsum.dot(self.vsum))
+        self.vnorms = np.sqrt(np.einsum('ij,ij->i', self.vecs, self.vecs))
+        self.vnorms_sum = self.vnorms.sum()
+
+    def update(self, vecs):
+        """
+        Replace the tangent vectors by vecs, e.g. a new projection of the same N data points. If vecs has the current
+        shape and the store is a private copy, it is overwritten in place (also the float32 copy), so no (N, M)
+        buffer is allocated; sums and norms depend on the projection and are recomputed into their arrays.
+        """
+        if len(vecs.shape) != 2 or vecs.shape[0] != self.vecs.shape[0]:
+            raise ValueError('.update(): vecs must be a 2d array with one row per data point')
+        if vecs.shape == self.vecs.shape and self._private:
+            np.copyto(self.vecs, vecs)
+            if self.vecs32 is not None:
+                np.copyto(self.vecs32, vecs, casting='same_kind')
+        else:
+            self.vecs = np.ascontiguousarray(vecs, dtype=np.float64)
+            self._private = not np.shares_memory(self.vecs, vecs)
+            if self.vecs32 is not None:
+                self.vecs32 = self.vecs.astype(np.float32)
+        self._quantize()
+        self.vsum = self.vecs.sum(axis=0)
+        self.vsum_norm = np.sqrt(self.vsum.dot(self.vsum))
+        np.einsum('ij,ij->i', self.vecs, self.vecs, out=self.vnorms)
+        np.sqrt(self.vnorms, out=self.vnorms)
         self.vnorms_sum = self.vnorms.sum()
 
+    def _quantize(self):
+        self.vq, self.vq_scale, self.vq_err = quantize_rows(self.vecs) if self.quantize else (None, None, None)
+
     def sum(self):
         return self.vsum
 
@@ -37,6 +92,91 @@ class FiniteTangentSpace:
     def num_vectors(self):
         return self.vecs.shape[0]
 
+    def dim(self):
+        return self.vecs.shape[1]
+
+    def norms(self):
+        return self.vnorms
+
+    def norms_sum(self):
+        return self.vnorms_sum
+
+    def sum_norm(self):
+        return self.vsum_norm
+
+    def columns(self, idcs):
+        # Phi[:, idcs], shape (M, len(idcs))
+        return self.vecs[idcs].T
+
+    def dot_columns(self, idcs, x):
+        # Phi[:, idcs].dot(x) for x of shape (len(idcs), 1)
+        return self.vecs[idcs].T.dot(x)
+
+    def rdot(self, r):
+        # Phi^T r for r of shape (M, 1)
+        if self.vecs32 is not None:
+            return self.vecs32.dot(r.astype(np.float32)).astype(np.float64)
+        return self.vecs.dot(r)
+
+    def rdot_columns(self, idcs, r):
+        # Phi[:, idcs]^T r for r of shape (M, 1)
+        return self.vecs[idcs].dot(r)
+
+    def rdot_quantized(self, r):
+        # approximate Phi^T r from the int8 copy, and the bound on |Phi^T r - approximation| per column
+        return dot_quantized(self.vq, self.vq_scale, r), self.vq_err * np.sqrt((r ** 2).sum())
+
+    def rdot_range(self, start, stop, r):
+        # Phi[:, start:stop]^T r for r of shape (M, 1), from a view of the tangent vectors
+        if self.vecs32 is not None:
+            return self.vecs32[start:stop].dot(r.astype(np.float32)).astype(np.float64)
+        return self.vecs[start:stop].dot(r)
+
+    def dot_columns_rows(self, rows, idcs, x):
+        # Phi[rows][:, idcs].dot(x) for a subset of the M projection rows given as a list of slices
+        return np.vstack([self.vecs[idcs, sl].T.dot(x) for sl in rows])
+
+    def rdot_rows(self, rows, r, idcs=None):
+        # Phi[rows]^T r (restricted to the columns idcs) for rows a list of slices and r of shape (len(rows), 1);
+        # np.matmul hands the strided views vecs[:, sl] to BLAS, where ndarray.dot would copy them first
+        der = 0.
+        k = 0
+        for sl in rows:
+            n = sl.stop - sl.start
+            der = der + np.matmul(self.vecs[:, sl] if idcs is None else self.vecs[idcs, sl], r[k:k + n])
+            k += n
+        return der
+
+
+class StreamingTangentSpace:
+    """
+    Tangent space read from a TangentStream, for N too large to hold the (N, M) vectors: only their sum and norms are
+    kept (one pass at setup). The gradient Phi^T r is one pass over the row blocks, and support-restricted products
+    re-evaluate the rows of the support.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.quantize = None
+        self.vsum, self.vnorms = stream.sum_norms()
+        self.vsum_norm = np.sqrt(self.vsum.dot(self.vsum))
+        self.vnorms_sum = self.vnorms.sum()
+
+    def sum(self):
+        return self.vsum
+
+    def sum_w(self, w, idcs):
+        return w.dot(self.stream.rows(idcs))
+
+    def sum_w_norm(self, w, idcs):
+        return np.sqrt(((w.dot(self.stream.rows(idcs))) ** 2).sum())
+
+    def num_vectors(self):
+        return self.stream.n_rows
+
+    def dim(self):
+        return self.stream.dim()
+
     def norms(self):
         return self.vnorms
 
@@ -46,6 +186,162 @@ class FiniteTangentSpace:
     def sum_norm(self):
         return self.vsum_norm
 
+    def columns(self, idcs):
+        return self.stream.rows(idcs).T
+
+    def dot_columns(self, idcs, x):
+        return self.stream.rows(idcs).T.dot(x)
+
+    def rdot(self, r):
+        return self.stream.rdot(r)
+
+    def rdot_columns(self, idcs, r):
+        return self.stream.rows(idcs).dot(r)
+
+    def rdot_range(self, start, stop, r):
+        return self.stream.rows(slice(start, stop)).dot(r)
+
+
+class SupportGram:
+    """
+    Gram matrix G = Phi_S^T Phi_S, c = Phi_S^T y and the Cholesky factor G = L L^T of a support S.
+    When the support changes, only the rows/columns of the added indices are computed (O(M K) per added index):
+    the factor is extended with a block append if indices were only added, and refactored from the (K, K) Gram
+    matrix if some were removed, so no M x N work is ever done. G is singular if |S| > M or if support columns are
+    collinear; then there is no factor (L is None) and nnls solves on the columns Phi_S instead.
+    """
+
+    def __init__(self, T):
+        self.T = T
+        self.y = T.sum().reshape([-1, 1])
+        self.idcs = np.zeros(0, dtype=np.int64)
+        self.G = np.zeros((0, 0))
+        self.c = np.zeros(0)
+        self.L = np.zeros((0, 0))
+
+    def update(self, idcs):
+        idcs = np.asarray(idcs, dtype=np.int64)
+        keep = np.isin(self.idcs, idcs)
+        new = np.setdiff1d(idcs, self.idcs)
+        refactor = not np.all(keep) or self.L is None
+        if not np.all(keep):
+            self.idcs = self.idcs[keep]
+            self.G = self.G[np.ix_(keep, keep)]
+            self.c = self.c[keep]
+        if new.shape[0] > 0:
+            P_new = self.T.columns(new)
+            G_on = self.T.columns(self.idcs).T.dot(P_new)
+            G_nn = P_new.T.dot(P_new)
+            self.G = np.block([[self.G, G_on], [G_on.T, G_nn]])
+            self.c = np.hstack((self.c, self.T.rdot_columns(new, self.y)[:, 0]))
+            self.idcs = np.hstack((self.idcs, new))
+            if not refactor:
+                try:
+                    L_no = solve_triangular(self.L, G_on, lower=True).T if self.L.shape[0] > 0 else G_on.T
+                    L_nn = cholesky(G_nn - L_no.dot(L_no.T), lower=True)
+                    self.L = self._checked(np.block([[self.L, np.zeros(G_on.shape)], [L_no, L_nn]]))
+                except (LinAlgError, ValueError):
+                    self.L = None
+        if refactor:
+            try:
+                self.L = self._checked(cholesky(self.G, lower=True))
+            except (LinAlgError, ValueError):
+                self.L = None
+
+    def _checked(self, L):
+        # a factor with a pivot below sqrt(eps) of the largest column norm is numerically singular
+        if L.shape[0] > 0 and np.diag(L).min() <= np.sqrt(np.finfo(np.float64).eps * self.G.diagonal().max()):
+            return None
+        return L
+
+    def nnls(self):
+        if self.L is None:
+            return nnls(self.T.columns(self.idcs), self.y[:, 0], maxiter=100 * self.idcs.shape[0])[0]
+        # min_{w >= 0} ||y - Phi_S w|| = min_{w >= 0} ||L^T w - L^{-1} c|| up to a constant
+        w, _ = nnls(self.L.T, solve_triangular(self.L, self.c, lower=True), maxiter=100 * self.idcs.shape[0])
+        return w
+
+
+class ColumnCache:
+    """
+    Bounded LRU cache of support-restricted column blocks Phi[:, S] and of their Gram matrices Phi_S^T Phi_S, keyed by
+    the set S. Late in the iterations the active subspaces S_i and supports X_i repeat, so the products with Phi_S
+    are done on a cached contiguous block instead of a fresh gather, and ||Phi_S x||^2 = x^T G x costs O(|S|^2)
+    instead of O(M |S|) once the Gram matrix of a repeated set is stored. Blocks are kept sorted by index; the
+    products permute their arguments accordingly. The least recently used entries are evicted once the blocks and
+    Gram matrices exceed budget_mb megabytes.
+    """
+
+    def __init__(self, T, budget_mb):
+        self.T = T
+        self.budget = int(budget_mb * 2 ** 20)
+        self.nbytes = 0
+        self.entries = OrderedDict()  # key -> [block of shape (|S|, M), Gram matrix or None]
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def hit_rate(self):
+        n = self.hits + self.misses
+        return self.hits / n if n > 0 else 0.
+
+    def _lookup(self, idcs):
+        # (entry, perm): the cached entry of the set idcs and the permutation sorting idcs
+        idcs = np.asarray(idcs, dtype=np.int64)
+        perm = np.argsort(idcs, kind='stable')
+        sidcs = idcs[perm]
+        key = sidcs.tobytes()
+        e = self.entries.get(key)
+        if e is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return e, perm
+        self.misses += 1
+        e = [self.T.vecs[sidcs], None]
+        self._store(key, e, e[0].nbytes)
+        return e, perm
+
+    def _store(self, key, e, nbytes):
+        if nbytes > self.budget:
+            return
+        while self.nbytes + nbytes > self.budget:
+            _, (B, G) = self.entries.popitem(last=False)
+            self.nbytes -= B.nbytes + (G.nbytes if G is not None else 0)
+            self.evictions += 1
+        self.entries[key] = e
+        self.nbytes += nbytes
+
+    def dot_columns(self, idcs, x):
+        # Phi[:, idcs].dot(x) for x of shape (len(idcs), 1)
+        (B, _), perm = self._lookup(idcs)
+        return B.T.dot(x[perm])
+
+    def rdot_columns(self, idcs, r):
+        # Phi[:, idcs]^T r for r of shape (M, 1)
+        (B, _), perm = self._lookup(idcs)
+        out = np.empty((perm.shape[0], r.shape[1]))
+        out[perm] = B.dot(r)
+        return out
+
+    def sq_norm(self, idcs, x):
+        # ||Phi[:, idcs].dot(x)||^2; the Gram matrix is formed on the first repeat of the set, if |S| <= M / 2 so that
+        # x^T G x is at least twice as cheap as the product
+        hits = self.hits
+        e, perm = self._lookup(idcs)
+        B, G = e
+        xs = x[perm]
+        if G is None and self.hits > hits and 2 * B.shape[0] <= B.shape[1] \
+                and self.nbytes + 8 * B.shape[0] ** 2 <= self.budget:
+            G = e[1] = B.dot(B.T)
+            self.nbytes += G.nbytes
+        if G is not None:
+            return xs.T.dot(G.dot(xs)).item()
+        Px = B.T.dot(xs)
+        return Px.T.dot(Px).item()
+
 
 class IHTCoreset(Coreset):
     """
@@ -53,120 +349,556 @@ class IHTCoreset(Coreset):
     """
 
     def __init__(self, tangent_space_factory, d, iht_mode='IHT', stochastic_batch_ratio=-1, tol=1e-5,
-        max_iter=300, **kw):
+        max_iter=300, float32_copy=False, precondition=False, variance_reduction=None, vr_epoch=None,
+        screening=False, screen_period=10, screen_margin=1., n_starts=1, n_workers=None, start_inits=None,
+        cancel_margin=0.5, row_batch_ratio=-1, topk_recall=None, streaming=False, stream_block=65536, init=None,
+        greedy_steps=0, greedy_snnls=GIGA, column_cache_mb=None, quantize=None, **kw):
         """
         IHT Coreset Construction
         :param stochastic_batch_ratio: # if stochastic_batch_ratio is not -1, it should be within (0, 1),
         representing the percentage of data to form as a random batch. The stochastic batch gradient
         is only fully supported on self._iht(), i.e., the A-IHT I.
-        The stochastic batch gradient is simulated for the purpose of verifying its effectiveness,
-        so there is no actual time saving. But it is easy to actually implement that.
+        The stochastic batch gradient only touches the columns of Phi in the batch.
+        :param variance_reduction: None, 'svrg' or 'saga'; control variate for the stochastic batch gradient.
+        A full gradient snapshot g~ is taken every vr_epoch iterations (default ceil(1 / stochastic_batch_ratio)).
+        Between snapshots, the gradient is the unbiased estimate g~ + (g_B - g~_B) / stochastic_batch_ratio, with
+        g_B the fresh gradient of the batch columns, and the support columns are exact. 'svrg' keeps g~ fixed for
+        the epoch, 'saga' writes the fresh batch and support values back into it.
+        :param float32_copy: if True, the full gradient scans use a float32 copy of the tangent vectors.
+        :param quantize: if 'int8', the full gradient scans use an int8 copy of the tangent vectors, and the columns
+        whose error bound leaves their selection open are recomputed exactly (see _quantized_gradient), so the
+        selected supports are those of the exact gradient; exact gradients without screening, dense kernel only.
+        :param precondition: if True, run IHT in the coordinates v = w / self.scale, in which all columns of
+        Phi * self.scale have the same norm (diagonal preconditioning); the weights are mapped back as w = scale * v.
+        :param screening: if True, discard columns that cannot enter the support (see _screened_gradient) and
+        compute the gradient only on the surviving columns. A full gradient re-check is done every screen_period
+        iterations, or earlier if more than half of the columns survive. Not supported with stochastic gradients.
+        :param screen_margin: multiplies the screening bound; 1 is safe, < 1 screens heuristically, in which case
+        the stopping point is verified with a full gradient and screening is switched off if the bound was violated.
+        :param row_batch_ratio: if not -1, within (0, 1): each iteration uses a random window of this fraction of the
+        projection rows of Phi (see _a_iht_rows); the window grows to all rows as the iterations converge.
+        :param topk_recall: if not None, the top-K selections of the support steps use the sampled-threshold engine
+        util.topk.top_k with this recall (exact whenever its pivot is low enough, see top_k) instead of a full sort.
+        :param streaming: if True, compute the gradient in blocks of stream_block columns and keep only the candidates
+        the support steps can select, with sparse iterates (see _a_iht_stream); exact gradients only.
+        :param init: starting point of the builds instead of the zero vector, either a weight vector of length N or
+        another Coreset, whose current weights are read at build time (see _seed_point).
+        :param greedy_steps: if > 0, hybrid mode: run this many steps (at most the coreset size) of the greedy solver
+        greedy_snnls (a SparseNNLS class) on the same tangent vectors, from init if given, and start A-IHT there.
+        :param column_cache_mb: if not None, keep the column blocks Phi[:, S] of the active subspaces and supports, and
+        the Gram matrices of the repeated ones, in an LRU cache of this many megabytes (see ColumnCache); hit counts
+        of the last build are in column_cache.hits / misses. Not used by the row-batch kernel.
+        :param tangent_space_factory: a tangent space factory, or a TangentStream (see
+        BayesianTangentSpaceFactory.stream) for data sets whose tangent matrix does not fit in memory: the vectors are
+        then re-evaluated from the stream at every gradient pass (see StreamingTangentSpace), which rules out
+        float32_copy, quantize, column_cache_mb, greedy_steps, n_starts > 1 and row batches.
+        :param n_starts: if > 1, build from several starting points in n_workers processes and keep the lowest
+        objective (see _multistart), instead of from init and greedy_steps; start_inits lists 'zero', 'random' or
+        'greedy' per start (see _init_point), default one zero, one greedy and random for the rest. A start whose
+        objective is more than (1 + cancel_margin) times the best finished one, and would not reach it at its recent
+        rate, is stopped early.
         """
         super().__init__(**kw)
+        # settings passed on to the IHTCoreset of each start
+        self._start_kw = dict(iht_mode=iht_mode, stochastic_batch_ratio=stochastic_batch_ratio, tol=tol,
+                              max_iter=max_iter, float32_copy=float32_copy, precondition=precondition,
+                              variance_reduction=variance_reduction, vr_epoch=vr_epoch, screening=screening,
+                              screen_period=screen_period, screen_margin=screen_margin,
+                              row_batch_ratio=row_batch_ratio, topk_recall=topk_recall, streaming=streaming,
+                              stream_block=stream_block, column_cache_mb=column_cache_mb, quantize=quantize)
+        if start_inits is None:
+            start_inits = (['zero', 'greedy'] + ['random'] * n_starts)[:n_starts]
+        if len(start_inits) != n_starts or not set(start_inits) <= {'zero', 'random', 'greedy'}:
+            raise ValueError('.__init__(): start_inits must list n_starts of \'zero\', \'random\' or \'greedy\'')
+        if n_starts > 1 and (init is not None or greedy_steps > 0):
+            raise ValueError('.__init__(): init and greedy_steps cannot be combined with n_starts > 1, see start_inits')
+        self.n_starts = n_starts
+        self.n_workers = n_workers
+        self.start_inits = start_inits
+        self.cancel_margin = np.inf if cancel_margin is None else cancel_margin
+        self.start_objs = []
+        self.init = init
+        self._init_arg = init  # update_tangent_space may replace init by the current weights, reset restores it
+        self.greedy_steps = greedy_steps
+        self.greedy_snnls = greedy_snnls
+        self.greedy_time = 0.  # time spent in the greedy steps of the last build
         self.reached_numeric_limit = False
         self.iht_mode = iht_mode
-        self.T = FiniteTangentSpace(tangent_space_factory, d)
-        self.dim = self.T.vecs.shape[0]
+        if quantize not in (None, 'int8'):
+            raise ValueError('.__init__(): quantize must be None or \'int8\'')
+        if quantize is not None and (float32_copy or stochastic_batch_ratio != -1 or screening or streaming
+                                     or row_batch_ratio != -1):
+            raise ValueError('.__init__(): quantize requires exact gradients without float32_copy, screening, '
+                             'streaming or row batches')
+        # the tangent space and everything derived from it are set up on first use (see _materialize)
+        self._tsf = tangent_space_factory
+        self._tangent_args = (d, float32_copy, quantize)
         self.stochastic_batch_ratio = stochastic_batch_ratio
+        if variance_reduction not in (None, 'svrg', 'saga'):
+            raise ValueError('.__init__(): variance_reduction must be None, \'svrg\' or \'saga\'')
+        self.variance_reduction = variance_reduction
+        self.vr_epoch = None
+        if variance_reduction is not None:
+            if not 0. < stochastic_batch_ratio <= 1.:
+                raise ValueError('.__init__(): variance_reduction requires a stochastic_batch_ratio in (0, 1]')
+            self.vr_epoch = vr_epoch if vr_epoch is not None else int(np.ceil(1. / stochastic_batch_ratio))
+        self._snap_der = None
+        self._snap_age = 0
+        self.column_touches = 0  # columns of Phi read by gradient evaluations during the last build (rows: m / M each)
+        if screening and stochastic_batch_ratio != -1:
+            raise ValueError('.__init__(): screening requires exact gradients, i.e. stochastic_batch_ratio = -1')
+        self.screening = screening
+        if row_batch_ratio != -1 and (stochastic_batch_ratio != -1 or screening):
+            raise ValueError('.__init__(): row_batch_ratio cannot be combined with stochastic_batch_ratio or screening')
+        self.row_batch_ratio = row_batch_ratio
+        self.topk_recall = topk_recall
+        if streaming and (stochastic_batch_ratio != -1 or screening or row_batch_ratio != -1):
+            raise ValueError('.__init__(): streaming requires exact gradients without screening or row batches')
+        self.streaming = streaming
+        self.stream_block = stream_block
+        if column_cache_mb is not None and row_batch_ratio != -1:
+            raise ValueError('.__init__(): column_cache_mb caches full-row column blocks, not row batches')
+        self._column_cache_mb = column_cache_mb
+        if isinstance(tangent_space_factory, TangentStream) and (
+                float32_copy or quantize is not None or column_cache_mb is not None or greedy_steps > 0
+                or n_starts > 1 or row_batch_ratio != -1):
+            raise ValueError('.__init__(): a TangentStream cannot be combined with float32_copy, quantize, '
+                             'column_cache_mb, greedy_steps, n_starts > 1 or row batches')
+        self.row_batch_sizes = []  # row window size at every iteration of the last build with row_batch_ratio
+        self._screening_on = False
+        self.screen_period = screen_period
+        self.screen_margin = screen_margin
+        self._screen_g0 = None
+        self._screen_r0 = None
+        self._screen_age = 0
+        self._screened = None
+        self._screen_res = None
+        self._K = 0
         self.max_iter = max_iter
         self.tol = tol
-        self.full_wts = np.zeros(self.dim)
-        self.full_wts_scaled = np.zeros(self.dim)  # np.random.rand(self.dim)
+        self.precondition = precondition
         self.supp = []
         self.learning_rate = 1e-6
-        self.scale = self.T.norms_sum() / self.T.norms()
         self.convergence_error = 0.0001
         self.iter_iht = 0
+        self.obj_list = []
+
+    # attributes derived from the tangent space, set by _materialize
+    _lazy = ('T', 'dim', 'scale', 'res', 'err', 'gram', 'column_cache')
+
+    def __getattr__(self, name):
+        # only called for attributes that are not set: the first use of a derived attribute materializes them all
+        if name in IHTCoreset._lazy and '_tsf' in self.__dict__:
+            self._materialize()
+            return self.__dict__[name]
+        raise AttributeError(name)
+
+    def _materialize(self):
+        """
+        Evaluate the tangent space factory and set up what depends on it. Deferred from __init__ so that coresets
+        that are constructed but never built cost nothing. The factory is dropped only once everything is set up, so
+        if it raises, the next use tries again.
+        """
+        try:
+            self._setup_tangent_space(self._tsf)
+        except Exception:
+            for name in IHTCoreset._lazy:
+                self.__dict__.pop(name, None)
+            raise
+        del self._tsf
+
+    def _setup_tangent_space(self, tangent_space_factory):
+        d, float32_copy, quantize = self._tangent_args
+        if isinstance(tangent_space_factory, TangentStream):
+            self.T = StreamingTangentSpace(tangent_space_factory)
+        else:
+            self.T = FiniteTangentSpace(tangent_space_factory, d, float32_copy=float32_copy, quantize=quantize)
+        self.dim = self.T.num_vectors()
+        if self.init is not None and not isinstance(self.init, Coreset) \
+                and np.asarray(self.init).reshape(-1).shape[0] != self.dim:
+            raise ValueError('._materialize(): init must be a Coreset or a weight vector with one entry per data '
+                             'point')
         if np.any(self.T.norms() == 0):
-            raise ValueError('.__init__(): tangent space must not have any 0 vectors')
+            raise ValueError('._materialize(): tangent space must not have any 0 vectors')
+        self.scale = self.T.norms_sum() / self.T.norms()
+        self.column_cache = ColumnCache(self.T, self._column_cache_mb) if self._column_cache_mb is not None else None
+        # residual y - Phi w of the current weights, kept up to date so that error() is O(1)
+        self.res = self.T.sum().reshape([-1, 1])
+        self.err = self.T.sum_norm()
+        self.gram = SupportGram(self.T)
+
+    def update_tangent_space(self, tangent_space_factory, warm_start=True):
+        """
+        Swap in a new tangent matrix for the same N data points, e.g. after the posterior estimate was refreshed and
+        the projection re-drawn, without rebuilding the coreset object. Everything derived from the old matrix
+        (scaling, support Gram matrix, column cache) is refreshed and the residual of the current
+        weights is recomputed in the new space. If warm_start and n_starts == 1, the current weights become the
+        starting point (init) of the next build, which then typically stops after a few iterations; reset() restores
+        the init passed to __init__.
+        """
+        if '_tsf' in self.__dict__:
+            # not materialized yet, so there are no weights to keep either
+            self._tsf = tangent_space_factory
+            return
+        if isinstance(tangent_space_factory, TangentStream) != isinstance(self.T, StreamingTangentSpace):
+            raise ValueError('.update_tangent_space(): a TangentStream can only replace a TangentStream')
+        if isinstance(tangent_space_factory, TangentStream):
+            if tangent_space_factory.n_rows != self.dim:
+                raise ValueError('.update_tangent_space(): the stream must have one row per data point')
+            self.T = StreamingTangentSpace(tangent_space_factory)
+        else:
+            self.T.update(tangent_space_factory())
+        if np.any(self.T.norms() == 0):
+            raise ValueError('.update_tangent_space(): tangent space must not have any 0 vectors')
+        self.scale = self.T.norms_sum() / self.T.norms()
+        self.gram = SupportGram(self.T)
+        self.reached_numeric_limit = False  # a limit of the old matrix
+        if self.column_cache is not None:
+            self.column_cache = ColumnCache(self.T, self.column_cache.budget / 2 ** 20)
+        wts, idcs = self.weights()
+        if warm_start and self.n_starts == 1 and idcs.shape[0] > 0:
+            self.init = np.zeros(self.dim)
+            self.init[idcs] = wts
+        self._set_residual(self.gram.y - self.T.dot_columns(idcs, wts[:, np.newaxis]))
 
     def _objective(self):
-        v = self.full_wts_scaled * self.scale - 1
-        return v.T.dot(self.T.matrixK.dot(v))
+        return self.err
+
+    def _set_residual(self, res):
+        self.res = res
+        self.err = np.sqrt(res.T.dot(res).item())
 
     def _objective_w(self, w):
-        Phi = self.T.vecs.T
-        y = self.T.vsum.reshape([-1, 1])
-        return np.linalg.norm(y - Phi.dot(w), ord=2)
-
-    def stochastic_Phi(self, Phi, ratio):
-        # randomly select a subset of columns of Phi
-        (M, N) = Phi.shape
-        B = int(N * ratio)
-        sel_cols = np.random.permutation(N)[:B]
-        Phi_batch = np.zeros([M, N])
-        Phi_batch[:, sel_cols] = Phi[:, sel_cols]
-        return Phi_batch
+        y = self.T.sum().reshape([-1, 1])
+        supp = np.nonzero(w)[0]
+        return np.linalg.norm(y - self.T.dot_columns(supp, w[supp]), ord=2)
+
+    def _gradient(self, res, idcs=None, support=None):
+        """
+        Gradient Phi^T res in the solver coordinates, restricted to Phi[:, idcs] if idcs is not None.
+        With a stochastic batch, only the columns in a random batch are touched; the others are zero,
+        unless variance reduction is on (see _vr_gradient), in which case support-restricted gradients are exact.
+        """
+        if self._screening_on and idcs is None:
+            der = self._screened_gradient(res, support)
+        elif self.T.quantize is not None and idcs is None:
+            der = self._quantized_gradient(res, support)
+        elif self.stochastic_batch_ratio == -1 or (self.variance_reduction is not None and idcs is not None):
+            if idcs is None:
+                der = self.T.rdot(res)
+                self.column_touches += self.dim
+            else:
+                der = self._rdot_columns(idcs, res)
+                self.column_touches += len(idcs)
+        elif self.variance_reduction is not None:
+            der = self._vr_gradient(res, support)
+        else:
+            N = self.dim
+            sel_cols = np.random.permutation(N)[:int(N * self.stochastic_batch_ratio)]
+            self.column_touches += sel_cols.shape[0]
+            if idcs is None:
+                der = np.zeros([N, 1])
+                der[sel_cols] = self.T.rdot_columns(sel_cols, res)
+            else:
+                in_batch = np.zeros(N, dtype=bool)
+                in_batch[sel_cols] = True
+                idcs = np.asarray(idcs, dtype=np.int64)
+                der = np.zeros([idcs.shape[0], 1])
+                der[in_batch[idcs]] = self.T.rdot_columns(idcs[in_batch[idcs]], res)
+        if self.precondition:
+            der *= self.scale[:, np.newaxis] if idcs is None else self.scale[idcs, np.newaxis]
+        return der
+
+    def _quantized_gradient(self, res, support):
+        """
+        Gradient Phi^T res (original coordinates) from the quantized tangent vectors, exact where it matters.
+        With the approximation g and its per-column error bound e, a column outside the support whose upper bound of
+        |g| (resp. g) is below the K-th largest lower bound of |g| (resp. g) over the columns outside the support
+        cannot be selected by the active subspace (resp. the top-K projection), as in _screen. The support and all
+        other columns are recomputed exactly, so the selections match those of the exact gradient.
+        The int8 scan counts as 1/8 of a column touch per column.
+        """
+        N = self.dim
+        K = self._K
+        support = [] if support is None else support
+        g, e = self.T.rdot_quantized(res)
+        self.column_touches += N / 8.
+        s = self.scale if self.precondition else np.ones(N)
+        g0 = s * g[:, 0]
+        nb = s * e
+        cand = np.ones(N, dtype=bool)
+        cand[support] = False
+        if cand.sum() <= K:
+            exact = np.arange(N)
+        else:
+            lo_abs = (np.fabs(g0) - nb)[cand]
+            lo = (g0 - nb)[cand]
+            tau_abs = np.partition(lo_abs, lo_abs.shape[0] - K)[lo_abs.shape[0] - K]
+            tau = np.partition(lo, lo.shape[0] - K)[lo.shape[0] - K]
+            exact = np.nonzero(~cand | (np.fabs(g0) + nb >= tau_abs) | (g0 + nb >= tau))[0]
+        g[exact] = self.T.rdot_columns(exact, res)
+        self.column_touches += exact.shape[0]
+        return g
+
+    def _vr_gradient(self, res, support):
+        # variance-reduced stochastic estimate of the full gradient Phi^T res (original coordinates)
+        N = self.dim
+        if self._snap_der is None or self._snap_age >= self.vr_epoch:
+            self._snap_der = self.T.rdot(res)  # full gradient snapshot
+            self._snap_age = 0
+            self.column_touches += N
+            return self._snap_der.copy()
+        self._snap_age += 1
+        sel_cols = np.random.permutation(N)[:int(N * self.stochastic_batch_ratio)]
+        fresh = self.T.rdot_columns(sel_cols, res)
+        der = self._snap_der.copy()
+        der[sel_cols] += (fresh - self._snap_der[sel_cols]) / self.stochastic_batch_ratio
+        if self.variance_reduction == 'saga':
+            self._snap_der[sel_cols] = fresh
+        self.column_touches += sel_cols.shape[0]
+        if support is not None and len(support) > 0:
+            der[support] = self.T.rdot_columns(support, res)
+            if self.variance_reduction == 'saga':
+                self._snap_der[support] = der[support]
+            self.column_touches += len(support)
+        return der
+
+    def _full_gradient_checkpoint(self, res):
+        self._screen_g0 = self.T.rdot(res)
+        self._screen_r0 = res
+        self._screen_age = 0
+        self._screened = None
+        self.column_touches += self.dim
+        return self._screen_g0.copy()
+
+    def _screen(self, res, support):
+        """
+        Columns that provably cannot be selected at the current residual.
+        With g0 = Phi^T r0 from the last checkpoint, |g_j - g0_j| <= n_j ||res - r0|| for every column j, where n_j
+        is its norm. If the upper bound of |g_j| (resp. g_j) of a column outside the support is below the K-th largest
+        lower bound of |g| (resp. g) over the columns outside the support, then at least K other columns beat it both
+        in the active-subspace selection (by |g|) and in the top-K projection (by g, the step size being positive).
+        All comparisons are done in the solver coordinates. Costs O(N).
+        """
+        N = self.dim
+        K = self._K
+        s = self.scale if self.precondition else np.ones(N)
+        g0 = s * self._screen_g0[:, 0]
+        nb = self.screen_margin * s * self.T.norms() * np.sqrt(((res - self._screen_r0) ** 2).sum())
+        cand = np.ones(N, dtype=bool)
+        cand[support] = False
+        if cand.sum() <= K:
+            return np.zeros(N, dtype=bool)
+        lo_abs = (np.fabs(g0) - nb)[cand]
+        lo = (g0 - nb)[cand]
+        tau_abs = np.partition(lo_abs, lo_abs.shape[0] - K)[lo_abs.shape[0] - K]
+        tau = np.partition(lo, lo.shape[0] - K)[lo.shape[0] - K]
+        return cand & (np.fabs(g0) + nb < tau_abs) & (g0 + nb < tau)
+
+    def _screened_gradient(self, res, support):
+        # gradient (original coordinates) on the columns that survive screening, 0 on the screened ones
+        support = [] if support is None else support
+        if self._screen_g0 is None or self._screen_age >= self.screen_period:
+            return self._full_gradient_checkpoint(res)
+        self._screen_age += 1
+        screened = self._screen(res, support)
+        surv = np.nonzero(~screened)[0]
+        if surv.shape[0] > self.dim / 2:
+            # the bound is too loose to pay off; re-check with a full gradient
+            return self._full_gradient_checkpoint(res)
+        self._screened = screened
+        self._screen_res = res
+        der = np.zeros([self.dim, 1])
+        der[surv] = self.T.rdot_columns(surv, res)
+        self.column_touches += surv.shape[0]
+        return der
+
+    def _screening_verified(self):
+        """
+        With a heuristic margin (< 1), check with one full gradient that the bound held on the columns screened in the
+        last iteration; if it did not, switch screening off and return False so that the iterations continue.
+        """
+        if not self._screening_on or self.screen_margin >= 1. or self._screened is None:
+            return True
+        res = self._screen_res
+        s = self.scale if self.precondition else np.ones(self.dim)
+        nb = self.screen_margin * s * self.T.norms() * np.sqrt(((res - self._screen_r0) ** 2).sum())
+        dev = np.fabs(s * (self.T.rdot(res) - self._screen_g0)[:, 0])
+        self.column_touches += self.dim
+        if np.any(self._screened & (dev > nb)):
+            self.log.warning('heuristic screening bound violated at the stopping point; continuing without screening')
+            self._screening_on = False
+            self._screened = None
+            return False
+        return True
+
+    def _top_k(self, v, K, absolute=False, exclude=None):
+        # indices of the K largest entries of v (of |v|) outside of exclude, largest first
+        if self.topk_recall is not None:
+            return top_k(v, K, recall=self.topk_recall, absolute=absolute, exclude=exclude)
+        if exclude is not None:
+            mask = np.ones(v.shape)
+            mask[exclude] = 0
+            v = v * mask
+        if absolute:
+            v = np.absolute(v)
+        return np.flip(np.argsort(v, axis=None))[0:K]
+
+    def _dot_columns(self, idcs, x):
+        # Phi[:, idcs].dot(x) in the solver coordinates
+        if self.precondition:
+            x = self.scale[idcs, np.newaxis] * x
+        if self.column_cache is not None:
+            return self.column_cache.dot_columns(idcs, x)
+        return self.T.dot_columns(idcs, x)
+
+    def _sq_norm_columns(self, idcs, x):
+        # ||Phi[:, idcs].dot(x)||^2 in the solver coordinates
+        if self.column_cache is not None:
+            if self.precondition:
+                x = self.scale[idcs, np.newaxis] * x
+            return self.column_cache.sq_norm(idcs, x)
+        Px = self._dot_columns(idcs, x)
+        return Px.T.dot(Px).item()
+
+    def _rdot_columns(self, idcs, r):
+        # Phi[:, idcs]^T r in the original coordinates
+        if self.column_cache is not None:
+            return self.column_cache.rdot_columns(idcs, r)
+        return self.T.rdot_columns(idcs, r)
 
     # Accelerated IHT I (A-IHT I)
     def _iht(self, K):
-        # parameters setting, k is sparsity
-        Phi = self.T.vecs.T
-        y = self.T.vsum.reshape([-1, 1])
-        stochastic_batch_ratio = self.stochastic_batch_ratio
-        # np.save('Phi.npy', Phi)
-        # np.save('y.npy', y)
+        self._a_iht(K, debias=False, x0=self._seed_point(K))
+
+    # Accelerated IHT II (A-IHT II)
+    def _iht_ii(self, K):
+        self._a_iht(K, debias=True, x0=self._seed_point(K))
+
+    def _seed_point(self, K):
+        """
+        Starting point of shape (N, 1) in the original coordinates from self.init and the greedy steps, or None for
+        the zero vector. A seed with more than K points keeps its K largest weights.
+        """
+        x0 = None
+        if self.init is not None:
+            x0 = np.zeros([self.dim, 1])
+            if isinstance(self.init, Coreset):
+                wts, idcs = self.init.weights()
+                x0[idcs, 0] = wts
+            else:
+                x0[:, 0] = np.maximum(np.asarray(self.init, dtype=np.float64).reshape(-1), 0.)
+        self.greedy_time = 0.
+        if self.greedy_steps > 0:
+            t0 = time.perf_counter()
+            snnls = self.greedy_snnls(self.T.vecs.T, self.T.sum())
+            if x0 is not None:
+                snnls.w = x0[:, 0].copy()
+            snnls.build(max(0, min(self.greedy_steps, K - snnls.size())))
+            x0 = snnls.weights()[:, np.newaxis]
+            self.greedy_time = time.perf_counter() - t0
+        if x0 is None or not np.any(x0 > 0):
+            return None
+        if (x0 > 0).sum() > K:
+            x0[np.argsort(x0[:, 0])[:-K]] = 0.
+        return x0
+
+    def _init_point(self, K, init, seed=None):
+        """
+        Starting point of shape (N, 1) in the original coordinates: None for 'zero'; for 'random', K random points
+        with random weights; for 'greedy', the K points most correlated with y (by Phi^T y / norms), weighted by
+        Phi^T y / norms^2. Both are rescaled to the best fit of y along their direction.
+        """
+        N = self.dim
+        y = self.T.sum().reshape([-1, 1])
+        x = np.zeros([N, 1])
+        if init == 'zero':
+            return None
+        elif init == 'random':
+            rng = np.random.RandomState(seed)
+            supp = rng.permutation(N)[:K]
+            x[supp] = rng.rand(supp.shape[0], 1)
+        elif init == 'greedy':
+            corr = self.T.rdot(y)[:, 0] / self.T.norms()
+            supp = np.argpartition(-corr, K - 1)[:K] if N > K else np.arange(N)
+            supp = supp[corr[supp] > 0]
+            x[supp, 0] = corr[supp] / self.T.norms()[supp]
+        else:
+            raise ValueError('._init_point(): init must be \'zero\', \'random\' or \'greedy\'')
+        Phi_x = self.T.dot_columns(supp, x[supp])
+        temp = Phi_x.T.dot(Phi_x).item()
+        if temp > 0:
+            x *= max(Phi_x.T.dot(y).item() / temp, 0.)  # best fit along x
+        return x
+
+    def _a_iht(self, K, debias, x0=None, callback=None):
+        """
+        A-IHT I (debias=False) or II (debias=True) from the zero vector, or from x0 of shape (N, 1) (original
+        coordinates, nonnegative and K-sparse). callback(i, objective) is called after every iteration; the iterations
+        stop if it returns True.
+        """
+        if self.row_batch_ratio != -1:
+            return self._a_iht_rows(K, debias, x0, callback)
+        if self.streaming:
+            return self._a_iht_stream(K, debias, x0, callback)
+        # parameters setting, k is sparsity; Phi = self.T.vecs.T is never formed, see FiniteTangentSpace
+        y = self.T.sum().reshape([-1, 1])
         PrintOutResult = True
 
-        (M, N) = Phi.shape
+        M = self.T.dim()
+        N = self.T.num_vectors()
 
-        # Initialize transpose of measurement matrix
-        Phi_t = Phi.T
+        self._snap_der = None
+        self._screen_g0 = None
+        self._screened = None
+        self._screening_on = self.screening
+        self._K = K
+        self.column_touches = 0
 
-        # Initialize to zero vector
-        x_cur = np.zeros([N, 1])
-        y_cur = np.zeros([N, 1])
-        # x_cur = np.random.random([N, 1])
-        # y_cur = np.random.random([N, 1])
+        # Initialize to zero vector, or to x0
+        if x0 is None:
+            x_cur = np.zeros([N, 1])
+        else:
+            x_cur = x0 / self.scale[:, np.newaxis] if self.precondition else x0.copy()
+        y_cur = x_cur.copy()
+        Y_i = np.nonzero(x_cur)[0].tolist()
 
-        Phi_x_cur = np.zeros([M, 1])
-        Y_i = []
+        Phi_x_cur = self._dot_columns(Y_i, x_cur[Y_i])
+        Phi_diff = np.zeros([M, 1])
+        tau = 0.
 
         # auxiliary variables
-        complementary_Yi = np.ones([N, 1])
         i = 1
         obj_list = []
 
         while i <= self.max_iter:
             x_prev = x_cur
-            if i == 1:
-                res = y
-                if stochastic_batch_ratio != -1:
-                    Phi_batch = self.stochastic_Phi(Phi, stochastic_batch_ratio)
-                    der = Phi_batch.T.dot(res)
-                else:
-                    der = Phi_t.dot(res)    # compute gradient
-            else:
-                res = y - Phi_x_cur - tau * Phi_diff
-                if stochastic_batch_ratio != -1:
-                    Phi_batch = self.stochastic_Phi(Phi, stochastic_batch_ratio)
-                    der = Phi_batch.T.dot(res)    # compute gradient
-                else:
-                    der = Phi_t.dot(res)    # compute gradient
+            res = y - Phi_x_cur - tau * Phi_diff
+            der = self._gradient(res, support=Y_i)  # compute gradient
             Phi_x_prev = Phi_x_cur
-            complementary_Yi[Y_i] = 0
-            ind_der = np.flip(np.argsort(np.absolute(np.squeeze(der * complementary_Yi))))
-            complementary_Yi[Y_i] = 1
-            S_i = Y_i + np.squeeze(ind_der[0:K]).tolist()   # identify active subspace
+            S_i = Y_i + self._top_k(der, K, absolute=True, exclude=Y_i).tolist()  # identify active subspace
             ider = der[S_i]
-            Pder = Phi[:, S_i].dot(ider)
-            mu_bar = ider.T.dot(ider) / Pder.T.dot(Pder) / 2    # step size selection
-            b = y_cur + mu_bar * der                    # gradient descent
-            ind_b = np.flip(np.argsort(np.squeeze(b)))
-            ind_b = np.squeeze(ind_b).tolist()
+            mu_bar = ider.T.dot(ider) / self._sq_norm_columns(S_i, ider) / 2  # step size selection
+            b = y_cur + mu_bar * der  # gradient descent
+            if self._screened is not None:
+                b[self._screened] = -np.inf  # screened columns cannot enter the support
             x_cur = np.zeros([N, 1])
-            S_i_temp = ind_b[0:K]
-            x_cur[S_i_temp] = b[ind_b[0:K]]             # projection
-            X_i = S_i_temp
-            x_cur[x_cur < 0] = 0        # truncate negative entries
+            X_i = self._top_k(b, K).tolist()
+            x_cur[X_i] = b[X_i]  # projection
+            if debias:
+                Phi_x_cur = self._dot_columns(X_i, x_cur[X_i])
+                res = y - Phi_x_cur
+                ider = self._gradient(res, X_i)  # compute gradient on the support only
+                temp = self._sq_norm_columns(X_i, ider)
+                if temp > 0:  # a stochastic batch may miss the whole support
+                    mu_bar = ider.T.dot(ider) / temp / 2  # step size selection
+                    x_cur[X_i] = x_cur[X_i] + mu_bar * ider  # debias
+            x_cur[x_cur < 0] = 0  # truncate negative entries
 
-            Phi_x_cur = Phi[:, X_i].dot(x_cur[X_i])
+            Phi_x_cur = self._dot_columns(X_i, x_cur[X_i])
             res = y - Phi_x_cur
 
-            if i == 1:
-                Phi_diff = Phi_x_cur
-            else:
-                Phi_diff = Phi_x_cur - Phi_x_prev
+            Phi_diff = Phi_x_cur - Phi_x_prev
 
             temp = Phi_diff.T.dot(Phi_diff)
             if temp > 0:
@@ -177,115 +909,106 @@ class IHTCoreset(Coreset):
             y_cur = x_cur + tau * (x_cur - x_prev)
             Y_i = np.nonzero(y_cur)[0].tolist()
 
-            # print out objective function value during optimization of IHT
-            if i % 50 == -1:
-                print('after iteration {}:'.format(i))
-                print('objective value: {}'.format(self._objective_w(x_cur)))
-                print('  ')
-
-            # for experiment 1 to record convergence
-            # if K == 200:
-            #  obj_list.append(self._objective_w(x_cur))
+            # record convergence; res is the residual of x_cur, so this is O(M)
+            obj_list.append(np.sqrt(res.T.dot(res).item()))
 
             # stop criterion
-            if i > 1 and (np.linalg.norm(x_cur - x_prev) < self.tol * np.linalg.norm(x_cur)):
+            if i > 1 and (np.linalg.norm(x_cur - x_prev) < self.tol * np.linalg.norm(x_cur)) \
+                    and (x0 is None or _stalled(obj_list, self.tol)) and self._screening_verified():
+                break
+            if callback is not None and callback(i, obj_list[-1]):
                 break
             i = i + 1
 
-        if PrintOutResult:
-            print('sparsity level: {}'.format(K))
-            print('objective value: {}'.format(self._objective_w(x_cur)))
-            # print('support: {}'.format(np.nonzero(x_cur)[0].tolist()))
-            # print('weight: {}'.format(x_cur[np.nonzero(x_cur)[0].tolist()]))
-            print('  ')
-        self.supp = np.nonzero(x_cur)[0].tolist()
-        self._overwrite(np.squeeze(x_cur)[self.supp], self.supp)
+        self._finish_iht(K, x_cur, i, obj_list, PrintOutResult)
 
-        # for experiment 1 to record convergence
-        # if K == 200:
-        #  np.save('iht-convergence.npy', np.array(obj_list))
+    def _row_window(self, m):
+        """
+        m consecutive projection rows from a uniformly random offset, wrapping around, as a list of one or two slices
+        (views of the tangent vectors). The rows are exchangeable Monte Carlo samples and each one is included with
+        probability m / M, so (M / m) Phi_R^T r_R is an unbiased estimate of Phi^T r.
+        """
+        M = self.T.dim()
+        if m >= M:
+            return [slice(0, M)]
+        s = np.random.randint(M)
+        return [slice(s, s + m)] if s + m <= M else [slice(s, M), slice(0, s + m - M)]
 
-    # Accelerated IHT II (A-IHT II)
-    def _iht_ii(self, K):
-        # parameters setting, k is sparsity
-        Phi = self.T.vecs.T
-        y = self.T.vsum.reshape([-1, 1])
-        stochastic_batch_ratio = self.stochastic_batch_ratio
-        # np.save('Phi.npy', Phi)
-        # np.save('y.npy', y)
-        PrintOutResult = True
+    def _gradient_rows(self, rows, res, idcs=None):
+        # Phi[rows]^T res (restricted to the columns idcs) in the solver coordinates, not rescaled by M / m
+        der = self.T.rdot_rows(rows, res, idcs)
+        self.column_touches += (self.dim if idcs is None else len(idcs)) * res.shape[0] / self.T.dim()
+        if self.precondition:
+            der *= self.scale[:, np.newaxis] if idcs is None else self.scale[idcs, np.newaxis]
+        return der
 
-        (M, N) = Phi.shape
+    def _dot_columns_rows(self, rows, idcs, x):
+        # Phi[rows][:, idcs].dot(x) in the solver coordinates
+        if self.precondition:
+            x = self.scale[idcs, np.newaxis] * x
+        return self.T.dot_columns_rows(rows, idcs, x)
 
-        # Initialize transpose of measurement matrix
-        Phi_t = Phi.T
+    def _a_iht_rows(self, K, debias, x0=None, callback=None):
+        """
+        A-IHT with row minibatches. Each iteration draws a window R of m of the M projection rows (see _row_window)
+        and computes the residual, gradient, step sizes and momentum on it only, with the gradient scaled by M / m,
+        so an iteration costs O(m (N + K)) instead of O(M N). (M / m) ||r_R||^2 is an unbiased estimate of the
+        squared objective and is what obj_list records. The window doubles when the estimate stops improving (its
+        mean over the last 5 iterations is not below the mean over the 5 before) or when the iterates stop moving;
+        the usual stop criterion only applies once the window covers all rows.
+        """
+        y = self.T.sum().reshape([-1, 1])
+        PrintOutResult = True
 
-        # Initialize to zero vector
-        x_cur = np.zeros([N, 1])
-        y_cur = np.zeros([N, 1])
-        #x_cur = np.random.random([N, 1])
-        #y_cur = np.random.random([N, 1])
+        M = self.T.dim()
+        N = self.T.num_vectors()
+        self.column_touches = 0
+        m = min(M, max(1, int(np.ceil(M * self.row_batch_ratio))))
 
-        Phi_x_cur = np.zeros([M, 1])
-        Y_i = []
+        # Initialize to zero vector, or to x0
+        if x0 is None:
+            x_cur = np.zeros([N, 1])
+        else:
+            x_cur = x0 / self.scale[:, np.newaxis] if self.precondition else x0.copy()
+        y_cur = x_cur.copy()
+        Y_i = np.nonzero(x_cur)[0].tolist()
 
         # auxiliary variables
-        complementary_Yi = np.ones([N, 1])
         i = 1
         obj_list = []
+        est = []  # objective estimates at the current window size
+        W = 5  # stall window
+
+        row_batch_sizes = []
 
         while i <= self.max_iter:
             x_prev = x_cur
-            if i == 1:
-                res = y
-                if stochastic_batch_ratio != -1:
-                    Phi_batch = self.stochastic_Phi(Phi, stochastic_batch_ratio)
-                    der = Phi_batch.T.dot(res)
-                else:
-                    der = Phi_t.dot(res)        # compute gradient
-            else:
-                res = y - Phi_x_cur - tau * Phi_diff
-                if stochastic_batch_ratio != -1:
-                    Phi_batch = self.stochastic_Phi(Phi, stochastic_batch_ratio)
-                    der = Phi_batch.T.dot(res)
-                else:
-                    der = Phi_t.dot(res)        # compute gradient
-
-            Phi_x_prev = Phi_x_cur
-            complementary_Yi[Y_i] = 0
-            ind_der = np.flip(np.argsort(np.absolute(np.squeeze(der * complementary_Yi))))
-            complementary_Yi[Y_i] = 1
-            S_i = Y_i + np.squeeze(ind_der[0:K]).tolist()       # identify active subspace
+            rows = self._row_window(m)
+            c = M / m
+            y_R = np.vstack([y[sl] for sl in rows])
+            res = y_R - self._dot_columns_rows(rows, Y_i, y_cur[Y_i])
+            der = c * self._gradient_rows(rows, res)  # estimate gradient
+            S_i = Y_i + self._top_k(der, K, absolute=True, exclude=Y_i).tolist()  # identify active subspace
             ider = der[S_i]
-            Pder = Phi[:, S_i].dot(ider)
-            mu_bar = ider.T.dot(ider) / Pder.T.dot(Pder) / 2    # step size selection
-            b = y_cur + mu_bar * der                            # gradient descent
-            ind_b = np.flip(np.argsort(np.squeeze(b)))
-            ind_b = np.squeeze(ind_b).tolist()
+            Pder = self._dot_columns_rows(rows, S_i, ider)
+            mu_bar = ider.T.dot(ider) / (c * Pder.T.dot(Pder)) / 2  # step size selection
+            b = y_cur + mu_bar * der  # gradient descent
             x_cur = np.zeros([N, 1])
-            S_i_temp = ind_b[0:K]
-            x_cur[S_i_temp] = b[ind_b[0:K]]                     # projection
-            X_i = S_i_temp
-            Phi_x_cur = Phi[:, X_i].dot(x_cur[X_i])
-            res = y - Phi_x_cur
-            if stochastic_batch_ratio != -1:
-                Phi_batch = self.stochastic_Phi(Phi, stochastic_batch_ratio)
-                der = Phi_batch.T.dot(res)
-            else:
-                der = Phi_t.dot(res)                                # compute gradient
-            ider = der[X_i]
-            Pder = Phi[:, X_i].dot(ider)
-            mu_bar = ider.T.dot(ider) / Pder.T.dot(Pder) / 2    # step size selection
-            x_cur[X_i] = x_cur[X_i] + mu_bar * ider             # debias
-            x_cur[x_cur < 0] = 0                                # hard threshold negative entries
-
-            Phi_x_cur = Phi[:, X_i].dot(x_cur[X_i])
-            res = y - Phi_x_cur
+            X_i = self._top_k(b, K).tolist()
+            x_cur[X_i] = b[X_i]  # projection
+            if debias:
+                res = y_R - self._dot_columns_rows(rows, X_i, x_cur[X_i])
+                ider = c * self._gradient_rows(rows, res, X_i)  # estimate gradient on the support only
+                Pder = self._dot_columns_rows(rows, X_i, ider)
+                temp = c * Pder.T.dot(Pder)
+                if temp > 0:
+                    mu_bar = ider.T.dot(ider) / temp / 2  # step size selection
+                    x_cur[X_i] = x_cur[X_i] + mu_bar * ider  # debias
+            x_cur[x_cur < 0] = 0  # truncate negative entries
 
-            if i == 1:
-                Phi_diff = Phi_x_cur
-            else:
-                Phi_diff = Phi_x_cur - Phi_x_prev
+            res = y_R - self._dot_columns_rows(rows, X_i, x_cur[X_i])
+            D_i = np.union1d(X_i, np.nonzero(x_prev)[0]).astype(np.int64)
+            Phi_diff = self._dot_columns_rows(rows, D_i, x_cur[D_i] - x_prev[D_i])
 
             temp = Phi_diff.T.dot(Phi_diff)
             if temp > 0:
@@ -296,52 +1019,287 @@ class IHTCoreset(Coreset):
             y_cur = x_cur + tau * (x_cur - x_prev)
             Y_i = np.nonzero(y_cur)[0].tolist()
 
-            # print out objective function value during optimization of IHT
-            if i % 50 == -1:
-                print('after iteration {}:'.format(i))
-                print('objective value: {}'.format(self._objective_w(x_cur)))
-                print('  ')
+            obj_list.append(np.sqrt(c * res.T.dot(res).item()))  # unbiased estimate of the squared objective
+            est.append(obj_list[-1] ** 2)
+            row_batch_sizes.append(m)
 
-            # for experiment 1 to record convergence
-            # if K == 200:
-            #  obj_list.append(self._objective_w(x_cur))
+            # stop criterion on all rows; otherwise grow the window when the estimate or the iterates stall
+            converged = i > 1 and (np.linalg.norm(x_cur - x_prev) < self.tol * np.linalg.norm(x_cur)) \
+                and (x0 is None or _stalled(obj_list, self.tol))
+            if m == M:
+                if converged:
+                    break
+            elif converged or (len(est) >= 2 * W and np.mean(est[-W:]) >= np.mean(est[-2 * W:-W])):
+                m = min(2 * m, M)
+                est = []
+            if callback is not None and callback(i, obj_list[-1]):
+                break
+            i = i + 1
+
+        self.row_batch_sizes = row_batch_sizes
+        self._finish_iht(K, x_cur, i, obj_list, PrintOutResult)
+
+    def _stream_gradient(self, res, Y_i, K):
+        """
+        Fused gradient and selection: g = Phi^T res (solver coordinates) is computed stream_block columns at a time and
+        only what the support steps can use is kept, i.e., g on the sorted support Y_i, and the running top K of |g|
+        and of g outside of Y_i (as index and value arrays). Working memory O(K + stream_block) instead of O(N).
+        """
+        N = self.dim
+        B = self.stream_block
+        g_Y = np.zeros(Y_i.shape[0])
+        a_idx = p_idx = np.zeros(0, dtype=np.int64)
+        a_val = p_val = np.zeros(0)
+        for s in range(0, N, B):
+            e = min(N, s + B)
+            g = self.T.rdot_range(s, e, res)[:, 0]
+            if self.precondition:
+                g *= self.scale[s:e]
+            lo, hi = np.searchsorted(Y_i, [s, e])
+            in_Y = Y_i[lo:hi] - s
+            g_Y[lo:hi] = g[in_Y]
+            a_idx, a_val = _merge_top(a_idx, a_val, g, in_Y, s, K, absolute=True)
+            p_idx, p_val = _merge_top(p_idx, p_val, g, in_Y, s, K, absolute=False)
+        self.column_touches += N
+        return g_Y, a_idx, a_val, p_idx, p_val
+
+    def _a_iht_stream(self, K, debias, x0=None, callback=None):
+        """
+        A-IHT with the fused gradient and selection of _stream_gradient and sparse iterates (sorted index and value
+        arrays), so no N-vector is formed during the iterations. Off the support Y_i of the extrapolated point,
+        b = mu g, so the active subspace is Y_i and the top K of |g| outside of it, and the top K of b lies in Y_i, the
+        top K of |g| and the top K of g.
+        """
+        y = self.T.sum().reshape([-1, 1])
+        PrintOutResult = True
+        M = self.T.dim()
+        self.column_touches = 0
+
+        # sparse iterates: x_cur and the extrapolated point y_cur, nonzero entries only
+        if x0 is None:
+            x_idx = np.zeros(0, dtype=np.int64)
+            x_val = np.zeros(0)
+        else:
+            x_idx = np.nonzero(x0[:, 0])[0]
+            x_val = x0[x_idx, 0] / self.scale[x_idx] if self.precondition else x0[x_idx, 0]
+        y_idx, y_val = x_idx, x_val
+
+        Phi_x_cur = self._dot_columns(x_idx, x_val[:, np.newaxis])
+        Phi_diff = np.zeros([M, 1])
+        tau = 0.
+        i = 1
+        obj_list = []
+
+        while i <= self.max_iter:
+            x_idx_prev, x_val_prev = x_idx, x_val
+            res = y - Phi_x_cur - tau * Phi_diff
+            g_Y, a_idx, a_val, p_idx, p_val = self._stream_gradient(res, y_idx, K)  # fused gradient and selection
+            Phi_x_prev = Phi_x_cur
+            S_i = np.concatenate((y_idx, a_idx))  # identify active subspace
+            ider = np.concatenate((g_Y, a_val))[:, np.newaxis]
+            mu_bar = (ider.T.dot(ider) / self._sq_norm_columns(S_i, ider) / 2).item()  # step size selection
+            U, first = np.unique(np.concatenate((y_idx, a_idx, p_idx)), return_index=True)
+            g_U = np.concatenate((g_Y, a_val, p_val))[first]
+            b = mu_bar * g_U  # gradient descent on the candidates
+            b[np.searchsorted(U, y_idx)] += y_val
+            top = np.flip(np.argsort(b))[0:K]
+            X_i = U[top]
+            x_val = b[top]  # projection
+            order = np.argsort(X_i)
+            X_i = X_i[order]
+            x_val = x_val[order]
+            if debias:
+                res = y - self._dot_columns(X_i, x_val[:, np.newaxis])
+                ider = self._gradient(res, X_i)  # compute gradient on the support only
+                temp = self._sq_norm_columns(X_i, ider)
+                if temp > 0:
+                    x_val = x_val + (ider.T.dot(ider) / temp / 2).item() * ider[:, 0]  # debias
+            x_idx = X_i[x_val > 0]  # truncate negative entries
+            x_val = x_val[x_val > 0]
+
+            Phi_x_cur = self._dot_columns(x_idx, x_val[:, np.newaxis])
+            res = y - Phi_x_cur
+            Phi_diff = Phi_x_cur - Phi_x_prev
+
+            temp = Phi_diff.T.dot(Phi_diff)
+            if temp > 0:
+                tau = (res.T.dot(Phi_diff) / temp).item()
+            else:
+                tau = (res.T.dot(Phi_diff) / 1e-6).item()
+
+            # y_cur = x_cur + tau (x_cur - x_prev), on the union of the two supports
+            V = np.union1d(x_idx, x_idx_prev)
+            xc = np.zeros(V.shape[0])
+            xc[np.searchsorted(V, x_idx)] = x_val
+            xp = np.zeros(V.shape[0])
+            xp[np.searchsorted(V, x_idx_prev)] = x_val_prev
+            yc = xc + tau * (xc - xp)
+            y_idx = V[yc != 0]
+            y_val = yc[yc != 0]
+
+            # record convergence; res is the residual of x_cur, so this is O(M)
+            obj_list.append(np.sqrt(res.T.dot(res).item()))
 
             # stop criterion
-            if (i > 1) and (np.linalg.norm(x_cur - x_prev) < self.tol * np.linalg.norm(x_cur)):
+            if i > 1 and (np.linalg.norm(xc - xp) < self.tol * np.linalg.norm(xc)) \
+                    and (x0 is None or _stalled(obj_list, self.tol)):
+                break
+            if callback is not None and callback(i, obj_list[-1]):
                 break
             i = i + 1
 
+        self.iter_iht = i
+        self.obj_list = obj_list
+        if self.precondition:
+            x_val = self.scale[x_idx] * x_val  # map back to the original coordinates
+        self.supp = x_idx.tolist()
+        self._overwrite(x_val, x_idx)
+        self._set_residual(y - self.T.dot_columns(x_idx, x_val[:, np.newaxis]))
+        if PrintOutResult:
+            print('sparsity level: {}, after iteration {}:'.format(K, i))
+            print('objective value: {}'.format(self.err))
+            print('  ')
+
+    def _finish_iht(self, K, x_cur, i, obj_list, PrintOutResult):
+        # map the solver iterate x_cur back, store it as the coreset and its exact residual
+        y = self.T.sum().reshape([-1, 1])
+        self.iter_iht = i
+        self.obj_list = obj_list
+        if self.precondition:
+            x_cur = self.scale[:, np.newaxis] * x_cur  # map back to the original coordinates
         if PrintOutResult:
-            print('after iteration {}:'.format(i))
+            print('sparsity level: {}, after iteration {}:'.format(K, i))
             print('objective value: {}'.format(self._objective_w(x_cur)))
             print('  ')
         self.supp = np.nonzero(x_cur)[0].tolist()
-        self._overwrite(np.squeeze(x_cur)[self.supp], self.supp)
-
-        # for experiment 1 to record convergence
-        # if K == 200:
-        #  print('saving convergence at M=200')
-        #  np.savez('obj.npz', Phi=Phi, y=y)
-        #  np.save('iht-2-convergence.npy', np.array(obj_list))
+        self._overwrite(np.squeeze(x_cur, axis=1)[self.supp], np.array(self.supp, dtype=np.int64))
+        self._set_residual(y - self.T.dot_columns(self.supp, x_cur[self.supp]))
 
     def reset(self):
-        self.snnls.reset()
+        # once the tangent space is set up, the empty coreset's residual is the sum of the tangent vectors; before,
+        # there is nothing to reset, the residual is set up with the tangent space on first use
+        if '_tsf' not in self.__dict__:
+            self._set_residual(self.T.sum().reshape([-1, 1]))
+        self.init = self._init_arg
         super().reset()
 
+    def _multistart(self, K):
+        """
+        Run one build per starting point in self.start_inits, in a process pool, and keep the lowest objective.
+        The tangent vectors are copied once into shared memory; each worker wraps them in its own IHTCoreset without
+        copying. The best finished objective is shared between the workers so that laggards can stop early.
+        """
+        vecs = self.T.vecs
+        seeds = np.random.randint(2 ** 31 - 1, size=self.n_starts)
+        ctx = multiprocessing.get_context()
+        best = ctx.Value('d', np.inf)
+        shm = shared_memory.SharedMemory(create=True, size=vecs.nbytes)
+        try:
+            vecs_shared = np.ndarray(vecs.shape, dtype=vecs.dtype, buffer=shm.buf)
+            vecs_shared[:] = vecs
+            with ProcessPoolExecutor(max_workers=self.n_workers, mp_context=ctx, initializer=_start_worker_init,
+                                     initargs=(shm.name, vecs.shape, best)) as pool:
+                futures = [pool.submit(_start_worker, self._start_kw, K, init, seed, self.cancel_margin)
+                           for (init, seed) in zip(self.start_inits, seeds)]
+                results = [f.result() for f in futures]
+            del vecs_shared
+        finally:
+            shm.close()
+            shm.unlink()
+
+        self.start_objs = [r[2] for r in results]
+        j = int(np.argmin(self.start_objs))
+        wts, idcs, _, self.iter_iht, self.obj_list, _ = results[j]
+        self.log.info('best of {} starts: {} ({}), objective {}'.format(self.n_starts, j, self.start_inits[j],
+                                                                       self.start_objs[j]))
+        self.supp = idcs.tolist()
+        self._overwrite(wts, idcs)
+        self._set_residual(self.gram.y - self.T.dot_columns(idcs, wts[:, np.newaxis]))
+
     def _build(self, itrs, sz):
-        if self.iht_mode == 'IHT':
+        if self.iht_mode not in ('IHT', 'IHT-2'):
+            raise ValueError('IHT mode error: should be IHT or IHT-2')
+        if self.column_cache is not None:
+            self.column_cache.reset_stats()
+        if self.n_starts > 1:
+            self._multistart(sz)
+        elif self.iht_mode == 'IHT':
             self._iht(sz)
-        elif self.iht_mode == 'IHT-2':
-            self._iht_ii(sz)
         else:
-            raise ValueError('IHT mode error: should be IHT or IHT-2')
+            self._iht_ii(sz)
         # w = self.snnls.weights()
         # self._overwrite(w[w>0], np.where(w>0)[0])
 
     def _optimize(self):
-        self.snnls.optimize()
-        w = self.snnls.weights()
-        self._overwrite(w[w > 0], np.where(w > 0)[0])
+        # support-restricted nnls polish; the Gram factor is updated incrementally from the previous support
+        if self.nwts == 0:
+            return
+        self.gram.update(self.idcs)
+        w = self.gram.nnls()
+        self._overwrite(w[w > 0], self.gram.idcs[w > 0])
+        self._set_residual(self.gram.y - self.T.dot_columns(self.idcs, self.wts[:, np.newaxis]))
 
     def error(self):
-        return self.snnls.error()
+        return self.err
+
+
+def _stalled(obj_list, tol):
+    # after a warm start the seed weights can dominate ||x|| (greedy solutions put large weights on a few points), so
+    # the relative step criterion fires while the new points are still growing; the objective has to stall as well
+    return abs(obj_list[-2] - obj_list[-1]) < tol * obj_list[-1]
+
+
+def _merge_top(idx, val, g, excl, offset, K, absolute):
+    # merge the entries of the block g (block indices + offset) with the K largest g (|g|), outside of the block indices
+    # excl, into the running top K given by the index and value arrays idx, val
+    key = np.fabs(g) if absolute else g.copy()
+    key[excl] = -np.inf
+    if key.shape[0] > K:
+        blk = np.argpartition(key, key.shape[0] - K)[key.shape[0] - K:]
+    else:
+        blk = np.arange(key.shape[0])
+    blk = blk[key[blk] > -np.inf]
+    idx = np.concatenate((idx, blk + offset))
+    val = np.concatenate((val, g[blk]))
+    if idx.shape[0] > K:
+        keep = np.argpartition(np.fabs(val) if absolute else val, idx.shape[0] - K)[idx.shape[0] - K:]
+        idx = idx[keep]
+        val = val[keep]
+    return idx, val
+
+
+_start_vecs = None
+_start_best = None
+
+
+def _start_worker_init(shm_name, shape, best):
+    # attach the shared tangent vectors once per worker process
+    global _start_shm, _start_vecs, _start_best
+    _start_shm = shared_memory.SharedMemory(name=shm_name)
+    _start_vecs = np.ndarray(shape, dtype=np.float64, buffer=_start_shm.buf)
+    _start_best = best
+
+
+def _start_worker(kw, K, init, seed, cancel_margin):
+    # one start of IHTCoreset._multistart
+    coreset = IHTCoreset(lambda: _start_vecs, _start_vecs.shape[1], **kw)
+    best = _start_best
+    cancelled = [False]
+    obj_prev = [np.inf]
+
+    def callback(i, obj):
+        # stop a start that is far above the best finished one and, at its progress over the last 10 iterations,
+        # would not reach it within the remaining iterations
+        if i % 10 == 0:
+            if obj > (1. + cancel_margin) * best.value and \
+                    obj - (obj_prev[0] - obj) * (coreset.max_iter - i) / 10. > best.value:
+                cancelled[0] = True
+            obj_prev[0] = obj
+        return cancelled[0]
+
+    np.random.seed(seed)
+    coreset._a_iht(K, kw['iht_mode'] == 'IHT-2', x0=coreset._init_point(K, init, seed), callback=callback)
+    if not cancelled[0]:
+        with best.get_lock():
+            best.value = min(best.value, coreset.err)
+    return coreset.wts.copy(), coreset.idcs.copy(), coreset.err, coreset.iter_iht, coreset.obj_list, cancelled[0]
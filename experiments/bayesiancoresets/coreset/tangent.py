@@ -1,14 +1,330 @@
+import multiprocessing
+import os
+import tempfile
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import numpy as np
+from scipy.special import ndtri
+from scipy.stats import qmc as scipy_qmc
+
+# materialized tangent matrices of shared factories: factory -> {(seed, proj_dim): read-only vecs}
+_shared_tangent_spaces = weakref.WeakKeyDictionary()
 
 
 class BayesianTangentSpaceFactory(object):
-    def __init__(self, loglike, sampler, proj_dim):
+    def __init__(self, loglike, sampler, proj_dim, shared=False, seed=None, chunk_size=None, n_rows=None,
+                 row_chunk_size=65536, memmap=None, executor=None, n_workers=None):
+        """
+        :param shared: if True, calls without weights (w=None, ids=None) return one tangent matrix per (seed,
+        proj_dim), materialized on the first call and shared read-only by every coreset built from this factory
+        in the process (see shared_tangent_space); calls with weights always draw a new projection.
+        :param seed: if not None, the shared tangent matrix is drawn with this numpy seed, without disturbing the
+        global random state.
+        :param chunk_size: if not None, evaluate the log-likelihoods in blocks of this many parameter samples,
+        written into one preallocated output and centered in place (see _draw_chunked).
+        :param n_rows: if not None (the number of data points), also block over the data: loglike is then called as
+        loglike(prms, rows) with rows a slice of at most row_chunk_size data points, so its temporaries are bounded
+        by the block instead of by N.
+        :param memmap: if not None, a file path; chunked outputs are written to a numpy memmap (.npy format) there
+        instead of memory.
+        :param executor: None, 'thread' or 'process': evaluate the blocks in a pool of n_workers (default: the number
+        of CPUs) threads or processes, which write directly into the output. Processes share it as a file-backed
+        memmap (memmap, or a temporary file unlinked once filled) and get loglike and the samples from the pool
+        initializer, which does not pickle them under the 'fork' start method. Without chunk_size, the samples (with
+        n_rows, the data points) are split evenly over the workers.
+        """
         self.proj_dim = proj_dim
         self.loglike = loglike
         self.sampler = sampler
+        self.shared = shared
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.n_rows = n_rows
+        self.row_chunk_size = row_chunk_size
+        self.memmap = memmap
+        if executor not in (None, 'thread', 'process'):
+            raise ValueError(self.__class__.__name__ + '.__init__(): executor must be None, \'thread\' or \'process\'')
+        self.executor = executor
+        self.n_workers = n_workers
 
     def __call__(self, w=None, ids=None):
+        if self.shared and w is None and ids is None:
+            return shared_tangent_space(self, self.seed)
+        return self._draw(w, ids)
+
+    def stream(self, w=None, ids=None, seed=None):
+        """
+        Streaming counterpart of __call__ for data sets whose (N, S) tangent matrix does not fit in memory: draw the S
+        parameter samples (with the numpy seed, if not None, without disturbing the global random state) and return a
+        TangentStream that re-evaluates the centered tangent vectors of any rows on demand. Requires n_rows.
+        """
+        if self.n_rows is None:
+            raise ValueError(self.__class__.__name__ + '.stream(): n_rows must be set, loglike is called on row blocks')
+        prms = _seeded(seed, lambda: self.sampler(self.proj_dim, w, ids))
+        return TangentStream(self.loglike, prms, self.n_rows, self.row_chunk_size)
+
+    def progressive(self, batch_dim, max_dim, w=None, ids=None, seed=None):
+        """
+        Generator of tangent matrices with batch_dim, 2 batch_dim, ... (at most max_dim) projection samples: each step
+        evaluates the log-likelihoods of batch_dim new samples only, appends them and re-centers the rows in place
+        (the row means are kept), so a coreset can be re-solved after every batch until its error stabilizes (see
+        build_adaptive). The samples of batch k are drawn with the numpy seed seed + k if seed is not None. The yielded
+        (N, S) arrays are views of one (N, max_dim) buffer, valid until the next step.
+        """
+        vecs = None
+        S = 0
+        for k in range(-(-max_dim // batch_dim)):
+            B = min(batch_dim, max_dim - S)
+            prms = _seeded(None if seed is None else seed + k, lambda: self.sampler(B, w, ids))
+            blk = self.loglike(prms)
+            if vecs is None:
+                vecs = np.empty((blk.shape[0], max_dim))
+                mean = np.zeros(blk.shape[0])
+            new_mean = (S * mean + blk.sum(axis=1)) / (S + B)
+            vecs[:, :S] += (mean - new_mean)[:, np.newaxis]
+            blk -= new_mean[:, np.newaxis]
+            vecs[:, S:S + B] = blk
+            mean = new_mean
+            S += B
+            yield vecs[:, :S]
+
+    def _draw(self, w=None, ids=None):
         prms = self.sampler(self.proj_dim, w, ids)
+        if self.chunk_size is not None or self.n_rows is not None or self.executor is not None \
+                or self.memmap is not None:
+            return self._draw_chunked(prms)
         vecs = self.loglike(prms)
         vecs -= vecs.mean(axis=1)[:, np.newaxis]
         return vecs
+
+    def _draw_chunked(self, prms):
+        """
+        Fill the (N, S) tangent matrix block by block. Without n_rows, the blocks are all data points times
+        chunk_size samples, the row sums are accumulated on the way and the rows are centered in place at the end
+        (the first block is evaluated up front, as it tells N). With n_rows, each block of data points is filled over
+        all samples and centered right away. Peak memory is the output plus one block per worker.
+        """
+        S = prms.shape[0]
+        W = 1 if self.executor is None else (self.n_workers or os.cpu_count() or 1)
+        B = self.chunk_size if self.chunk_size is not None else -(-S // W)
+        N = self.n_rows
+        first = None
+        if N is None:
+            first = self.loglike(prms[:B])
+            N = first.shape[0]
+        R = self.row_chunk_size if self.chunk_size is not None or self.executor is None else -(-N // W)
+
+        path = self.memmap
+        if self.executor == 'process' and path is None:
+            fd, path = tempfile.mkstemp(suffix='.npy', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+            os.close(fd)
+        try:
+            if path is None:
+                # a first block over all samples is the output itself
+                vecs = first if first is not None and first.shape[1] == S else np.empty((N, S))
+            else:
+                vecs = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=(N, S))
+            if first is not None:
+                if vecs is not first:
+                    vecs[:, :first.shape[1]] = first
+                rsum = first.sum(axis=1)
+                del first
+                tasks = [(_fill_samples, a, a + B) for a in range(B, S, B)]
+            else:
+                tasks = [(_fill_rows, r, min(N, r + R), B) for r in range(0, N, R)]
+
+            if self.executor is None:
+                results = [task[0](self.loglike, prms, vecs, *task[1:]) for task in tasks]
+            elif self.executor == 'thread':
+                with ThreadPoolExecutor(max_workers=W) as pool:
+                    results = [f.result() for f in
+                               [pool.submit(task[0], self.loglike, prms, vecs, *task[1:]) for task in tasks]]
+            else:
+                vecs.flush()
+                with ProcessPoolExecutor(max_workers=W, mp_context=multiprocessing.get_context(),
+                                         initializer=_tangent_worker_init,
+                                         initargs=(self.loglike, prms, path)) as pool:
+                    results = [f.result() for f in [pool.submit(_tangent_worker, *task) for task in tasks]]
+        finally:
+            if self.executor == 'process' and self.memmap is None:
+                os.unlink(path)  # the parent's mapping stays valid
+
+        if self.n_rows is None:
+            # center with the accumulated row sums
+            for blk_sum in results:
+                rsum += blk_sum
+            rmean = rsum / S
+            R = self.row_chunk_size
+            for r in range(0, N, R):
+                vecs[r:r + R] -= rmean[r:r + R, np.newaxis]
+        if self.memmap is not None:
+            vecs.flush()
+        return vecs
+
+
+def _fill_samples(loglike, prms, vecs, a, b):
+    # write the log-likelihoods of the samples a:b into vecs and return their row sums
+    blk = loglike(prms[a:b])
+    vecs[:, a:b] = blk
+    return blk.sum(axis=1)
+
+
+def _fill_rows(loglike, prms, vecs, r0, r1, B):
+    # fill the data points r0:r1 over all samples, B samples at a time, and center them
+    rows = slice(r0, r1)
+    for a in range(0, prms.shape[0], B):
+        vecs[rows, a:a + B] = loglike(prms[a:a + B], rows)
+    vecs[rows] -= vecs[rows].mean(axis=1)[:, np.newaxis]
+
+
+def _tangent_worker_init(loglike, prms, path):
+    # map the shared output once per worker process
+    global _worker_loglike, _worker_prms, _worker_vecs
+    _worker_loglike = loglike
+    _worker_prms = prms
+    _worker_vecs = np.load(path, mmap_mode='r+')
+
+
+def _tangent_worker(fill, *args):
+    return fill(_worker_loglike, _worker_prms, _worker_vecs, *args)
+
+
+class TangentStream(object):
+    """
+    Tangent vectors of N data points for a fixed set of parameter samples prms, never materialized as a whole: the
+    rows are evaluated by loglike(prms, rows) and centered when they are read, either selected rows (rows) or
+    the whole matrix in row blocks of block_rows points (blocks), so one pass holds O(block_rows * S) memory. As prms
+    is fixed, every pass sees the same vectors. The one-pass reductions below serve the coreset algorithms that
+    accept a stream (IHTCoreset, HilbertCoreset with StreamingGIGA, importance sampling).
+    """
+
+    def __init__(self, loglike, prms, n_rows, block_rows=65536):
+        self.loglike = loglike
+        self.prms = prms
+        self.n_rows = n_rows
+        self.block_rows = block_rows
+
+    def dim(self):
+        return self.prms.shape[0]
+
+    def rows(self, rows):
+        # centered tangent vectors of rows (a slice, or an integer or boolean index array), shape (len(rows), S)
+        if not isinstance(rows, slice):
+            rows = np.asarray(rows)
+            rows = np.flatnonzero(rows) if rows.dtype == bool else rows.astype(np.int64)
+            if rows.shape[0] == 0:
+                return np.zeros((0, self.dim()))
+        vecs = self.loglike(self.prms, rows)
+        vecs -= vecs.mean(axis=1)[:, np.newaxis]
+        return vecs
+
+    def blocks(self):
+        # one pass over the data: yields (start, stop, vecs[start:stop])
+        for s in range(0, self.n_rows, self.block_rows):
+            e = min(self.n_rows, s + self.block_rows)
+            yield s, e, self.rows(slice(s, e))
+
+    def sum_norms(self):
+        # vecs.sum(axis=0) and the row norms, in one pass
+        vsum = np.zeros(self.dim())
+        vnorms = np.zeros(self.n_rows)
+        for s, e, vecs in self.blocks():
+            vsum += vecs.sum(axis=0)
+            vnorms[s:e] = np.sqrt(np.einsum('ij,ij->i', vecs, vecs))
+        return vsum, vnorms
+
+    def rdot(self, r):
+        # vecs.dot(r) for r of shape (S, k), in one pass
+        out = np.empty((self.n_rows,) + r.shape[1:])
+        for s, e, vecs in self.blocks():
+            out[s:e] = vecs.dot(r)
+        return out
+
+
+class GaussianSampler(object):
+    """
+    Sampler of N(mu, cov) with the signature sampler(sz, w, ids) of BayesianTangentSpaceFactory (w and ids are
+    ignored). The factor L with L L^T = cov is computed once (Cholesky, or a symmetric eigendecomposition if cov is
+    only positive semidefinite), so each draw is mu + Z L^T for standard normal Z, O(sz d^2) instead of the O(d^3)
+    factorization np.random.multivariate_normal repeats on every call.
+    """
+
+    def __init__(self, mu, cov, antithetic=False, qmc=None):
+        """
+        :param antithetic: if True, draw the samples in pairs mu +- L z, so the draws of a call have mean exactly mu
+        and the odd parts of the log-likelihoods cancel in the Monte Carlo estimates.
+        :param qmc: None, 'sobol' or 'halton': take z from a scrambled low-discrepancy sequence (scipy.stats.qmc,
+        mapped through the normal quantile function) instead of pseudo-random numbers, so the tangent-space inner
+        products converge faster in proj_dim. Each call scrambles a new sequence, seeded from numpy's global random
+        state; combines with antithetic. Sobol points are balanced only in sets of 2^m, so 'sobol' calls for a
+        number of draws that is not a power of 2 (after halving, if antithetic) use a Halton sequence instead.
+        """
+        self.mu = np.asarray(mu, dtype=np.float64)
+        self.cov = np.atleast_2d(np.asarray(cov, dtype=np.float64))
+        if self.cov.shape != (self.mu.shape[0], self.mu.shape[0]):
+            raise ValueError(self.__class__.__name__ + '.__init__(): cov must have shape (d, d) for mu of length d')
+        self.antithetic = antithetic
+        if qmc not in (None, 'sobol', 'halton'):
+            raise ValueError(self.__class__.__name__ + '.__init__(): qmc must be None, \'sobol\' or \'halton\'')
+        self.qmc = qmc
+        try:
+            self.L = np.linalg.cholesky(self.cov)
+        except np.linalg.LinAlgError:
+            lmb, V = np.linalg.eigh(self.cov)
+            if lmb.min() < -1e-8 * max(lmb.max(), 0.):
+                raise ValueError(self.__class__.__name__ + '.__init__(): cov must be positive semidefinite')
+            self.L = V * np.sqrt(np.maximum(lmb, 0.))
+
+    def __call__(self, sz, w=None, ids=None):
+        return self.draw(sz)
+
+    def draw(self, sz):
+        # (sz, d) samples
+        n = (sz + 1) // 2 if self.antithetic else sz
+        z = self._standard_normal(n).dot(self.L.T)
+        if self.antithetic:
+            z = np.vstack((z, -z))[:sz]
+        return self.mu + z
+
+    def _standard_normal(self, n):
+        d = self.mu.shape[0]
+        if self.qmc is None:
+            return np.random.standard_normal((n, d))
+        seed = np.random.randint(2 ** 31 - 1)
+        m = int(np.log2(n)) if n > 0 else 0
+        if self.qmc == 'sobol' and 2 ** m == n:
+            u = scipy_qmc.Sobol(d, seed=seed).random_base2(m)
+        else:
+            u = scipy_qmc.Halton(d, seed=seed).random(n)
+        return ndtri(np.clip(u, 1e-12, 1. - 1e-12))
+
+
+def _seeded(seed, draw):
+    # draw() under the numpy seed, if not None, restoring the global random state afterwards
+    if seed is None:
+        return draw()
+    state = np.random.get_state()
+    np.random.seed(seed)
+    try:
+        return draw()
+    finally:
+        np.random.set_state(state)
+
+
+def shared_tangent_space(factory, seed=None):
+    """
+    Tangent matrix of factory for the key (seed, factory.proj_dim), drawn once and cached for as long as the factory
+    lives. The returned array is read-only; consumers that need to modify it must copy it.
+    """
+    cache = _shared_tangent_spaces.setdefault(factory, {})
+    key = (seed, factory.proj_dim)
+    if key not in cache:
+        vecs = _seeded(seed, factory._draw)
+        vecs.setflags(write=False)
+        cache[key] = vecs
+    return cache[key]
+
+
+def clear_shared_tangent_spaces():
+    _shared_tangent_spaces.clear()
@@ -1,5 +1,5 @@
 from .frankwolfe import FrankWolfe
-from .giga import GIGA
+from .giga import GIGA, StreamingGIGA
 from .orthopursuit import OrthoPursuit
-from .sampling import ImportanceSampling, UniformSampling
+from .sampling import ImportanceSampling, UniformSampling, StreamingImportanceSampling, StreamingUniformSampling
 # from .lar import LAR
@@ -6,8 +6,16 @@ from ..util.errors import NumericalPrecisionError
 
 class FrankWolfe(SparseNNLS):
 
-    def __init__(self, A, b):
+    def __init__(self, A, b, variant='vanilla'):
+        """
+        :param variant: 'vanilla', 'away' or 'pairwise'. Away-step FW may instead move the iterate away from the
+        worst vertex of the support, pairwise FW moves weight from that vertex to the selected one. Both can drop
+        points from the support and converge linearly on the polytope, where vanilla FW zig-zags.
+        """
         super().__init__(A, b)
+        if variant not in ('vanilla', 'away', 'pairwise'):
+            raise ValueError(self.alg_name + '.__init__(): variant must be \'vanilla\', \'away\' or \'pairwise\'')
+        self.variant = variant
 
         self.Anorms = np.sqrt((self.A ** 2).sum(axis=0))
         if np.any(self.Anorms == 0):
@@ -15,29 +23,71 @@ class FrankWolfe(SparseNNLS):
         self.An = self.A / self.Anorms
 
     def _select(self):
-        residual = self.b - self.A.dot(self.w)
+        residual = self._residual()
         return (self.An.T.dot(residual)).argmax()
 
     def _reweight(self, f):
         if self.size() == 0:
             # special case if this is the first point to add (places iterate on constraint polytope)
-            alpha = 0.
-            beta = self.Anorms.sum() / self.Anorms[f]
+            self._step(0., f, self.Anorms.sum() / self.Anorms[f])
+        elif self.variant == 'vanilla':
+            self._fw_step(f)
         else:
-            nsum = self.Anorms.sum()
-            nf = self.Anorms[f]
-            xw = self.A.dot(self.w)
-            xf = self.A[:, f]
+            self._away_step(f)
 
-            gammanum = (nsum / nf * xf - xw).dot(self.b - xw)
-            gammadenom = ((nsum / nf * xf - xw) ** 2).sum()
+    def _fw_step(self, f):
+        nsum = self.Anorms.sum()
+        nf = self.Anorms[f]
+        xw = self._current_Aw()
+        xf = self.A[:, f]
 
-            if gammanum < 0. or gammadenom == 0. or gammanum > gammadenom:
-                raise NumericalPrecisionError(
-                    'precision loss in gammanum/gammadenom: num = ' + str(gammanum) + ' denom = ' + str(gammadenom))
+        gammanum = (nsum / nf * xf - xw).dot(self.b - xw)
+        gammadenom = ((nsum / nf * xf - xw) ** 2).sum()
 
-            alpha = 1. - gammanum / gammadenom
-            beta = nsum / nf * gammanum / gammadenom
+        if gammanum < 0. or gammadenom == 0. or gammanum > gammadenom:
+            raise NumericalPrecisionError(
+                'precision loss in gammanum/gammadenom: num = ' + str(gammanum) + ' denom = ' + str(gammadenom))
 
-        self.w = alpha * self.w
-        self.w[f] = max(0., self.w[f] + beta)
+        alpha = 1. - gammanum / gammadenom
+        beta = nsum / nf * gammanum / gammadenom
+        self._step(alpha, f, beta, xf)
+
+    def _away_step(self, f):
+        # the vertices of the polytope are nsum / n_j A[:, j]; the iterate A w has the barycentric coordinates
+        # w_j n_j / nsum. The away vertex is the support vertex least aligned with the residual.
+        nsum = self.Anorms.sum()
+        xw = self._current_Aw()
+        r = self.b - xw
+        supp = self._nz[self.w[self._nz] > 0]
+        a = supp[self.An[:, supp].T.dot(r).argmin()]
+        na = self.Anorms[a]
+        xa = self.A[:, a]
+        lam_a = self.w[a] * na / nsum
+
+        if self.variant == 'away':
+            if lam_a >= 1. or (nsum / self.Anorms[f] * self.A[:, f] - xw).dot(r) >= (xw - nsum / na * xa).dot(r):
+                # the FW direction is the steeper one
+                self._fw_step(f)
+                return
+            d = xw - nsum / na * xa
+            gammamax = lam_a / (1. - lam_a)
+        else:
+            d = nsum / self.Anorms[f] * self.A[:, f] - nsum / na * xa
+            gammamax = lam_a
+
+        gammanum = d.dot(r)
+        gammadenom = (d ** 2).sum()
+        if gammanum < 0. or gammadenom == 0.:
+            raise NumericalPrecisionError(
+                'precision loss in gammanum/gammadenom: num = ' + str(gammanum) + ' denom = ' + str(gammadenom))
+        gamma = min(gammanum / gammadenom, gammamax)
+
+        if self.variant == 'away':
+            # w <- (1 + gamma) w - gamma nsum / na e_a; a drop step zeroes w_a exactly
+            beta = -(1. + gamma) * self.w[a] if gamma == gammamax else -gamma * nsum / na
+            self._step(1. + gamma, a, beta, xa)
+        else:
+            # move gamma of barycentric weight from a to f; a drop step zeroes w_a exactly
+            beta = -self.w[a] if gamma == gammamax else -gamma * nsum / na
+            self._step(1., f, gamma * nsum / self.Anorms[f], self.A[:, f])
+            self._step(1., a, beta, xa)
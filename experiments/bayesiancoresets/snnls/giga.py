@@ -1,14 +1,23 @@
 import numpy as np
 
-from .snnls import SparseNNLS
+from .snnls import SparseNNLS, StreamingSparseNNLS
 from .. import util
 from ..util.errors import NumericalPrecisionError
+from ..util.quantize import quantize_rows, dot_quantized
 
 
 class GIGA(SparseNNLS):
 
-    def __init__(self, A, b):
+    def __init__(self, A, b, quantize=None):
+        """
+        :param quantize: if 'int8', score the columns on a row-wise int8 copy of the normalized columns (see
+        util.quantize) and recompute exactly only the columns whose score bounds leave the argmax open, so the
+        selected point is the exact one (see _select_quantized).
+        """
         super().__init__(A, b)
+        if quantize not in (None, 'int8'):
+            raise ValueError(self.alg_name + '.__init__(): quantize must be None or \'int8\'')
+        self.quantize = quantize
 
         Anorms = np.sqrt((self.A ** 2).sum(axis=0))
         if np.any(Anorms == 0):
@@ -19,9 +28,19 @@ class GIGA(SparseNNLS):
         if self.bnorm == 0.:
             raise NumericalPrecisionError('norm of b must be > 0')
         self.bn = self.b / self.bnorm
+        if quantize is not None:
+            self.Anq, self.Anq_scale, self.Anq_err = quantize_rows(self.An.T)
 
     def _select(self):
-        xw = self.A.dot(self.w)
+        cdir, xw = self._directions()
+        if self.quantize is not None:
+            return self._select_quantized(cdir, xw)
+        scorends = self.An.T.dot(np.hstack((cdir[:, np.newaxis], xw[:, np.newaxis])))
+        return _scores(scorends).argmax()
+
+    def _directions(self):
+        # the correction direction and the current point, as unit vectors
+        xw = self._current_Aw().copy()
         nw = np.sqrt(((xw) ** 2).sum())
         nw = 1. if nw == 0. else nw
         xw /= nw
@@ -31,21 +50,37 @@ class GIGA(SparseNNLS):
         if cdirnrm < util.TOL:
             raise NumericalPrecisionError('cdirnrm < TOL: cdirnrm = ' + str(cdirnrm))
         cdir /= cdirnrm
-        scorends = self.An.T.dot(np.hstack((cdir[:, np.newaxis], xw[:, np.newaxis])))
-        # extract points for which the geodesic direction is stable (1st condition) and well defined (2nd)
-        idcs = np.logical_and(scorends[:, 1] > -1. + 1e-14, 1. - scorends[:, 1] ** 2 > 0.)
-        # compute the norm
-        scorends[idcs, 1] = np.sqrt(1. - scorends[idcs, 1] ** 2)
-        scorends[np.logical_not(idcs), 1] = np.inf
-        # compute the scores and argmax
-        return (scorends[:, 0] / scorends[:, 1]).argmax()
+        return cdir, xw
+
+    def _select_quantized(self, cdir, xw):
+        # cdir and xw are unit vectors, so each quantized inner product is within Anq_err of the exact one; bound the
+        # score s0 / sqrt(1 - s1^2) of every column from these intervals and recompute the columns whose upper bound
+        # reaches the best lower bound. Columns near the unstable region |s1| ~ 1 always count as open.
+        sq = dot_quantized(self.Anq, self.Anq_scale, np.hstack((cdir[:, np.newaxis], xw[:, np.newaxis])))
+        e = self.Anq_err
+        s1_lo = sq[:, 1] - e
+        s1_hi = sq[:, 1] + e
+        s1_max = np.maximum(np.fabs(s1_lo), np.fabs(s1_hi))
+        s1_min = np.where((s1_lo <= 0.) & (s1_hi >= 0.), 0., np.minimum(np.fabs(s1_lo), np.fabs(s1_hi)))
+        safe = s1_max < 1. - 1e-12
+        d_min = np.sqrt(np.where(safe, 1. - s1_max ** 2, 1.))
+        d_max = np.sqrt(1. - np.minimum(s1_min, 1.) ** 2)
+        a_hi = sq[:, 0] + e
+        a_lo = sq[:, 0] - e
+        ub = np.where(a_hi > 0., a_hi / d_min, a_hi / np.maximum(d_max, 1e-300))
+        ub[~safe] = np.inf
+        lb = np.where(a_lo > 0., a_lo / np.maximum(d_max, 1e-300), a_lo / d_min)
+        lb[~safe] = -np.inf
+        cand = np.nonzero(ub >= lb.max())[0]
+        scorends = self.An[:, cand].T.dot(np.hstack((cdir[:, np.newaxis], xw[:, np.newaxis])))
+        return cand[_scores(scorends).argmax()]
 
     def _reweight(self, f):
 
-        xw = self.A.dot(self.w)
+        xw = self._current_Aw()
         nw = np.sqrt((xw ** 2).sum())
         nw = 1. if nw == 0. else nw
-        xf = self.A[:, f]
+        xf = self._columns([f])[:, 0]
         nf = np.sqrt((xf ** 2).sum())
 
         gA = self.bn.dot((xf / nf)) - self.bn.dot((xw / nw)) * (xw / nw).dot((xf / nf))
@@ -63,5 +98,43 @@ class GIGA(SparseNNLS):
         alpha = a * scale
         beta = b * scale
 
-        self.w = alpha * self.w
-        self.w[f] = max(0., self.w[f] + beta)
+        self._step(alpha, f, beta, xf)
+
+
+class StreamingGIGA(StreamingSparseNNLS, GIGA):
+    """
+    GIGA on the tangent vectors of a TangentStream: each selection scores all columns in one pass over the row
+    blocks, the rest only reads the columns of the support and of the selected point.
+    """
+
+    def __init__(self, stream):
+        StreamingSparseNNLS.__init__(self, stream)
+        self.quantize = None
+        if np.any(self.vnorms == 0):
+            raise ValueError(self.alg_name + '.__init__(): A must not have any 0 columns')
+        self.bnorm = np.sqrt(((self.b) ** 2).sum())
+        if self.bnorm == 0.:
+            raise NumericalPrecisionError('norm of b must be > 0')
+        self.bn = self.b / self.bnorm
+
+    def _select(self):
+        cdir, xw = self._directions()
+        D = np.hstack((cdir[:, np.newaxis], xw[:, np.newaxis]))
+        f, best = -1, -np.inf
+        for s, e, vecs in self.stream.blocks():
+            sc = _scores((vecs / self.vnorms[s:e, np.newaxis]).dot(D))
+            j = sc.argmax()
+            if sc[j] > best:
+                f, best = s + j, sc[j]
+        return f
+
+
+def _scores(scorends):
+    # GIGA scores from the inner products of the normalized columns with the correction direction and the current
+    # point; extract points for which the geodesic direction is stable (1st condition) and well defined (2nd)
+    idcs = np.logical_and(scorends[:, 1] > -1. + 1e-14, 1. - scorends[:, 1] ** 2 > 0.)
+    # compute the norm
+    scorends[idcs, 1] = np.sqrt(1. - scorends[idcs, 1] ** 2)
+    scorends[np.logical_not(idcs), 1] = np.inf
+    # compute the scores
+    return scorends[:, 0] / scorends[:, 1]
@@ -15,7 +15,7 @@ class OrthoPursuit(SparseNNLS):
         self.An = self.A / Anorms
 
     def _select(self):
-        residual = self.b - self.A.dot(self.w)
+        residual = self._residual()
         dots = self.An.T.dot(residual)
 
         # if no active indices, just output argmax
@@ -35,8 +35,10 @@ class OrthoPursuit(SparseNNLS):
             return np.arange(self.w.shape[0])[nz_idcs][fneg]
 
     def _reweight(self, f):
-        self.w[f] = 1.
-        nz_idcs = self.w > 0
+        w = self.w.copy()
+        w[f] = 1.
+        nz_idcs = w > 0
         res = nnls(self.A[:, nz_idcs], self.b, maxiter=100 * self.A.shape[1])
-        self.w[nz_idcs] = res[0]
+        w[nz_idcs] = res[0]
+        self.w = w
         return
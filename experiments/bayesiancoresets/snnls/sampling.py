@@ -1,6 +1,6 @@
 import numpy as np
 
-from .snnls import SparseNNLS
+from .snnls import SparseNNLS, StreamingSparseNNLS
 
 
 class ImportanceSampling(SparseNNLS):
@@ -36,3 +36,21 @@ class UniformSampling(ImportanceSampling):
     def __init__(self, A, b):
         super().__init__(A, b)
         self.ps = np.ones(self.w.shape[0]) / float(self.w.shape[0])
+
+
+class StreamingImportanceSampling(StreamingSparseNNLS, ImportanceSampling):
+    # importance sampling from a TangentStream: the probabilities are the row norms of its one setup pass
+    def __init__(self, stream):
+        StreamingSparseNNLS.__init__(self, stream, check_error_monotone=False)
+        self.cts = np.zeros(self.w.shape[0])
+        self.ps = self.vnorms.copy()
+        if np.any(self.ps > 0):
+            self.ps /= self.ps.sum()
+        else:
+            self.ps = np.ones(self.w.shape[0]) / float(self.w.shape[0])
+
+
+class StreamingUniformSampling(StreamingImportanceSampling):
+    def __init__(self, stream):
+        super().__init__(stream)
+        self.ps = np.ones(self.w.shape[0]) / float(self.w.shape[0])
@@ -15,21 +15,99 @@ class SparseNNLS(object):
         self.A = A
         self.b = b
         self.reached_numeric_limit = False
-        self.w = np.zeros(A.shape[1])
+        self.refresh_period = 50  # steps between exact recomputations of the maintained A w (see _step)
+        self._undo = None  # undo log of the current build step, see _rollback
+        self.w = np.zeros(self._num_columns())
         self.check_error_monotone = check_error_monotone
 
+    @property
+    def w(self):
+        return self._w
+
+    @w.setter
+    def w(self, w):
+        # assigning the weights invalidates the maintained A w and support; w must not be written in place, except
+        # by _step
+        if self._undo is not None:
+            self._undo.append((None, self._w, self._Aw_cur, self._nz, self._steps))
+        self._w = w
+        self._Aw_cur = None
+        self._nz = np.flatnonzero(w)  # indices of the nonzero weights (a superset after _step zeroes some)
+        self._steps = 0
+
     def reset(self):
-        self.w = np.zeros(self.A.shape[1])
+        self.w = np.zeros(self._num_columns())
         self.reached_numeric_limit = False
 
     def size(self):
-        return (self.w > 0).sum()
+        return (self._w[self._nz] > 0).sum()
 
     def weights(self):
         return self.w.copy()
 
     def error(self):
-        return np.sqrt(((self.A.dot(self.w) - self.b) ** 2).sum())
+        return np.sqrt(((self._current_Aw() - self.b) ** 2).sum())
+
+    def _current_Aw(self):
+        # A w, maintained across the steps w <- alpha w + beta e_f (O(M) each, see _step) instead of recomputed
+        if self._Aw_cur is None:
+            self._refresh()
+        return self._Aw_cur
+
+    def _residual(self):
+        return self.b - self._current_Aw()
+
+    def _step(self, alpha, f, beta, Af=None):
+        """
+        w <- alpha w, then w[f] <- max(0, w[f] + beta), with A w updated in O(M) from the column Af = A[:, f] (read if
+        not given). A w is recomputed exactly every refresh_period steps to bound the accumulated rounding error.
+        """
+        Aw = self._current_Aw()
+        wf_old = self._w[f]
+        wf = max(0., alpha * wf_old + beta)
+        dwf = wf - alpha * wf_old
+        if Af is None and dwf != 0.:
+            Af = self._columns([f])[:, 0]
+        if self._undo is not None:
+            # only the support and f change; the arrays replaced below are kept by reference
+            idcs = np.append(self._nz, f)
+            self._undo.append((idcs, self._w[idcs], self._Aw_cur, self._nz, self._steps))
+        self._w[self._nz] *= alpha
+        if wf_old == 0. and wf > 0. and not np.any(self._nz == f):
+            # f may still be in the superset _nz if a step since the last refresh zeroed it
+            self._nz = np.append(self._nz, f)
+        self._w[f] = wf
+        self._Aw_cur = alpha * Aw + dwf * Af if dwf != 0. else alpha * Aw
+        self._steps += 1
+        if self._steps >= self.refresh_period:
+            self._refresh()
+
+    def _refresh(self):
+        # exact A w from the current weights
+        self._Aw_cur = self._Aw(self._w)
+        self._nz = self._nz[self._w[self._nz] > 0]
+        self._steps = 0
+
+    def _rollback(self):
+        # undo the changes logged since the undo log was opened, most recent first: O(support) per step
+        while self._undo:
+            idcs, w, Aw, nz, steps = self._undo.pop()
+            if idcs is None:
+                self._w = w
+            else:
+                self._w[idcs] = w
+            self._Aw_cur, self._nz, self._steps = Aw, nz, steps
+
+    # access to A, overridden by the solvers reading A from a TangentStream (see StreamingSparseNNLS)
+    def _num_columns(self):
+        return self.A.shape[1]
+
+    def _Aw(self, w):
+        return self.A.dot(w)
+
+    def _columns(self, idcs):
+        # A[:, idcs] for an integer or boolean index array
+        return self.A[:, idcs]
 
     def build(self, itrs):
         if self.reached_numeric_limit:
@@ -38,7 +116,7 @@ class SparseNNLS(object):
                     self.error()))
             return
 
-        if self.A.size == 0:
+        if self._num_columns() == 0 or self.b.size == 0:
             self.log.warning('there are no data, returning.')
             return
 
@@ -48,8 +126,8 @@ class SparseNNLS(object):
                 # keep a record of previous setting in case the below update fails
                 size_nonzero = self.size() > 0  # create a flag here, since ._reweight(f) will change this
                 if self.check_error_monotone and size_nonzero:
-                    prev_error = self.error()
-                    prev_w = self.w.copy()
+                    prev_error = self.error()  # O(M) from the maintained A w
+                    self._undo = []  # log of the changed weights instead of a copy of w
 
                 # search for the next best point
                 f = self._select()
@@ -62,11 +140,13 @@ class SparseNNLS(object):
                     error = self.error()
                     if error > prev_error:
                         # revert
-                        self.w = prev_w
+                        self._rollback()
                         raise NumericalPrecisionError(
                             'Error not monotone: curr error = ' + str(error) + ' prev error = ' + str(prev_error))
                     retried_already = False  # refresh retried flag after a successful step
+                self._undo = None
             except NumericalPrecisionError as e:  # a special error type for this library denoting possibly reaching numeric precision limit
+                self._undo = None
                 self.log.warning('numerical precision error: ' + str(e))
                 if retried_already:
                     self.log.warning('iterative step failed a second time. Assuming numeric limit reached.')
@@ -91,8 +171,10 @@ class SparseNNLS(object):
             prev_cost = self.error()
             prev_w = self.w.copy()
             nz_idcs = self.w > 0
-            res = nnls(self.A[:, nz_idcs], self.b, maxiter=100 * self.A.shape[1])
-            self.w[nz_idcs] = res[0]
+            res = nnls(self._columns(nz_idcs), self.b, maxiter=100 * self._num_columns())
+            w = prev_w.copy()
+            w[nz_idcs] = res[0]
+            self.w = w
             new_cost = self.error()
             if new_cost > prev_cost * (1. + util.TOL):
                 raise NumericalPrecisionError(
@@ -107,10 +189,34 @@ class SparseNNLS(object):
             return
 
     def _stabilize(self):
-        pass  # implementation optional; try to refresh cache/etc to make _step pass
+        # recompute the maintained A w exactly; subclasses can refresh further caches to make _step pass
+        self._refresh()
 
     def _select(self):
         raise NotImplementedError
 
     def _reweight(self, f):
         raise NotImplementedError
+
+
+class StreamingSparseNNLS(SparseNNLS):
+    """
+    Base of the solvers that read A = vecs.T from a TangentStream instead of a matrix (combine with the dense
+    solver class, e.g. StreamingGIGA(StreamingSparseNNLS, GIGA)): b is the stream sum, columns are evaluated on
+    demand and A w only needs the columns of the support. self.A is None.
+    """
+
+    def __init__(self, stream, check_error_monotone=True):
+        self.stream = stream
+        self.vsum, self.vnorms = stream.sum_norms()  # one pass
+        SparseNNLS.__init__(self, None, self.vsum, check_error_monotone)
+
+    def _num_columns(self):
+        return self.stream.n_rows
+
+    def _Aw(self, w):
+        supp = np.flatnonzero(w)
+        return self.stream.rows(supp).T.dot(w[supp])
+
+    def _columns(self, idcs):
+        return self.stream.rows(idcs).T
@@ -0,0 +1,46 @@
+import numpy as np
+
+
+def quantize_rows(X):
+    """
+    Row-wise int8 copy of X: row j is stored as round(127 X_j / max|X_j|) with the scale max|X_j| / 127.
+    Returns (q, scale, err), where err[j] bounds |X_j r - dot_quantized(q, scale, r)_j| / ||r|| for any r: the
+    quantization error ||X_j - scale_j q_j|| plus the float32 rounding of dot_quantized.
+    :param X: numpy.ndarray of shape (N, M)
+    """
+    M = X.shape[1]
+    amax = np.fabs(X).max(axis=1)
+    scale = np.where(amax > 0, amax / 127., 1.)
+    q = np.empty(X.shape, dtype=np.int8)
+    err = np.zeros(X.shape[0])
+    for s in range(0, X.shape[0], _block_rows(M)):
+        blk = X[s:s + _block_rows(M)]
+        sc = scale[s:s + blk.shape[0], np.newaxis]
+        qb = np.rint(blk / sc)
+        q[s:s + blk.shape[0]] = qb
+        err[s:s + blk.shape[0]] = np.sqrt(((blk - sc * qb) ** 2).sum(axis=1))
+    # float32 products: |fl(q_j r) - q_j r| <= M 2^-23 ||q_j|| ||r|| (a generous gamma_M, r rounded included)
+    err += M * 2. ** -23 * 127. * np.sqrt(M) * scale
+    return q, scale, err
+
+
+def dot_quantized(q, scale, R):
+    """
+    Approximate X.dot(R) from the int8 copy (q, scale) of X, for R of shape (M, k). The rows are converted block by
+    block into a float32 buffer small enough to stay in cache, so the scan reads 1 byte per entry of X instead of 8.
+    """
+    N, M = q.shape
+    B = _block_rows(M)
+    R32 = R.astype(np.float32)
+    out = np.empty((N, R.shape[1]), dtype=np.float32)
+    buf = np.empty((min(B, N), M), dtype=np.float32)
+    for s in range(0, N, B):
+        n = min(B, N - s)
+        np.copyto(buf[:n], q[s:s + n], casting='unsafe')
+        np.dot(buf[:n], R32, out=out[s:s + n])
+    return out.astype(np.float64) * scale[:, np.newaxis]
+
+
+def _block_rows(M):
+    # rows per conversion block: a float32 buffer of about 256 KB
+    return max(1, 2 ** 16 // M)
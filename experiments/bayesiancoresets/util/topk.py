@@ -0,0 +1,74 @@
+import numpy as np
+
+
+def top_k(v, K, recall=1., absolute=False, exclude=None, sample_size=4096, block_size=2 ** 20, z=3.):
+    """
+    Indices of the K largest entries of v (of |v| if absolute), largest first, skipping the indices in exclude.
+    Selection by a sampled threshold: a quantile of sample_size random entries gives a pivot t that at least K entries
+    exceed with high probability (z standard deviations of the sample count), and a block-wise scan keeps the entries
+    above t. The candidate buffer is capped at 4 K: when it overflows it is cut to its K largest and t is raised to
+    the K-th of them, which can only drop entries outside the top K. The |v| and exclude masks are applied per block,
+    so apart from the O(block_size + K) buffers nothing of length N is allocated.
+    If at least K entries pass the final pivot, the result is exact. Otherwise it holds the top n < K entries
+    exactly (recall n / K); if n / K < recall, the selection falls back to an exact one.
+    :param v: numpy.ndarray of shape (N,) or (N, 1)
+    :param recall: float in (0, 1], the smallest fraction of the top K accepted without the exact fallback
+    :return: numpy.ndarray of int64 indices, of length min(K, number of selectable entries) or at least recall * K
+    """
+    v = v.reshape(-1)
+    N = v.shape[0]
+    excl = np.zeros(0, dtype=np.int64) if exclude is None else np.unique(np.asarray(exclude, dtype=np.int64))
+    K = min(K, N - excl.shape[0])
+    if K <= 0:
+        return np.zeros(0, dtype=np.int64)
+
+    # pivot from a random sample
+    p = K / N
+    if sample_size < N:
+        smp = v[np.random.randint(N, size=sample_size)]
+        smp = np.fabs(smp) if absolute else smp
+        j = max(1, int(np.ceil(sample_size * p + z * np.sqrt(sample_size * p * (1. - p)))) + 1)
+        t = np.partition(smp, sample_size - j)[sample_size - j] if j <= sample_size else -np.inf
+    else:
+        t = -np.inf
+
+    # block-wise scan with a capped candidate buffer
+    cap = 4 * K
+    c_idx = np.zeros(0, dtype=np.int64)
+    c_val = np.zeros(0)
+    for s in range(0, N, block_size):
+        blk = v[s:s + block_size]
+        blk = np.fabs(blk) if absolute else blk
+        hit = np.flatnonzero(blk >= t)
+        if excl.shape[0] > 0:
+            e = excl[(excl >= s) & (excl < s + block_size)] - s
+            hit = hit[~np.isin(hit, e, assume_unique=True)]
+        c_idx = np.concatenate((c_idx, hit + s))
+        c_val = np.concatenate((c_val, blk[hit]))
+        if c_idx.shape[0] > cap:
+            keep = np.argpartition(c_val, c_val.shape[0] - K)[c_val.shape[0] - K:]
+            c_idx = c_idx[keep]
+            c_val = c_val[keep]
+            t = c_val.min()
+
+    if c_idx.shape[0] < recall * K:
+        # the pivot was too high for the requested recall: exact fallback
+        return top_k_exact(v, K, absolute=absolute, exclude=excl)
+    order = np.argsort(-c_val, kind='stable')[:K]
+    return c_idx[order]
+
+
+def top_k_exact(v, K, absolute=False, exclude=None):
+    """
+    Exact counterpart of top_k, by a full partition of v (allocates length-N temporaries).
+    """
+    v = v.reshape(-1)
+    w = np.fabs(v) if absolute else v.copy()
+    if exclude is not None and len(exclude) > 0:
+        w[exclude] = -np.inf
+        K = min(K, w.shape[0] - np.unique(exclude).shape[0])
+    K = min(K, w.shape[0])
+    if K <= 0:
+        return np.zeros(0, dtype=np.int64)
+    idx = np.argpartition(w, w.shape[0] - K)[w.shape[0] - K:]
+    return idx[np.argsort(-w[idx], kind='stable')].astype(np.int64)
@@ -64,7 +64,7 @@ else:
     t_laplace = lplc['t_laplace']
 
 # generate a sampler based on the laplace approx
-sampler = lambda sz, w, ids: np.atleast_2d(np.random.multivariate_normal(mu, cov, sz))
+sampler = bc.GaussianSampler(mu, cov)
 
 
 # create the log-likelihood eval function
@@ -1,6 +1,7 @@
 from __future__ import print_function
 
 import time
+from functools import partial
 
 import numpy as np
 
@@ -13,8 +14,9 @@ bc.util.set_verbosity('error')
 n_trials = 5
 Ms = np.unique(np.logspace(0., 4., 100, dtype=np.int32))
 
-anms = ['FW', 'GIGA', 'OMP', 'IS', 'US']
-algs = [bc.snnls.FrankWolfe, bc.snnls.GIGA, bc.snnls.OrthoPursuit, bc.snnls.ImportanceSampling,
+anms = ['FW', 'AFW', 'PFW', 'GIGA', 'OMP', 'IS', 'US']
+algs = [bc.snnls.FrankWolfe, partial(bc.snnls.FrankWolfe, variant='away'), partial(bc.snnls.FrankWolfe, variant='pairwise'),
+        bc.snnls.GIGA, bc.snnls.OrthoPursuit, bc.snnls.ImportanceSampling,
         bc.snnls.UniformSampling]
 
 ##########################################
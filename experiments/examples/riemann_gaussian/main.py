@@ -48,7 +48,7 @@ logdetSig = np.linalg.slogdet(Sig)[1]
 log_likelihood = lambda samples: gaussian.gaussian_potentials(Siginv, xSiginvx, xSiginv, logdetSig, x, samples)
 
 # create the sampler for the "optimally-tuned" Hilbert coreset
-sampler_optimal = lambda n, w, ids: np.random.multivariate_normal(mup, Sigp, n)
+sampler_optimal = bc.GaussianSampler(mup, Sigp)
 tsf_optimal = bc.BayesianTangentSpaceFactory(log_likelihood, sampler_optimal, proj_dim)
 
 # create the sampler for the "realistically-tuned" Hilbert coreset
@@ -59,7 +59,7 @@ Sighat = U * Sigp + (1. - U) * Sig0
 muhat += pihat_noise * np.sqrt((muhat ** 2).sum()) * np.random.randn(muhat.shape[0])
 Sighat *= np.exp(-2 * pihat_noise * np.fabs(np.random.randn()))
 
-sampler_realistic = lambda n, w, ids: np.random.multivariate_normal(muhat, Sighat, n)
+sampler_realistic = bc.GaussianSampler(muhat, Sighat)
 tsf_realistic = bc.BayesianTangentSpaceFactory(log_likelihood, sampler_realistic, proj_dim)
 
 
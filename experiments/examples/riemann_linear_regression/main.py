@@ -82,7 +82,7 @@ log_likelihood = lambda samples: model_linreg.potentials(datastd ** 2, X, Y, sam
 
 # create tangent space for well-tuned Hilbert coreset alg
 print('Creating tuned tangent space for Hilbert coreset construction')
-sampler_optimal = lambda n, w, ids: np.random.multivariate_normal(mup, Sigp, n)
+sampler_optimal = bc.GaussianSampler(mup, Sigp)
 tsf_optimal = bc.BayesianTangentSpaceFactory(log_likelihood, sampler_optimal, proj_dim)
 
 # create tangent space for poorly-tuned Hilbert coreset alg
@@ -94,7 +94,7 @@ Sighat = U * Sigp + (1. - U) * Sig0
 muhat += pihat_noise * np.sqrt((muhat ** 2).sum()) * np.random.randn(muhat.shape[0])
 Sighat *= np.exp(-2 * pihat_noise * np.fabs(np.random.randn()))
 
-sampler_realistic = lambda n, w, ids: np.random.multivariate_normal(muhat, Sighat, n)
+sampler_realistic = bc.GaussianSampler(muhat, Sighat)
 tsf_realistic = bc.BayesianTangentSpaceFactory(log_likelihood, sampler_realistic, proj_dim)
 
 
@@ -38,8 +38,9 @@ def get_laplace(wts, Z, mu0):
 
 
 dnm = sys.argv[1]  # should be synth_lr / phishing / ds1 / synth_poiss / biketrips / airportdelays
-alg = sys.argv[2]  # should be IHT / IHT-2 / IHT-stoc / GIGAO / GIGAR / RAND / PRIOR / SVI
+alg = sys.argv[2]  # should be IHT / IHT-2 / IHT-stoc / IHT-vr / IHT-pre / IHT-2-pre / IHT-rows / GIGAO / GIGAR / RAND / PRIOR / SVI
 ID = sys.argv[3]  # just a number to denote trial #, any nonnegative integer
+qmc = sys.argv[4] if len(sys.argv) > 4 else None  # optional: sobol / halton draws for the tangent spaces (default MC)
 
 np.random.seed(int(ID))
 
@@ -131,23 +132,33 @@ else:
     t_laplace = lplc['t_laplace']
 
 print('Building tangent space factories')
-# build tangent spaces
+# build tangent spaces; the coresets below share one tangent matrix per factory instead of drawing their own
 tsf_optimal = bc.BayesianTangentSpaceFactory(lambda th: log_likelihood_2d2d(Z, th),
-                                             lambda sz, wts, idcs: np.random.multivariate_normal(mup, Sigp, sz),
-                                             projection_dim)
+                                             bc.GaussianSampler(mup, Sigp, qmc=qmc), projection_dim, shared=True)
 tsf_realistic = bc.BayesianTangentSpaceFactory(lambda th: log_likelihood_2d2d(Z, th),
-                                               lambda sz, wts, idcs: np.random.multivariate_normal(mu, cov, sz),
-                                               projection_dim)
+                                               bc.GaussianSampler(mu, cov, qmc=qmc), projection_dim, shared=True)
+
+# Gaussian sampler of the Laplace approximation for the coreset weights seen by SparseVI. SparseVI asks for a tangent
+# space at new weights on every gradient step of its weight optimization, so fitting the Laplace approximation (and
+# factoring its covariance) per call dominates its cost. The fit is reused while the support stays the same: it is
+# redone when the support changes and every laplace_refit_period calls in between, so the samples of up to
+# laplace_refit_period - 1 steps come from the Laplace approximation at slightly older weights.
+laplace_refit_period = 10
+laplace_sampler = {'idcs': None, 'calls': 0, 'sampler': None}
 
 
 def sampler_w(sz, wts, idcs):
-    if idcs.shape[0] > 0:
-        w = np.zeros(Z.shape[0])
-        w[idcs] = wts
-        muw, Sigw = get_laplace(w, Z, mu0)
-    else:
-        muw, Sigw = mu0, Sig0
-    return np.random.multivariate_normal(muw, Sigw, sz)
+    if laplace_sampler['sampler'] is None or laplace_sampler['calls'] >= laplace_refit_period \
+            or not np.array_equal(idcs, laplace_sampler['idcs']):
+        if idcs.shape[0] > 0:
+            w = np.zeros(Z.shape[0])
+            w[idcs] = wts
+            muw, Sigw = get_laplace(w, Z, mu0)
+        else:
+            muw, Sigw = mu0, Sig0
+        laplace_sampler.update(idcs=idcs.copy(), calls=0, sampler=bc.GaussianSampler(muw, Sigw))
+    laplace_sampler['calls'] += 1
+    return laplace_sampler['sampler'](sz)
 
 
 tsf_w = bc.BayesianTangentSpaceFactory(lambda th: log_likelihood_2d2d(Z, th), sampler_w, projection_dim)
@@ -161,6 +172,11 @@ sparsevi = bc.SparseVICoreset(tsf_w, opt_itrs=opt_itrs, step_sched=learning_rate
 iht = bc.IHTCoreset(tsf_realistic, projection_dim, 'IHT')
 iht_ii = bc.IHTCoreset(tsf_realistic, projection_dim, 'IHT-2')
 iht_stoc = bc.IHTCoreset(tsf_realistic, projection_dim, 'IHT', stochastic_batch_ratio=stochastic_batch_ratio)
+iht_vr = bc.IHTCoreset(tsf_realistic, projection_dim, 'IHT', stochastic_batch_ratio=stochastic_batch_ratio,
+                       variance_reduction='svrg')
+iht_pre = bc.IHTCoreset(tsf_realistic, projection_dim, 'IHT', precondition=True)
+iht_ii_pre = bc.IHTCoreset(tsf_realistic, projection_dim, 'IHT-2', precondition=True)
+iht_rows = bc.IHTCoreset(tsf_realistic, projection_dim, 'IHT-2', row_batch_ratio=0.1)
 algs = {'SVI': sparsevi,
         'GIGAO': giga_optimal,
         'GIGAR': giga_realistic,
@@ -168,6 +184,10 @@ algs = {'SVI': sparsevi,
         'IHT': iht,
         'IHT-2': iht_ii,
         'IHT-stoc': iht_stoc,
+        'IHT-vr': iht_vr,
+        'IHT-pre': iht_pre,
+        'IHT-2-pre': iht_ii_pre,
+        'IHT-rows': iht_rows,
         'PRIOR': None}
 
 coreset = algs[alg]
@@ -176,15 +196,17 @@ print('Building coresets via ' + alg)
 # build
 wts = np.zeros((M + 1, Z.shape[0]))
 cputs = np.zeros(M + 1)
+iters = np.zeros(M + 1, dtype=np.int64)  # IHT iterations per coreset size
 t0 = time.perf_counter()
 
-if alg == 'IHT' or alg == 'IHT-2' or alg == 'IHT-stoc':
+if alg.startswith('IHT'):
     for m in range(2, M + 1, 1):
         print(str(m) + '/' + str(M))
         t0 = time.perf_counter()
         coreset.build(1, m)
-        # record time and weights: build from scratch
+        # record time, iterations and weights: build from scratch
         cputs[m] = time.perf_counter() - t0
+        iters[m] = coreset.iter_iht
         w, idcs = coreset.weights()
         wts[m, idcs] = w
 else:
@@ -210,5 +232,5 @@ for m in range(M + 1):
     kls_laplace[m] = gaussian.gaussian_KL(mup, Sigp, mul, np.linalg.inv(Sigl))
 
 # save results
-np.savez('results/' + dnm + '_' + alg + '_results_' + str(ID) + '.npz', cputs=cputs, wts=wts, Ms=np.arange(M + 1),
-             mus=mus_laplace, Sigs=Sigs_laplace, kls=kls_laplace)
+np.savez('results/' + dnm + '_' + alg + ('' if qmc is None else '-' + qmc) + '_results_' + str(ID) + '.npz', cputs=cputs, wts=wts, Ms=np.arange(M + 1),
+             mus=mus_laplace, Sigs=Sigs_laplace, kls=kls_laplace, iters=iters)
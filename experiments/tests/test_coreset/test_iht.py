@@ -0,0 +1,590 @@
+import warnings
+
+import numpy as np
+from scipy.optimize import nnls
+
+import bayesiancoresets as bc
+from bayesiancoresets.coreset.iht_coreset import FiniteTangentSpace, SupportGram, ColumnCache
+
+warnings.filterwarnings('ignore',
+                        category=UserWarning)  # tests will generate warnings (due to pathological data design for testing), just ignore them
+np.set_printoptions(linewidth=500)
+np.random.seed(321)
+tol = 1e-9
+
+modes = ['IHT', 'IHT-2']
+
+
+def gendata(N, D):
+    return np.random.normal(0., 1., (N, D)) + 0.3
+
+
+def tsf_of(X):
+    return lambda: X.copy()
+
+
+####################################################
+# verifies that
+# -the tangent store is contiguous in the gather direction, with exact sums/norms
+# -the column / gradient primitives agree with the dense Phi = vecs.T
+# -the float32 copy only perturbs the gradient scan
+####################################################
+def test_finite_tangent_space():
+    X = gendata(50, 7)
+    T = FiniteTangentSpace(tsf_of(np.asfortranarray(X)), 7)
+    Phi = X.T
+    assert T.vecs.flags['C_CONTIGUOUS'], "FiniteTangentSpace failed: vecs not C-contiguous"
+    assert T.num_vectors() == 50 and T.dim() == 7, "FiniteTangentSpace failed: wrong shape"
+    assert np.all(np.fabs(T.sum() - X.sum(axis=0)) < tol), "FiniteTangentSpace failed: wrong sum"
+    assert np.all(np.fabs(T.norms() - np.sqrt((X ** 2).sum(axis=1))) < tol), "FiniteTangentSpace failed: wrong norms"
+    idcs = [3, 17, 4]
+    x = np.random.rand(3, 1)
+    r = np.random.randn(7, 1)
+    assert np.all(np.fabs(T.dot_columns(idcs, x) - Phi[:, idcs].dot(x)) < tol), "dot_columns failed"
+    assert np.all(np.fabs(T.rdot(r) - Phi.T.dot(r)) < tol), "rdot failed"
+    assert np.all(np.fabs(T.rdot_columns(idcs, r) - Phi[:, idcs].T.dot(r)) < tol), "rdot_columns failed"
+
+    T32 = FiniteTangentSpace(tsf_of(X), 7, float32_copy=True)
+    assert T32.vecs.dtype == np.float64 and T32.vecs32.dtype == np.float32, "float32 copy failed: wrong dtypes"
+    assert np.all(np.fabs(T32.rdot(r) - Phi.T.dot(r)) < 1e-4), "float32 copy failed: rdot too inaccurate"
+
+    try:
+        FiniteTangentSpace(lambda: np.zeros(5), 5)
+        assert False, "FiniteTangentSpace failed: did not catch 1d vecs"
+    except ValueError:
+        pass
+
+
+####################################################
+# verifies that
+# -coreset size <= sz, weights are nonnegative
+# -a larger coreset does not have a much larger objective
+####################################################
+def test_iht_build():
+    X = gendata(200, 30)
+    for mode in modes:
+        prev_obj = np.inf
+        for sz in [5, 10, 20]:
+            coreset = bc.IHTCoreset(tsf_of(X), 30, mode)
+            coreset.build(1, sz)
+            w, idcs = coreset.weights()
+            assert coreset.size() <= sz, mode + " failed: coreset size > sz"
+            assert np.all(w > 0.), mode + " failed: coreset has nonpositive weights"
+            obj = np.sqrt(((X.sum(axis=0) - w.dot(X[idcs, :])) ** 2).sum())
+            assert obj < prev_obj * (1. + 1e-2), mode + " failed: objective grew with the coreset size"
+            prev_obj = obj
+
+
+####################################################
+# verifies that
+# -the stochastic batch gradient gives a coreset of size <= sz with finite, positive weights
+####################################################
+def test_iht_stochastic():
+    X = gendata(200, 30)
+    for mode in modes:
+        coreset = bc.IHTCoreset(tsf_of(X), 30, mode, stochastic_batch_ratio=0.3)
+        coreset.build(1, 10)
+        w, idcs = coreset.weights()
+        assert coreset.size() <= 10, mode + " stochastic failed: coreset size > sz"
+        assert np.all(np.isfinite(w)) and np.all(w > 0.), mode + " stochastic failed: invalid weights"
+
+
+####################################################
+# verifies that
+# -error() matches the residual of the output weights
+# -optimize() does not increase the error and keeps the support
+# -reset() restores the empty-coreset error
+####################################################
+def test_iht_error_optimize():
+    X = gendata(200, 30)
+    xs = X.sum(axis=0)
+    for mode in modes:
+        coreset = bc.IHTCoreset(tsf_of(X), 30, mode)
+        coreset.build(1, 10)
+        w, idcs = coreset.weights()
+        err = np.sqrt(((xs - w.dot(X[idcs, :])) ** 2).sum())
+        assert np.fabs(coreset.error() - err) < 1e-6, mode + " failed: error() does not match the output weights"
+        coreset.optimize()
+        w_opt, idcs_opt = coreset.weights()
+        err_opt = np.sqrt(((xs - w_opt.dot(X[idcs_opt, :])) ** 2).sum())
+        assert np.fabs(coreset.error() - err_opt) < 1e-6, mode + " failed: error() wrong after optimize()"
+        assert err_opt <= err * (1. + 1e-9), mode + " failed: optimize() increased the error"
+        assert set(idcs_opt) <= set(idcs), mode + " failed: optimize() changed the support"
+        coreset.reset()
+        assert coreset.size() == 0 and np.fabs(coreset.error() - np.sqrt((xs ** 2).sum())) < 1e-6, \
+            mode + " failed: reset() did not properly reset"
+
+
+####################################################
+# verifies that
+# -the incrementally updated support Gram matrix and its Cholesky factor match the dense ones
+# -SupportGram.nnls agrees with a dense nnls on the support columns
+####################################################
+def test_support_gram_incremental():
+    X = gendata(100, 40)
+    T = FiniteTangentSpace(tsf_of(X), 40)
+    gram = SupportGram(T)
+    for idcs in [[1, 5, 9], [1, 5, 9, 20, 33], [5, 20, 33, 2], [2, 5, 20, 33, 60, 61]]:
+        gram.update(idcs)
+        P = X[gram.idcs].T
+        assert set(gram.idcs) == set(idcs), "SupportGram failed: wrong support"
+        assert np.all(np.fabs(gram.G - P.T.dot(P)) < 1e-8), "SupportGram failed: wrong Gram matrix"
+        assert np.all(np.fabs(gram.L.dot(gram.L.T) - gram.G) < 1e-8), "SupportGram failed: wrong Cholesky factor"
+        w = gram.nnls()
+        w_ref = nnls(P, X.sum(axis=0))[0]
+        assert np.all(np.fabs(w - w_ref) < 1e-6), "SupportGram failed: nnls solution differs from dense nnls"
+
+
+####################################################
+# verifies that
+# -SupportGram.nnls is no worse than a dense nnls on a singular support (more points than dimensions, collinear)
+# -optimize() and a further build() work on such a support
+####################################################
+def test_support_gram_singular():
+    X = np.random.RandomState(1).normal(0., 1., (200, 10)) + 0.3
+    X[7] = 2. * X[3]
+    T = FiniteTangentSpace(tsf_of(X), 10)
+    gram = SupportGram(T)
+    for idcs in [[3, 7], list(range(30)), list(range(5, 30)), [1, 2, 5]]:
+        gram.update(idcs)
+        P = X[gram.idcs].T
+        assert np.all(np.fabs(gram.G - P.T.dot(P)) < 1e-8), "SupportGram failed: wrong Gram matrix"
+        w = gram.nnls()
+        err_ref = nnls(P, X.sum(axis=0))[1]
+        assert np.all(w >= 0) and np.linalg.norm(P.dot(w) - X.sum(axis=0)) <= err_ref + 1e-8, \
+            "SupportGram failed: singular nnls worse than dense nnls"
+    assert gram.L is not None, "SupportGram failed: no factor for a well-conditioned support"
+    for mode in modes:
+        coreset = bc.IHTCoreset(tsf_of(X), 10, mode)
+        coreset.build(1, 30)
+        err = coreset.error()
+        coreset.optimize()
+        assert not coreset.reached_numeric_limit and coreset.error() <= err * (1. + 1e-9), \
+            mode + " failed: optimize() on a support larger than the dimension"
+        coreset.build(1, 40)
+        assert 30 < coreset.size() <= 40, mode + " failed: build() after optimize() on a singular support"
+
+
+####################################################
+# verifies that
+# -preconditioned IHT gives a valid coreset whose weights are mapped back to the original coordinates
+# -the convergence record has one entry per iteration
+####################################################
+def test_iht_precondition():
+    # rows with norms spanning orders of magnitude
+    X = gendata(200, 30) * np.exp(2. * np.random.randn(200))[:, np.newaxis]
+    xs = X.sum(axis=0)
+    for mode in modes:
+        coreset = bc.IHTCoreset(tsf_of(X), 30, mode, precondition=True)
+        coreset.build(1, 10)
+        w, idcs = coreset.weights()
+        assert coreset.size() <= 10 and np.all(w > 0.), mode + " preconditioned failed: invalid coreset"
+        err = np.sqrt(((xs - w.dot(X[idcs, :])) ** 2).sum())
+        assert np.fabs(coreset.error() - err) < 1e-6 * np.sqrt((xs ** 2).sum()), \
+            mode + " preconditioned failed: weights not mapped back to the original coordinates"
+        assert coreset.error() < np.sqrt((xs ** 2).sum()), mode + " preconditioned failed: no error reduction"
+        assert len(coreset.obj_list) == min(coreset.iter_iht, coreset.max_iter), \
+            mode + " preconditioned failed: convergence record has the wrong length"
+
+
+####################################################
+# verifies that
+# -SVRG / SAGA batch gradients touch fewer columns and stay close to the full gradient error
+# -the SVRG estimate is unbiased between snapshots and exact on the support
+# -invalid stochastic_batch_ratio values are caught, vr_epoch is only set with variance reduction
+####################################################
+def test_iht_variance_reduction():
+    Xs = [gendata(500, 30) for i in range(3)]
+    ratios = {}
+    for X in Xs:
+        full = bc.IHTCoreset(tsf_of(X), 30, 'IHT')
+        full.build(1, 10)
+        for vr in ['svrg', 'saga']:
+            for mode in modes:
+                coreset = bc.IHTCoreset(tsf_of(X), 30, mode, stochastic_batch_ratio=0.2, variance_reduction=vr)
+                coreset.build(1, 10)
+                w, idcs = coreset.weights()
+                assert coreset.size() <= 10 and np.all(w > 0.), vr + " failed: invalid coreset"
+                assert coreset.column_touches < 500 * min(coreset.iter_iht, coreset.max_iter), \
+                    vr + " failed: touched as many columns as the full gradient"
+                ratios.setdefault(vr + mode, []).append(coreset.error() / full.error())
+    for key, r in ratios.items():
+        assert np.mean(r) < 1.5, key + " failed: error much worse than the full gradient"
+
+    # between snapshots, the estimate is unbiased and exact on the support
+    X = Xs[0]
+    coreset = bc.IHTCoreset(tsf_of(X), 30, 'IHT', stochastic_batch_ratio=0.2, variance_reduction='svrg')
+    coreset.T  # materialize
+    r0, r1 = np.random.randn(30, 1), np.random.randn(30, 1)
+    coreset._vr_gradient(r0, None)
+    ests = []
+    for i in range(2000):
+        coreset._snap_age = 0
+        ests.append(coreset._vr_gradient(r1, [0, 3]))
+    assert np.all(np.fabs(np.mean(ests, axis=0) - X.dot(r1)) < 0.1 * np.fabs(X.dot(r1 - r0)).max()), \
+        "svrg failed: biased gradient estimate"
+    assert np.all(np.array(ests)[:, [0, 3]] == X[[0, 3]].dot(r1)), "svrg failed: support gradient not exact"
+    for ratio in [-1, 0., 1.5]:
+        try:
+            bc.IHTCoreset(tsf_of(X), 30, 'IHT', stochastic_batch_ratio=ratio, variance_reduction='svrg')
+            assert False, \
+                "IHTCoreset failed: did not catch variance reduction with stochastic_batch_ratio " + str(ratio)
+        except ValueError:
+            pass
+    assert bc.IHTCoreset(tsf_of(X), 30, 'IHT', stochastic_batch_ratio=0.).vr_epoch is None, \
+        "IHTCoreset failed: vr_epoch set without variance reduction"
+
+
+####################################################
+# verifies that
+# -gradient screening keeps the support and error of the unscreened run and skips columns
+# -screening with stochastic gradients is rejected
+####################################################
+def test_iht_screening():
+    X = gendata(1000, 40) * np.exp(0.7 * np.random.randn(1000))[:, np.newaxis]
+    for mode in modes:
+        ref = bc.IHTCoreset(tsf_of(X), 40, mode)
+        ref.build(1, 10)
+        w_ref, idcs_ref = ref.weights()
+        for margin in [1., 0.5]:
+            coreset = bc.IHTCoreset(tsf_of(X), 40, mode, screening=True, screen_margin=margin)
+            coreset.build(1, 10)
+            w, idcs = coreset.weights()
+            assert set(idcs) == set(idcs_ref), mode + " screening failed: support differs from the unscreened run"
+            assert np.fabs(coreset.error() - ref.error()) < 1e-6 * ref.error(), \
+                mode + " screening failed: error differs from the unscreened run"
+            assert coreset.column_touches < ref.column_touches, mode + " screening failed: no columns were skipped"
+    try:
+        bc.IHTCoreset(tsf_of(X), 40, 'IHT', stochastic_batch_ratio=0.5, screening=True)
+        assert False, "IHTCoreset failed: did not catch screening with stochastic gradients"
+    except ValueError:
+        pass
+
+
+####################################################
+# verifies that
+# -the multistart build keeps the best start, and its zero start matches the single build
+# -start_inits of the wrong length, init and greedy_steps are rejected with n_starts > 1
+####################################################
+def test_iht_multistart():
+    X = gendata(300, 30) * np.exp(0.8 * np.random.randn(300))[:, np.newaxis]
+    xs = X.sum(axis=0)
+    for mode in modes:
+        single = bc.IHTCoreset(tsf_of(X), 30, mode)
+        single.build(1, 10)
+        coreset = bc.IHTCoreset(tsf_of(X), 30, mode, n_starts=3, start_inits=['zero', 'greedy', 'random'])
+        coreset.build(1, 10)
+        w, idcs = coreset.weights()
+        assert coreset.size() <= 10 and np.all(w > 0.), mode + " multistart failed: invalid coreset"
+        assert len(coreset.start_objs) == 3, mode + " multistart failed: wrong number of starts"
+        assert np.fabs(coreset.start_objs[0] - single.error()) < 1e-6 * single.error(), \
+            mode + " multistart failed: zero start differs from the single build"
+        assert coreset.error() <= single.error() * (1. + 1e-9), mode + " multistart failed: not the best start"
+        err = np.sqrt(((xs - w.dot(X[idcs, :])) ** 2).sum())
+        assert np.fabs(coreset.error() - err) < 1e-6 * err, mode + " multistart failed: error() does not match"
+    for kw in [dict(start_inits=['zero']), dict(init=np.ones(300)), dict(greedy_steps=3)]:
+        try:
+            bc.IHTCoreset(tsf_of(X), 30, 'IHT', n_starts=2, **kw)
+            assert False, "IHTCoreset failed: did not catch n_starts = 2 with " + str(list(kw))
+        except ValueError:
+            pass
+
+
+####################################################
+# verifies that
+# -row batches give an exact error() and growing windows, with an error close to all rows
+####################################################
+def test_iht_row_batch():
+    X = gendata(300, 400)
+    xs = X.sum(axis=0)
+    for mode in modes:
+        full = bc.IHTCoreset(tsf_of(X), 400, mode)
+        full.build(1, 10)
+        coreset = bc.IHTCoreset(tsf_of(X), 400, mode, row_batch_ratio=0.1)
+        coreset.build(1, 10)
+        w, idcs = coreset.weights()
+        assert coreset.size() <= 10 and np.all(w > 0.), mode + " row batch failed: invalid coreset"
+        err = np.sqrt(((xs - w.dot(X[idcs, :])) ** 2).sum())
+        assert np.fabs(coreset.error() - err) < 1e-6 * err, mode + " row batch failed: error() is not exact"
+        sizes = coreset.row_batch_sizes
+        assert sizes[0] == 40 and all(a <= b for a, b in zip(sizes[:-1], sizes[1:])), \
+            mode + " row batch failed: window sizes should start at the ratio and only grow"
+        assert coreset.error() < 1.5 * full.error(), mode + " row batch failed: error much worse than all rows"
+    try:
+        bc.IHTCoreset(tsf_of(X), 400, 'IHT', row_batch_ratio=0.1, screening=True)
+        assert False, "IHTCoreset failed: did not catch row batches with screening"
+    except ValueError:
+        pass
+
+
+####################################################
+# verifies that
+# -top_k with recall 1 gives the same support and error as the full sort
+####################################################
+def test_iht_approx_top_k():
+    X = gendata(2000, 20)
+    for mode in modes:
+        ref = bc.IHTCoreset(tsf_of(X), 20, mode)
+        ref.build(1, 10)
+        coreset = bc.IHTCoreset(tsf_of(X), 20, mode, topk_recall=1.)
+        coreset.build(1, 10)
+        assert set(coreset.weights()[1]) == set(ref.weights()[1]), mode + " top_k failed: support differs"
+        assert np.fabs(coreset.error() - ref.error()) < 1e-9 * ref.error(), mode + " top_k failed: error differs"
+
+
+####################################################
+# verifies that
+# -streaming gives the same support and error as the in-memory build, with and without preconditioning
+####################################################
+def test_iht_streaming():
+    X = gendata(1000, 20) * np.exp(0.5 * np.random.randn(1000))[:, np.newaxis]
+    for mode in modes:
+        for pre in [False, True]:
+            ref = bc.IHTCoreset(tsf_of(X), 20, mode, precondition=pre)
+            ref.build(1, 10)
+            coreset = bc.IHTCoreset(tsf_of(X), 20, mode, precondition=pre, streaming=True, stream_block=64)
+            coreset.build(1, 10)
+            assert set(coreset.weights()[1]) == set(ref.weights()[1]), mode + " streaming failed: support differs"
+            assert np.fabs(coreset.error() - ref.error()) < 1e-6 * ref.error(), \
+                mode + " streaming failed: error differs"
+    try:
+        bc.IHTCoreset(tsf_of(X), 20, 'IHT', streaming=True, screening=True)
+        assert False, "IHTCoreset failed: did not catch streaming with screening"
+    except ValueError:
+        pass
+
+
+####################################################
+# verifies that
+# -a build from init (a coreset or a weight vector), with or without greedy steps, beats the seed
+# -init survives reset(), an init of the wrong length is rejected
+####################################################
+def test_iht_warm_start():
+    X = gendata(300, 30) * np.exp(0.8 * np.random.randn(300))[:, np.newaxis]
+    xs = X.sum(axis=0)
+    for mode in modes:
+        seed = bc.HilbertCoreset(tsf_of(X))
+        seed.build(1, 5)
+        ws, idcs_s = seed.weights()
+        err_seed = np.sqrt(((xs - ws.dot(X[idcs_s, :])) ** 2).sum())
+        x0 = np.zeros(300)
+        x0[idcs_s] = ws
+        for init in [seed, x0]:
+            for steps in [0, 3]:
+                coreset = bc.IHTCoreset(tsf_of(X), 30, mode, init=init, greedy_steps=steps)
+                coreset.build(1, 10)
+                w, idcs = coreset.weights()
+                assert coreset.size() <= 10 and np.all(w > 0.), mode + " warm start failed: invalid coreset"
+                err = np.sqrt(((xs - w.dot(X[idcs, :])) ** 2).sum())
+                assert err <= err_seed * (1. + 1e-6), mode + " warm start failed: worse than the seed"
+                coreset.reset()
+                assert coreset.init is init, mode + " warm start failed: init not kept across reset"
+    try:
+        bc.IHTCoreset(tsf_of(X), 30, 'IHT', init=np.ones(10)).build(1, 10)
+        assert False, "IHTCoreset failed: did not catch an init vector of the wrong length"
+    except ValueError:
+        pass
+
+
+####################################################
+# verifies that
+# -the cached column products match the dense ones within the budget
+# -the hit / miss / eviction counts follow the LRU order
+####################################################
+def test_column_cache():
+    X = gendata(100, 40)
+    T = FiniteTangentSpace(tsf_of(X), 40)
+    cache = ColumnCache(T, 3 * (10 * 40 + 10 * 10) * 8 / 2 ** 20)  # room for three blocks of 10 columns and their Grams
+    sets = [np.random.permutation(100)[:10] for _ in range(4)]
+    for idcs in sets[:3] + [np.flip(sets[0])] + [sets[3], sets[0]]:
+        x = np.random.randn(10, 1)
+        r = np.random.randn(40, 1)
+        P = X[idcs].T
+        assert np.all(np.fabs(cache.dot_columns(idcs, x) - P.dot(x)) < 1e-8), "ColumnCache failed: wrong product"
+        assert np.all(np.fabs(cache.rdot_columns(idcs, r) - P.T.dot(r)) < 1e-8), "ColumnCache failed: wrong gradient"
+        Px = P.dot(x)
+        assert np.fabs(cache.sq_norm(idcs, x) - Px.T.dot(Px).item()) < 1e-8, "ColumnCache failed: wrong norm"
+        assert cache.nbytes <= cache.budget, "ColumnCache failed: budget exceeded"
+    # three lookups per set, only the first lookup of a new set misses (the reversed first set is the same set);
+    # sets[3] evicts the least recently used set, sets[1]
+    assert cache.hits == 14 and cache.misses == 4 and cache.evictions == 1, \
+        "ColumnCache failed: wrong hit/eviction counts"
+    assert cache.entries[np.sort(sets[0]).astype(np.int64).tobytes()][1] is not None, \
+        "ColumnCache failed: no Gram matrix for a repeated set"
+
+
+####################################################
+# verifies that
+# -the column cache gives a valid coreset with exact error() and repeated supports
+####################################################
+def test_iht_column_cache():
+    X = gendata(300, 30) * np.exp(0.8 * np.random.randn(300))[:, np.newaxis]
+    xs = X.sum(axis=0)
+    for mode in modes:
+        for streaming in [False, True]:
+            coreset = bc.IHTCoreset(tsf_of(X), 30, mode, streaming=streaming, column_cache_mb=1.)
+            coreset.build(1, 10)
+            w, idcs = coreset.weights()
+            assert coreset.size() <= 10 and np.all(w > 0.), mode + " column cache failed: invalid coreset"
+            err = np.sqrt(((xs - w.dot(X[idcs, :])) ** 2).sum())
+            assert np.fabs(coreset.error() - err) < 1e-6 * err, mode + " column cache failed: error() does not match"
+            assert coreset.column_cache.hits > 0, mode + " column cache failed: no repeated support"
+    try:
+        bc.IHTCoreset(tsf_of(X), 30, 'IHT', row_batch_ratio=0.5, column_cache_mb=1.)
+        assert False, "IHTCoreset failed: did not catch column_cache_mb with row batches"
+    except ValueError:
+        pass
+
+
+####################################################
+# verifies that
+# -update_tangent_space swaps in the new vectors, norms and residual, reusing a private store
+# -the current weights warm start the next build, and reset() drops that warm start
+####################################################
+def test_iht_update_tangent_space():
+    X = gendata(300, 30)
+    X2 = gendata(300, 30) * np.exp(0.3 * np.random.randn(300))[:, np.newaxis]
+    X_orig = X.copy()
+    for mode in modes:
+        for private in [False, True]:
+            # a float32 factory output is converted into a private store, a float64 one is used as is
+            coreset = bc.IHTCoreset((lambda: X.astype(np.float32)) if private else (lambda: X), 30, mode,
+                                    float32_copy=private)
+            coreset.build(1, 10)
+            w0, idcs0 = coreset.weights()
+            store = coreset.T.vecs
+            coreset.update_tangent_space(tsf_of(X2))
+            assert np.all(X == X_orig), mode + " update_tangent_space failed: overwrote the factory's array"
+            assert (coreset.T.vecs is store) == private, mode + " update_tangent_space failed: store not reused"
+            assert np.all(np.fabs(coreset.T.vecs - X2) < tol), mode + " update_tangent_space failed: wrong vectors"
+            if private:
+                assert np.all(np.fabs(coreset.T.vecs32 - X2) < 1e-5), mode + " update_tangent_space failed: float32"
+            assert np.all(np.fabs(coreset.T.norms() - np.sqrt((X2 ** 2).sum(axis=1))) < 1e-9), \
+                mode + " update_tangent_space failed: wrong norms"
+            xs2 = X2.sum(axis=0)
+            err = np.sqrt(((xs2 - w0.dot(X2[idcs0, :])) ** 2).sum())
+            assert np.fabs(coreset.error() - err) < 1e-6 * err, mode + " update_tangent_space failed: wrong residual"
+            assert np.all(coreset.init[idcs0] == w0) and (coreset.init > 0).sum() == idcs0.shape[0], \
+                mode + " update_tangent_space failed: weights not kept as the starting point"
+            coreset.build(1, 10)
+            w, idcs = coreset.weights()
+            assert coreset.size() <= 10 and np.all(w > 0.), mode + " update_tangent_space failed: invalid coreset"
+            err_new = np.sqrt(((xs2 - w.dot(X2[idcs, :])) ** 2).sum())
+            assert err_new <= err * (1. + 1e-6), mode + " update_tangent_space failed: worse than the warm start"
+            coreset.reset()
+            assert coreset.init is None, mode + " update_tangent_space failed: warm start kept after reset"
+            coreset.build(1, 10)
+            cold = bc.IHTCoreset(tsf_of(X2), 30, mode, float32_copy=private)
+            cold.build(1, 10)
+            assert np.fabs(coreset.error() - cold.error()) < 1e-6 * cold.error(), \
+                mode + " update_tangent_space failed: build after reset does not start from zero"
+    try:
+        coreset.update_tangent_space(tsf_of(X2[:200]))
+        assert False, "IHTCoreset failed: did not catch a tangent matrix for different data"
+    except ValueError:
+        pass
+
+
+####################################################
+# verifies that
+# -a memmap or shared factory output is used as the store and is not overwritten by an update
+####################################################
+def test_iht_update_tangent_space_memmap(tmp_path):
+    X = gendata(300, 20)
+    loglike = lambda th: np.log1p(np.exp(X.dot(th.T)))
+    sampler = lambda sz, w, ids: np.random.randn(sz, 20)
+    X2 = gendata(300, 30)
+    for kw in [dict(chunk_size=8, memmap=str(tmp_path / 'vecs.npy')), dict(executor='process', n_workers=2),
+               dict(chunk_size=8, memmap=str(tmp_path / 'shared.npy'), shared=True)]:
+        tsf = bc.BayesianTangentSpaceFactory(loglike, sampler, 30, seed=1, **kw)
+        coreset = bc.IHTCoreset(tsf, 30, 'IHT-2')
+        coreset.build(1, 10)
+        vecs = coreset.T.vecs
+        vecs_orig = np.array(vecs)
+        coreset.update_tangent_space(tsf_of(X2))
+        assert np.all(np.fabs(coreset.T.vecs - X2) < tol), "update_tangent_space failed: wrong vectors " + str(kw)
+        assert np.all(vecs == vecs_orig), "update_tangent_space failed: overwrote the factory memmap " + str(kw)
+        if 'memmap' in kw:
+            assert np.all(np.load(kw['memmap']) == vecs_orig), \
+                "update_tangent_space failed: overwrote the memmap file " + str(kw)
+        if 'shared' in kw:
+            assert np.all(tsf() == vecs_orig), "update_tangent_space failed: overwrote the shared matrix"
+    bc.clear_shared_tangent_spaces()
+
+
+####################################################
+# verifies that
+# -the int8 copy gives the same support and error with fewer column touches
+# -invalid quantize settings are rejected
+####################################################
+def test_iht_quantized():
+    X = gendata(1000, 20) * np.exp(0.5 * np.random.randn(1000))[:, np.newaxis]
+    for mode in modes:
+        for pre in [False, True]:
+            ref = bc.IHTCoreset(tsf_of(X), 20, mode, precondition=pre)
+            ref.build(1, 10)
+            coreset = bc.IHTCoreset(tsf_of(X), 20, mode, precondition=pre, quantize='int8')
+            coreset.build(1, 10)
+            assert set(coreset.weights()[1]) == set(ref.weights()[1]), mode + " quantized failed: support differs"
+            assert np.fabs(coreset.error() - ref.error()) < 1e-6 * ref.error(), \
+                mode + " quantized failed: error differs"
+            assert coreset.column_touches < ref.column_touches, mode + " quantized failed: no fewer column touches"
+    for bad in [dict(quantize='int4'), dict(quantize='int8', screening=True)]:
+        try:
+            bc.IHTCoreset(tsf_of(X), 20, 'IHT', **bad)
+            assert False, "IHTCoreset failed: did not catch " + str(bad)
+        except ValueError:
+            pass
+
+
+####################################################
+# verifies that
+# -the tangent space is only evaluated on first use, once per coreset
+# -reset() stays lazy and a failing factory is evaluated again on the next use
+####################################################
+def test_lazy_tangent_space():
+    X = gendata(100, 10)
+    calls = []
+
+    def tsf():
+        calls.append(1)
+        return X.copy()
+
+    coresets = [bc.HilbertCoreset(tsf), bc.IHTCoreset(tsf, 10, 'IHT')]
+    assert len(calls) == 0, "lazy construction failed: tangent space evaluated before the first build"
+    for c in coresets:
+        c.build(5 if isinstance(c, bc.HilbertCoreset) else 1, 5)
+        assert c.size() <= 5 and c.error() < np.sqrt((X.sum(axis=0) ** 2).sum()), \
+            "lazy construction failed: invalid coreset"
+    assert len(calls) == 2, "lazy construction failed: tangent space evaluated more than once per coreset"
+    c = bc.IHTCoreset(tsf, 10, 'IHT')
+    assert np.fabs(c.error() - np.sqrt((X.sum(axis=0) ** 2).sum())) < tol and len(calls) == 3, \
+        "lazy construction failed: error() before a build"
+    try:
+        c.missing_attribute
+        assert False, "lazy construction failed: unknown attribute did not raise"
+    except AttributeError:
+        pass
+
+    # reset() stays lazy; a factory that fails is kept and evaluated again on the next use
+    fails = []
+
+    def flaky_tsf():
+        calls.append(1)
+        if fails:
+            fails.pop()
+            raise RuntimeError('transient failure')
+        return X.copy()
+
+    for c in [bc.HilbertCoreset(flaky_tsf), bc.IHTCoreset(flaky_tsf, 10, 'IHT')]:
+        fails.append(1)
+        n = len(calls)
+        c.reset()
+        assert len(calls) == n, "lazy construction failed: reset() evaluated the tangent space"
+        try:
+            c.build(1, 5)
+            assert False, "lazy construction failed: factory error not raised"
+        except RuntimeError:
+            pass
+        c.build(1, 5)
+        assert 0 < c.size() <= 5 and len(calls) == n + 2, "lazy construction failed: no retry after a factory error"
@@ -0,0 +1,208 @@
+import warnings
+
+import numpy as np
+from scipy.special import ndtr
+
+import bayesiancoresets as bc
+
+warnings.filterwarnings('ignore',
+                        category=UserWarning)  # tests will generate warnings (due to pathological data design for testing), just ignore them
+np.set_printoptions(linewidth=500)
+np.random.seed(321)
+
+modes = ['IHT', 'IHT-2']
+
+
+def gendata(N, D):
+    return np.random.normal(0., 1., (N, D)) + 0.3
+
+
+def test_shared_tangent_space():
+    X = gendata(200, 3)
+    calls = []
+
+    def loglike(th):
+        calls.append(th.shape[0])
+        return X.dot(th.T)
+
+    sampler = lambda sz, w, ids: np.random.randn(sz, 3)
+    tsf = bc.BayesianTangentSpaceFactory(loglike, sampler, 20, shared=True)
+    coresets = [bc.HilbertCoreset(tsf), bc.IHTCoreset(tsf, 20, 'IHT'), bc.IHTCoreset(tsf, 20, 'IHT-2')]
+    for c in coresets:
+        c.build(5 if isinstance(c, bc.HilbertCoreset) else 1, 5)
+        assert c.size() <= 5, "shared tangent space failed: invalid coreset"
+    assert len(calls) == 1, "shared tangent space failed: log-likelihoods evaluated more than once"
+    assert coresets[1].T.vecs is coresets[2].T.vecs and not coresets[1].T.vecs.flags.writeable, \
+        "shared tangent space failed: not one read-only matrix"
+    tsf(np.ones(2), np.arange(2))
+    assert len(calls) == 2, "shared tangent space failed: weighted call was not drawn anew"
+    # seeded draws are reproducible and leave the global random state alone
+    state = np.random.get_state()[1].copy()
+    v1 = bc.BayesianTangentSpaceFactory(loglike, sampler, 20, shared=True, seed=5)()
+    v2 = bc.BayesianTangentSpaceFactory(loglike, sampler, 20, shared=True, seed=5)()
+    assert np.all(v1 == v2) and np.all(np.random.get_state()[1] == state), \
+        "shared tangent space failed: seeded draw not reproducible or global state changed"
+    bc.clear_shared_tangent_spaces()
+    tsf()
+    assert len(calls) == 5, "shared tangent space failed: cache not cleared"
+
+
+def test_chunked_tangent_space(tmp_path):
+    X = gendata(1000, 3)
+    loglike = lambda th, rows=slice(None): np.log1p(np.exp(X[rows].dot(th.T)))
+    sampler = lambda sz, w, ids: np.random.randn(sz, 3)
+    np.random.seed(7)
+    ref = bc.BayesianTangentSpaceFactory(loglike, sampler, 50)()
+    for kw in [dict(chunk_size=7), dict(chunk_size=7, n_rows=1000, row_chunk_size=300), dict(n_rows=1000),
+               dict(chunk_size=64, n_rows=1000, row_chunk_size=128, memmap=str(tmp_path / 'vecs.npy')),
+               dict(memmap=str(tmp_path / 'only.npy'))]:
+        np.random.seed(7)
+        vecs = bc.BayesianTangentSpaceFactory(loglike, sampler, 50, **kw)()
+        assert vecs.shape == ref.shape and np.all(np.fabs(vecs - ref) < 1e-12), \
+            "chunked tangent space failed: differs from the eager evaluation with " + str(kw)
+    for fn in ['vecs.npy', 'only.npy']:
+        assert np.all(np.fabs(np.load(str(tmp_path / fn)) - ref) < 1e-12), \
+            "chunked tangent space failed: memmap file " + fn + " does not hold the tangent matrix"
+
+
+def test_parallel_tangent_space(tmp_path):
+    X = gendata(1000, 3)
+    loglike = lambda th, rows=slice(None): np.log1p(np.exp(X[rows].dot(th.T)))
+    sampler = lambda sz, w, ids: np.random.randn(sz, 3)
+    np.random.seed(7)
+    ref = bc.BayesianTangentSpaceFactory(loglike, sampler, 50)()
+    for kw in [dict(executor='thread', n_workers=3), dict(executor='thread', n_workers=2, n_rows=1000),
+               dict(executor='process', n_workers=2), dict(executor='process', n_workers=3, chunk_size=8),
+               dict(executor='process', n_workers=2, n_rows=1000, memmap=str(tmp_path / 'vecs.npy'))]:
+        np.random.seed(7)
+        vecs = bc.BayesianTangentSpaceFactory(loglike, sampler, 50, **kw)()
+        assert vecs.shape == ref.shape and np.all(np.fabs(vecs - ref) < 1e-12), \
+            "parallel tangent space failed: differs from the eager evaluation with " + str(kw)
+    try:
+        bc.BayesianTangentSpaceFactory(loglike, sampler, 50, executor='mpi')
+        assert False, "parallel tangent space failed: unknown executor accepted"
+    except ValueError:
+        pass
+
+
+def test_tangent_stream():
+    X = gendata(1000, 20)
+    loglike = lambda th, rows=slice(None): np.log1p(np.exp(X[rows].dot(th.T)))
+    sampler = lambda sz, w, ids: np.random.randn(sz, 20)
+    tsf = bc.BayesianTangentSpaceFactory(loglike, sampler, 20, n_rows=1000, row_chunk_size=128)
+    np.random.seed(3)
+    vecs = tsf()
+    stream = tsf.stream(seed=3)
+    blocks = [blk for _, _, blk in stream.blocks()]
+    assert len(blocks) == 8 and np.all(np.fabs(np.vstack(blocks) - vecs) < 1e-12), \
+        "tangent stream failed: blocks differ from the tangent matrix"
+    assert np.all(np.fabs(np.vstack([blk for _, _, blk in stream.blocks()]) - vecs) < 1e-12), \
+        "tangent stream failed: second pass differs"
+    assert np.all(np.fabs(stream.rows([5, 900]) - vecs[[5, 900]]) < 1e-12), "tangent stream failed: rows differ"
+
+    for mode in modes:
+        for kw in [{}, dict(streaming=True, stream_block=300), dict(screening=True)]:
+            ref = bc.IHTCoreset(lambda: vecs, 20, mode, **kw)
+            ref.build(1, 10)
+            coreset = bc.IHTCoreset(stream, 20, mode, **kw)
+            coreset.build(1, 10)
+            assert set(coreset.weights()[1]) == set(ref.weights()[1]), mode + " stream failed: support differs"
+            assert np.fabs(coreset.error() - ref.error()) < 1e-8 * ref.error(), mode + " stream failed: error differs"
+
+    ref = bc.HilbertCoreset(lambda: vecs)
+    ref.build(1, 10)
+    coreset = bc.HilbertCoreset(stream, snnls=bc.snnls.StreamingGIGA)
+    coreset.build(1, 10)
+    assert np.all(np.fabs(coreset.weights()[0] - ref.weights()[0]) < 1e-8 * ref.weights()[0]), \
+        "GIGA stream failed: weights differ"
+    np.random.seed(1)
+    ref = bc.snnls.ImportanceSampling(vecs.T, vecs.sum(axis=0))
+    ref.build(10)
+    np.random.seed(1)
+    snnls = bc.snnls.StreamingImportanceSampling(stream)
+    snnls.build(10)
+    assert np.all(np.fabs(snnls.weights() - ref.weights()) < 1e-8 * np.fabs(ref.weights()).max()) \
+           and np.fabs(snnls.error() - ref.error()) < 1e-8 * ref.error(), "importance sampling stream failed"
+
+    for bad in [lambda: bc.IHTCoreset(stream, 20, quantize='int8'), lambda: bc.HilbertCoreset(stream),
+                lambda: bc.BayesianTangentSpaceFactory(loglike, sampler, 20).stream()]:
+        try:
+            bad()
+            assert False, "tangent stream failed: did not catch an unsupported combination"
+        except ValueError:
+            pass
+
+
+def test_gaussian_sampler():
+    mu = np.random.randn(4)
+    A = np.random.randn(4, 4)
+    cov = A.dot(A.T) + 0.1 * np.eye(4)
+    smp = bc.GaussianSampler(mu, cov)
+    th = smp(200000, None, None)
+    assert th.shape == (200000, 4), "Gaussian sampler failed: wrong shape"
+    assert np.all(np.fabs(th.mean(axis=0) - mu) < 0.05) and np.all(np.fabs(np.cov(th, rowvar=False) - cov) < 0.1), \
+        "Gaussian sampler failed: wrong moments"
+    th = bc.GaussianSampler(mu, cov, antithetic=True).draw(7)
+    assert th.shape == (7, 4) and np.all(np.fabs(th[:3] + th[4:7] - 2 * mu) < 1e-12), \
+        "Gaussian sampler failed: draws are not antithetic pairs"
+    u = np.random.randn(4)
+    th = bc.GaussianSampler(mu, np.outer(u, u)).draw(10)
+    sv = np.linalg.svd(th - mu)[1]
+    assert np.all(sv[1:] < 1e-6 * sv[0]), "Gaussian sampler failed: singular covariance"
+    try:
+        bc.GaussianSampler(mu, -cov)
+        assert False, "Gaussian sampler failed: indefinite covariance accepted"
+    except ValueError:
+        pass
+
+
+def test_gaussian_sampler_qmc():
+    mu = np.random.randn(3)
+    cov = np.diag([1., 2., 0.5])
+    for qmc in ['sobol', 'halton']:
+        for anti in [False, True]:
+            th = bc.GaussianSampler(mu, cov, antithetic=anti, qmc=qmc).draw(1024)
+            assert th.shape == (1024, 3), "QMC sampler failed: wrong shape"
+            assert np.all(np.fabs(th.mean(axis=0) - mu) < 0.02) and \
+                   np.all(np.fabs(np.cov(th, rowvar=False) - cov) < 0.05), "QMC sampler failed: wrong moments"
+    th1 = bc.GaussianSampler(mu, cov, qmc='sobol').draw(8)
+    th2 = bc.GaussianSampler(mu, cov, qmc='sobol').draw(8)
+    assert np.all(th1 != th2), "QMC sampler failed: calls do not scramble a new sequence"
+    # 2^m Sobol points put one point in each of the 2^m intervals of every coordinate; other sizes draw without warning
+    th = bc.GaussianSampler(np.zeros(3), np.eye(3), qmc='sobol').draw(16)
+    assert np.all(np.sort(np.floor(ndtr(th) * 16), axis=0) == np.arange(16)[:, np.newaxis]), \
+        "QMC sampler failed: Sobol points not balanced"
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        for qmc in ['sobol', 'halton']:
+            assert bc.GaussianSampler(mu, cov, antithetic=True, qmc=qmc).draw(25).shape == (25, 3), \
+                "QMC sampler failed: wrong shape"
+    try:
+        bc.GaussianSampler(mu, cov, qmc='lattice')
+        assert False, "QMC sampler failed: unknown sequence accepted"
+    except ValueError:
+        pass
+
+
+def test_adaptive_projection():
+    X = gendata(500, 5)
+    loglike = lambda th: np.log1p(np.exp(X.dot(th.T)))
+    drawn = []
+
+    def sampler(sz, w, ids):
+        drawn.append(np.random.randn(sz, 5))
+        return drawn[-1]
+
+    tsf = bc.BayesianTangentSpaceFactory(loglike, sampler, 40)
+    for vecs in tsf.progressive(15, 40, seed=2):
+        ref = loglike(np.vstack(drawn))
+        ref -= ref.mean(axis=1)[:, np.newaxis]
+        assert np.all(np.fabs(vecs - ref) < 1e-10), "progressive tangent space failed: differs from a full evaluation"
+    assert [d.shape[0] for d in drawn] == [15, 15, 10], "progressive tangent space failed: wrong batches"
+
+    for coreset in [bc.IHTCoreset(None, 5, 'IHT-2'), bc.HilbertCoreset(None)]:
+        trace = bc.build_adaptive(coreset, tsf, 10, batch_dim=10, max_dim=200, rtol=0.05, seed=2)
+        assert trace[-1][0] == 10 * len(trace) and trace[-1][0] <= 200, "adaptive projection failed: wrong dimensions"
+        assert 0 < coreset.size() <= 10 and trace[-1][2] == coreset.size(), "adaptive projection failed: wrong size"
+        assert trace[-1][0] == 200 or abs(trace[-1][1] - trace[-2][1]) <= 0.05 * trace[-2][1], \
+            "adaptive projection failed: stopped before the error stabilized"
@@ -0,0 +1,160 @@
+import warnings
+
+import numpy as np
+
+from bayesiancoresets.snnls import GIGA, FrankWolfe
+
+warnings.filterwarnings('ignore',
+                        category=UserWarning)  # tests will generate warnings (due to pathological data design for testing), just ignore them
+np.set_printoptions(linewidth=500)
+np.random.seed(324)
+
+
+def gendata(N, D):
+    return np.random.normal(0., 1., (N, D)) + 0.3
+
+
+####################################################
+# verifies that
+# -GIGA selections on the int8 copy of A are the exact ones
+####################################################
+def test_giga_quantized():
+    X = gendata(500, 20) * np.exp(0.5 * np.random.randn(500))[:, np.newaxis]
+    ref = GIGA(X.T, X.sum(axis=0))
+    snnls = GIGA(X.T, X.sum(axis=0), quantize='int8')
+    for m in [1, 5, 20]:
+        ref.build(m - ref.size())
+        snnls.build(m - snnls.size())
+        assert np.all(np.fabs(snnls.weights() - ref.weights()) <= 1e-9 * np.fabs(ref.weights())), \
+            "GIGA quantized failed: weights differ from the exact selection"
+
+
+####################################################
+# verifies that
+# -the A w maintained by _step matches an exact recomputation (refresh_period = 1)
+# -error() is computed from it, and assigning w invalidates it
+####################################################
+def test_snnls_maintained_residual():
+    X = gendata(300, 20)
+    for alg in [GIGA, FrankWolfe]:
+        ref = alg(X.T, X.sum(axis=0))
+        ref.refresh_period = 1
+        snnls = alg(X.T, X.sum(axis=0))
+        snnls.refresh_period = 1000
+        for m in [1, 5, 30]:
+            ref.build(m - ref.size())
+            snnls.build(m - snnls.size())
+            assert np.all(np.fabs(snnls.weights() - ref.weights()) <= 1e-9 * np.fabs(ref.weights()).max()), \
+                alg.__name__ + " maintained residual failed: weights differ from exact recomputation"
+            assert np.fabs(snnls.error() - np.linalg.norm(X.T.dot(snnls.w) - X.sum(axis=0))) < 1e-9 * snnls.error(), \
+                alg.__name__ + " maintained residual failed: error differs from the exact one"
+        snnls.w = snnls.weights() * 2
+        assert np.fabs(snnls.error() - np.linalg.norm(X.T.dot(snnls.w) - X.sum(axis=0))) < 1e-9 * snnls.error(), \
+            alg.__name__ + " maintained residual failed: assigning w did not invalidate A w"
+
+
+####################################################
+# verifies that
+# -a non-monotone step is rolled back: weights, support and A w are restored
+# -the undo log is closed after build
+####################################################
+def test_snnls_rollback():
+    X = gendata(300, 20)
+
+    class BadGIGA(GIGA):
+        # a regular step, then a weight assignment and a step that both increase the error
+        def _reweight(self, f):
+            super()._reweight(f)
+            w = self.w.copy()
+            w[self._nz] *= 0.5
+            self.w = w
+            self._step(1., (f + 1) % X.shape[0], 10. * self.w.max())
+
+    snnls = GIGA(X.T, X.sum(axis=0))
+    snnls.build(5)
+    snnls.__class__ = BadGIGA
+    w, Aw, err = snnls.weights(), snnls._current_Aw().copy(), snnls.error()
+    snnls.build(3)
+    assert snnls.reached_numeric_limit, "snnls rollback failed: a non-monotone step was accepted"
+    assert snnls._undo is None, "snnls rollback failed: the undo log was left open"
+    assert np.all(snnls.weights() == w), "snnls rollback failed: weights not restored"
+    assert np.all(snnls.w[snnls._nz] > 0) and np.count_nonzero(snnls.w) == snnls._nz.shape[0], \
+        "snnls rollback failed: support not restored"
+    assert np.fabs(snnls.error() - err) <= 1e-12 * err and np.all(np.fabs(snnls._current_Aw() - Aw) <= 1e-9), \
+        "snnls rollback failed: A w not restored"
+
+
+
+####################################################
+# verifies that
+# -an index dropped by _step and added again before the next refresh is counted once by size()
+####################################################
+def test_snnls_drop_readd():
+    X = gendata(300, 20)
+    snnls = GIGA(X.T, X.sum(axis=0))
+    snnls.refresh_period = 1000
+    snnls.build(5)
+    f = np.flatnonzero(snnls.w)[0]
+    snnls._step(1., f, -snnls.w[f])  # drop f
+    assert snnls.w[f] == 0. and snnls.size() == (snnls.w > 0).sum() == 4, "snnls drop failed: wrong size"
+    snnls._step(1., f, 1.)  # add it back within the same refresh window
+    assert snnls.size() == (snnls.w > 0).sum() == 5, "snnls re-add failed: index counted twice"
+    assert np.unique(snnls._nz).shape[0] == snnls._nz.shape[0], "snnls re-add failed: duplicate support index"
+    assert np.fabs(snnls.error() - np.linalg.norm(X.T.dot(snnls.w) - X.sum(axis=0))) < 1e-9 * snnls.error(), \
+        "snnls re-add failed: A w differs from the exact one"
+
+####################################################
+# verifies that
+# -vanilla, away-step and pairwise FW keep a monotone error and stay on the polytope
+# -away-step and pairwise FW converge faster when the optimum lies on a face
+# -size() stays exact when drop steps zero points that are added back before the next refresh
+####################################################
+def test_frankwolfe_variants():
+    np.random.seed(1)
+    X = np.random.randn(200, 20)
+    S = np.linalg.norm(X, axis=1).sum() / np.linalg.norm(X, axis=1)[:, np.newaxis] * X
+    # b = X.sum(axis=0) is interior to the polytope, b = S[:5].mean(axis=0) lies on a face of it
+    for interior, b, itrs in [(True, X.sum(axis=0), 100), (False, S[:5].mean(axis=0), 1000)]:
+        errs = {}
+        # a large refresh_period keeps dropped points in the support superset, so re-added points are tracked too
+        for variant, refresh_period in [(v, r) for v in ['vanilla', 'away', 'pairwise'] for r in [50, 10 ** 6]]:
+            snnls = FrankWolfe(X.T, b, variant=variant)
+            snnls.refresh_period = refresh_period
+            prev = np.inf
+            for i in range(itrs // 10):
+                snnls.build(10)
+                assert snnls.error() <= prev * (1. + 1e-12), variant + " FW failed: error increased"
+                assert snnls.size() == (snnls.w > 0).sum(), variant + " FW failed: size() differs from the support"
+                prev = snnls.error()
+            assert np.fabs(snnls.w.dot(snnls.Anorms) / snnls.Anorms.sum() - 1.) < 1e-9, \
+                variant + " FW failed: iterate left the polytope"
+            assert np.all(snnls.w >= 0), variant + " FW failed: negative weights"
+            if refresh_period == 50:
+                errs[variant] = snnls.error() / np.linalg.norm(b)
+        assert not interior or max(errs.values()) < 1e-3, "FW failed: did not converge to an interior point"
+    assert max(errs['away'], errs['pairwise']) < 0.1 * errs['vanilla'], \
+        "FW failed: away/pairwise steps did not speed up convergence to a face"
+
+    # pairwise steps toward a face that drop points and add them back within one refresh window
+    class CountingFW(FrankWolfe):
+        readded = 0
+
+        def _step(self, alpha, f, beta, Af=None):
+            CountingFW.readded += self.w[f] == 0. and alpha * self.w[f] + beta > 0. and np.any(self._nz == f)
+            super()._step(alpha, f, beta, Af)
+
+    X = np.random.RandomState(0).randn(100, 10)
+    S = np.linalg.norm(X, axis=1).sum() / np.linalg.norm(X, axis=1)[:, np.newaxis] * X
+    for refresh_period in [50, 10 ** 6]:
+        CountingFW.readded = 0
+        snnls = CountingFW(X.T, S[:3].mean(axis=0), variant='pairwise')
+        snnls.refresh_period = refresh_period
+        for i in range(100):
+            snnls.build(10)
+            assert snnls.size() == (snnls.w > 0).sum(), "pairwise FW failed: size() differs from the support"
+        assert CountingFW.readded > 0, "pairwise FW failed: no point was dropped and added back"
+    try:
+        FrankWolfe(X.T, X.sum(axis=0), variant='fully-corrective')
+        assert False, "FW failed: an unknown variant was accepted"
+    except ValueError:
+        pass
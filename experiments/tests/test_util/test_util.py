@@ -0,0 +1,41 @@
+import numpy as np
+
+from bayesiancoresets.util.quantize import quantize_rows, dot_quantized
+from bayesiancoresets.util.topk import top_k, top_k_exact
+
+np.set_printoptions(linewidth=500)
+np.random.seed(321)
+tol = 1e-9
+
+
+def gendata(N, D):
+    return np.random.normal(0., 1., (N, D)) + 0.3
+
+
+def test_top_k():
+    for N, K in [(1, 1), (100, 5), (5000, 40), (5000, 4990)]:
+        v = np.random.standard_t(3, size=N)
+        excl = np.random.randint(N, size=min(N - 1, 20))
+        for absolute in [False, True]:
+            vv = np.fabs(v) if absolute else v
+            idx = top_k(v, K, absolute=absolute, exclude=excl, sample_size=64, block_size=100)
+            ref = top_k_exact(v, K, absolute=absolute, exclude=excl)
+            assert not np.any(np.isin(idx, excl)), "top_k failed: selected an excluded index"
+            assert np.all(vv[idx] == vv[ref]), "top_k failed: not the exact top K"
+        # a pivot that is too high returns an exact prefix, or falls back to the exact selection
+        idx = top_k(v, K, recall=0.5, sample_size=16, z=-3.)
+        assert idx.shape[0] >= 0.5 * min(K, N) and np.all(v[idx] == v[top_k_exact(v, K)][:idx.shape[0]]), \
+            "top_k failed: partial selection is not a prefix of the exact top K"
+
+
+def test_quantize_rows():
+    X = gendata(500, 40) * np.exp(np.random.randn(500))[:, np.newaxis]
+    X[7] = 0.
+    q, scale, err = quantize_rows(X)
+    assert q.dtype == np.int8 and np.all(np.fabs(X - scale[:, np.newaxis] * q) <= 0.5 * scale[:, np.newaxis] + tol), \
+        "quantize_rows failed: wrong quantization"
+    for _ in range(5):
+        R = np.random.randn(40, 2)
+        approx = dot_quantized(q, scale, R)
+        assert np.all(np.fabs(approx - X.dot(R)) <= err[:, np.newaxis] * np.sqrt((R ** 2).sum(axis=0))), \
+            "dot_quantized failed: error bound violated"